@@ -1,7 +1,7 @@
 'use client';
 
 import { useState, useEffect } from 'react';
-import { alertsAPI } from '@/lib/api';
+import { alertsAPI, streamAPI } from '@/lib/api';
 import { AlertTriangle } from 'lucide-react';
 
 interface AlertHistoryItem {
@@ -35,9 +35,11 @@ export default function AlertsPage() {
   const [loadingMore, setLoadingMore] = useState(false);
   const [clearing, setClearing] = useState(false);
   const [hasMore, setHasMore] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [hours, setHours] = useState<number | undefined>(24);
   const pageSize = 25;
-  const refreshMs = 30000;
+  // Fallback only; new alerts arrive over the live stream.
+  const refreshMs = 300000;
 
   useEffect(() => {
     const loadHistory = async () => {
@@ -45,7 +47,8 @@ export default function AlertsPage() {
         const histResp = await alertsAPI.history({ hours, limit: pageSize, offset: 0 });
         const items = histResp.data.data || [];
         setHistory(items);
-        setHasMore(items.length === pageSize);
+        setHasMore(Boolean(histResp.data.meta?.next_cursor));
+        setNextCursor(histResp.data.meta?.next_cursor ?? null);
       } catch (error) {
         console.error('Failed to load alert history:', error);
       } finally {
@@ -55,7 +58,13 @@ export default function AlertsPage() {
 
     loadHistory();
     const intervalId = window.setInterval(loadHistory, refreshMs);
-    return () => window.clearInterval(intervalId);
+    const unsubscribe = streamAPI.subscribe((event) => {
+      if (event.type === 'alert' || event.type === 'overflow') loadHistory();
+    });
+    return () => {
+      window.clearInterval(intervalId);
+      unsubscribe();
+    };
   }, [hours]);
 
   const clearHistory = async () => {
@@ -67,6 +76,7 @@ export default function AlertsPage() {
       await alertsAPI.clearHistory();
       setHistory([]);
       setHasMore(false);
+      setNextCursor(null);
     } catch (error) {
       console.error('Failed to clear alert history:', error);
     } finally {
@@ -75,17 +85,18 @@ export default function AlertsPage() {
   };
 
   const loadMore = async () => {
-    if (loadingMore || !hasMore) return;
+    if (loadingMore || !hasMore || !nextCursor) return;
     setLoadingMore(true);
     try {
       const histResp = await alertsAPI.history({
         hours,
         limit: pageSize,
-        offset: history.length,
+        cursor: nextCursor,
       });
       const items = histResp.data.data || [];
       setHistory((prev) => [...prev, ...items]);
-      setHasMore(items.length === pageSize);
+      setHasMore(Boolean(histResp.data.meta?.next_cursor));
+      setNextCursor(histResp.data.meta?.next_cursor ?? null);
     } catch (error) {
       console.error('Failed to load older alerts:', error);
     } finally {
@@ -2,7 +2,7 @@
 
 import { Suspense, useState, useEffect, useRef } from 'react';
 import { useRouter, useSearchParams } from 'next/navigation';
-import { devicesAPI } from '@/lib/api';
+import { devicesAPI, streamAPI } from '@/lib/api';
 import {
   BarChart,
   Bar,
@@ -203,7 +203,15 @@ function DevicesPageContent() {
     const intervalId = window.setInterval(() => {
       loadStats(selectedDevice.id, rangeHours);
     }, refreshMs);
-    return () => window.clearInterval(intervalId);
+    const unsubscribe = streamAPI.subscribe((event) => {
+      if (event.type === 'overflow' || (event.type === 'usage' && event.data.device_id === selectedDevice.id)) {
+        loadStats(selectedDevice.id, rangeHours);
+      }
+    });
+    return () => {
+      window.clearInterval(intervalId);
+      unsubscribe();
+    };
   }, [selectedDevice?.id, rangeHours]);
 
   const handleDeviceSelect = (device: Device) => {
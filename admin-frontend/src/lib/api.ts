@@ -64,17 +64,80 @@ export const alertsAPI = {
   get: (id: number) => apiClient.get(`/alerts/${id}`),
   create: (data: any) => apiClient.post('/alerts', data),
   update: (id: number, data: any) => apiClient.put(`/alerts/${id}`, data),
-  history: (params?: { hours?: number; limit?: number; offset?: number }) => {
+  history: (params?: { hours?: number; limit?: number; offset?: number; cursor?: string }) => {
     const query = new URLSearchParams();
     if (params?.hours != null) query.set('hours', String(params.hours));
     if (params?.limit != null) query.set('limit', String(params.limit));
     if (params?.offset != null) query.set('offset', String(params.offset));
+    if (params?.cursor) query.set('cursor', params.cursor);
     const suffix = query.toString();
     return apiClient.get(`/alerts/history${suffix ? `?${suffix}` : ''}`);
   },
   clearHistory: () => apiClient.delete('/alerts/history'),
 };
 
+export type LiveEvent =
+  | {
+      type: 'usage';
+      data: { device_id: number; bytes_uploaded: number; bytes_downloaded: number; samples: number; timestamp: string };
+    }
+  | {
+      type: 'alert';
+      data: { alert_id: number; alert_type: string; device_id: number | null; value_at_trigger: number; triggered_at: string };
+    }
+  | { type: 'overflow'; data: { dropped: number } };
+
+export const streamAPI = {
+  // Server-Sent Events. EventSource cannot set headers, so a short-lived,
+  // stream-only token goes in the query string instead of the access token.
+  subscribe: (onEvent: (event: LiveEvent) => void): (() => void) => {
+    if (!Cookies.get('access_token') || typeof EventSource === 'undefined') return () => {};
+    let source: EventSource | null = null;
+    let retryId: number | undefined;
+    let closed = false;
+    let reconnecting = false;
+
+    const retry = () => {
+      if (!closed) retryId = window.setTimeout(connect, 5000);
+    };
+
+    const connect = async () => {
+      let token: string;
+      try {
+        token = (await apiClient.post('/stream/token')).data.data.token;
+      } catch {
+        retry();
+        return;
+      }
+      if (closed) return;
+      const current = new EventSource(`${API_BASE_URL}/stream?token=${encodeURIComponent(token)}`);
+      source = current;
+      (['usage', 'alert', 'overflow'] as const).forEach((type) => {
+        current.addEventListener(type, (message) => {
+          onEvent({ type, data: JSON.parse((message as MessageEvent).data) } as LiveEvent);
+        });
+      });
+      current.onopen = () => {
+        // Events written while disconnected are gone; have the page refetch.
+        if (reconnecting) onEvent({ type: 'overflow', data: { dropped: 0 } });
+      };
+      // The token is only good for opening a stream, so reconnect with a fresh one.
+      current.onerror = () => {
+        current.close();
+        reconnecting = true;
+        retry();
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      window.clearTimeout(retryId);
+      source?.close();
+    };
+  },
+};
+
 export const settingsAPI = {
   get: () => apiClient.get('/system/settings'),
   update: (default_device_cap: number | null) =>
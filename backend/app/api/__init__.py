@@ -6,6 +6,7 @@ from .routes.usage import usage_bp
 from .routes.alerts import alerts_bp
 from .routes.system import system_bp
 from .routes.agents import agents_bp
+from .routes.stream import stream_bp
 from .docs import docs_bp
 
 
@@ -18,6 +19,7 @@ def init_api(app, prefix: str) -> None:
 	api_bp.register_blueprint(alerts_bp, url_prefix="/alerts")
 	api_bp.register_blueprint(system_bp, url_prefix="/system")
 	api_bp.register_blueprint(agents_bp, url_prefix="/agents")
+	api_bp.register_blueprint(stream_bp, url_prefix="/stream")
 
 	app.register_blueprint(api_bp)
 
@@ -2,10 +2,11 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from functools import wraps
-from datetime import datetime
 from ...extensions import db
-from ...models import Agent, Device, DeviceStat
-from ...services import alert_service
+from ...models import Agent, Device
+from ...services import agent_payloads, agent_service, alert_service, batch_dedup, device_service, ingest_service
+from ...services.ingest_queue import QueueFull, get_ingest_queue
+from ...services.settings_store import get_setting
 
 agents_bp = Blueprint("agents", __name__)
 
@@ -18,25 +19,48 @@ def agent_required(f):
         if not api_key:
             return jsonify({"status": "error", "message": "Missing API key"}), 401
         
-        agent = Agent.query.filter_by(api_key=api_key, is_active=True).first()
+        agent = agent_service.authenticate_agent(api_key)
         if not agent:
             return jsonify({"status": "error", "message": "Invalid API key"}), 401
         
-        # Update last sync time
-        agent.last_sync = datetime.utcnow()
-        db.session.commit()
+        # Buffer last sync time; written in bulk every few seconds
+        agent_service.record_agent_sync(agent.id)
         
         # Pass agent to the route
-        return f(agent=agent, *args, **kwargs)
+        response = f(agent=agent, *args, **kwargs)
+        agent_service.flush_last_sync()
+        return response
     return decorated
 
 
+def _read_payload():
+    """Decode the (possibly compressed or MessagePack) request body."""
+    return agent_payloads.read_payload(
+        request.get_data(cache=False),
+        request.headers.get("Content-Encoding"),
+        request.mimetype,
+        current_app.config.get("AGENT_MAX_PAYLOAD_BYTES", 16 * 1024 * 1024),
+    )
+
+
+def _already_ingested(batch_id: int, status: str, next_batch_id: int):
+    """200 for a batch the server already has; 409 with the id to continue from for a stale one."""
+    if status == batch_dedup.STALE:
+        return jsonify({
+            "status": "error",
+            "message": "Batch id is behind this agent's window",
+            "data": {"batch_id": batch_id, "next_batch_id": next_batch_id},
+        }), 409
+    return jsonify({"status": "success", "data": {"batch_id": batch_id, "duplicate": True}}), 200
+
+
 @agents_bp.route("", methods=["GET"])
 @jwt_required()
 def list_agents():
     """List all agents for the authenticated user."""
     user_id = int(get_jwt_identity())
     
+    agent_service.flush_last_sync(force=True)
     agents = Agent.query.filter_by(owner_id=user_id).all()
     
     return jsonify({
@@ -104,47 +128,36 @@ def get_agent_key():
     }), 200
 
 
+@agents_bp.route("/<int:agent_id>/deactivate", methods=["POST"])
+@jwt_required()
+def deactivate_agent(agent_id: int):
+    """Deactivate an agent so its API key stops authenticating."""
+    user_id = int(get_jwt_identity())
+
+    agent = Agent.query.filter_by(owner_id=user_id, id=agent_id).first()
+    if not agent:
+        return jsonify({"status": "error", "message": "Agent not found"}), 404
+
+    agent.is_active = False
+    db.session.commit()
+
+    return jsonify({"status": "success", "data": agent.to_dict()}), 200
+
+
 @agents_bp.route("/devices", methods=["POST"])
 @agent_required
 def sync_devices(agent):
     """Sync device list from agent (bulk upsert)."""
-    data = request.get_json()
-    devices_data = data.get("devices", [])
-    
-    synced = []
-    for dev_data in devices_data:
-        mac = dev_data.get("mac_address")
-        if not mac:
-            continue
-        
-        device = Device.query.filter_by(mac_address=mac).first()
-        if not device:
-            default_cap = current_app.config.get("DEFAULT_DEVICE_CAP")
-            device = Device(
-                owner_id=agent.owner_id,
-                mac_address=mac,
-                ip_address=dev_data.get("ip_address"),
-                hostname=dev_data.get("hostname"),
-                manufacturer=dev_data.get("manufacturer"),
-                device_type=dev_data.get("device_type"),
-                first_seen=datetime.utcnow(),
-                last_seen=datetime.utcnow(),
-                is_active=True,
-                data_cap=default_cap
-            )
-            db.session.add(device)
-        else:
-            # Update existing
-            device.ip_address = dev_data.get("ip_address") or device.ip_address
-            device.hostname = dev_data.get("hostname") or device.hostname
-            device.manufacturer = dev_data.get("manufacturer") or device.manufacturer
-            device.device_type = dev_data.get("device_type") or device.device_type
-            device.last_seen = datetime.utcnow()
-            device.is_active = True
-        
-        synced.append(mac)
-    
-    db.session.commit()
+    try:
+        devices_data = agent_payloads.records(_read_payload(), "devices")
+    except agent_payloads.PayloadError as exc:
+        return jsonify({"status": "error", "message": str(exc)}), exc.status_code
+
+    synced = device_service.sync_agent_devices(
+        agent.owner_id,
+        devices_data,
+        default_cap=get_setting("default_device_cap"),
+    )
     
     return jsonify({
         "status": "success",
@@ -158,45 +171,47 @@ def sync_devices(agent):
 @agents_bp.route("/stats", methods=["POST"])
 @agent_required
 def ingest_stats(agent):
-    """Ingest device usage stats from agent (bulk insert)."""
-    data = request.get_json()
-    stats_data = data.get("stats", [])
-    
-    ingested = []
-    for stat in stats_data:
-        mac = stat.get("mac_address")
-        if not mac:
-            continue
-        
-        device = Device.query.filter_by(mac_address=mac).first()
-        if not device:
-            continue  # Skip unknown devices
-        
-        bytes_up = stat.get("bytes_uploaded", 0)
-        bytes_down = stat.get("bytes_downloaded", 0)
-        total_bytes = bytes_up + bytes_down
-        
-        device_stat = DeviceStat(
-            device_id=device.id,
-            timestamp=datetime.utcnow(),
-            bytes_uploaded=bytes_up,
-            bytes_downloaded=bytes_down
-        )
-        db.session.add(device_stat)
-        ingested.append(mac)
-        
-        # Evaluate alerts for this device
-        alert_service.evaluate_usage_alerts(agent.owner_id, device.id, total_bytes)
-    
-    db.session.commit()
-    
+    """Ingest device usage stats from agent.
+
+    Bodies may be gzip/zstd compressed, MessagePack and columnar; see
+    ``agent_payloads``. With the ingest queue enabled the payload is durably
+    queued and 202 is returned; background writers bulk-insert it. A full
+    queue answers 429 with Retry-After.
+
+    An optional ``batch_id`` makes retries safe: a batch the server already
+    has is answered 200 with ``duplicate`` and not counted again.
+    """
+    try:
+        data = _read_payload()
+        stats_data = agent_payloads.stat_records(agent_payloads.records(data, "stats"))
+        batch_id = agent_payloads.batch_id(data)
+    except agent_payloads.PayloadError as exc:
+        return jsonify({"status": "error", "message": str(exc)}), exc.status_code
+
+    if batch_id is not None:
+        status, next_batch_id = batch_dedup.check_batch(agent.id, batch_id)
+        if status != batch_dedup.NEW:
+            return _already_ingested(batch_id, status, next_batch_id)
+
+    if not current_app.config.get("INGEST_QUEUE_ENABLED"):
+        result = ingest_service.ingest_stats_batch(agent.owner_id, stats_data, agent_id=agent.id, batch_id=batch_id)
+        if result["batch_status"] not in (None, batch_dedup.NEW):
+            # Lost a race with a concurrent retry of the same batch.
+            return _already_ingested(batch_id, *batch_dedup.check_batch(agent.id, batch_id))
+        return jsonify({"status": "success", "data": result}), 201
+
+    queue = get_ingest_queue(current_app)
+    try:
+        entry_id = queue.enqueue(agent.owner_id, stats_data, agent_id=agent.id, batch_id=batch_id)
+    except QueueFull as exc:
+        response = jsonify({"status": "error", "message": "Ingest queue is full, retry later"})
+        response.headers["Retry-After"] = str(exc.retry_after)
+        return response, 429
+
     return jsonify({
         "status": "success",
-        "data": {
-            "ingested_count": len(ingested),
-            "ingested_macs": ingested
-        }
-    }), 201
+        "data": {"queued_id": entry_id, "accepted_count": len(stats_data)},
+    }), 202
 
 
 @agents_bp.route("/alerts", methods=["POST"])
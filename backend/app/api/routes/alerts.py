@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ...schemas.alert import AlertCreate, AlertUpdate
 from ...services import alert_service, device_service
+from ...services.response_cache import cached_response
 
 
 alerts_bp = Blueprint("alerts", __name__)
@@ -64,21 +65,36 @@ def update_alert(alert_id: int):
 
 @alerts_bp.route("/history", methods=["GET"])
 @jwt_required()
+@cached_response
 def recent_alert_history():
     """Return alert history entries for the authenticated user's alerts in the last 24 hours.
     Optional `hours` query param may be provided to change the window.
-    Pagination via `limit` and `offset` query params.
+    Pagination via `limit` and the `cursor` returned as `meta.next_cursor`;
+    `offset` is still accepted for older clients.
     """
     user_id = get_jwt_identity()
     hours = request.args.get("hours", type=int)
     limit = request.args.get("limit", 100, type=int)
     offset = request.args.get("offset", 0, type=int)
+    cursor = request.args.get("cursor")
+    if limit < 1:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    before = None
+    if cursor:
+        before = alert_service.decode_history_cursor(cursor)
+        if before is None:
+            return jsonify({"status": "error", "message": "Invalid cursor"}), 400
+
+    # One extra row tells whether another page exists.
     histories = alert_service.list_recent_history(
         user_id=user_id,
         hours=hours,
-        limit=limit,
+        limit=limit + 1,
         offset=offset,
+        before=before,
     )
+    has_more = len(histories) > limit
+    histories = histories[:limit]
     data = []
     for history in histories:
         alert = history.alert
@@ -92,7 +108,9 @@ def recent_alert_history():
             payload["device_hostname"] = device.hostname
         data.append(payload)
 
-    return jsonify({"status": "success", "data": data, "meta": {"limit": limit, "offset": offset}})
+    next_cursor = alert_service.encode_history_cursor(histories[-1]) if has_more else None
+    meta = {"limit": limit, "offset": offset, "has_more": has_more, "next_cursor": next_cursor}
+    return jsonify({"status": "success", "data": data, "meta": meta})
 
 
 @alerts_bp.route("/history", methods=["DELETE"])
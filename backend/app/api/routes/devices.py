@@ -1,10 +1,12 @@
 """Device routes."""
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from ...schemas.device import DeviceCreate, DeviceUpdate
-from ...services import device_service
-from ...models import DeviceStat
+from ...services import counter_service, device_service, retention_service, usage_service
+from ...services.response_cache import bump_generations, cached_response
+from ...services.settings_store import get_setting
+from ...models import DeviceUsageCounter, DeviceUsageRate
 from ...extensions import db
 
 
@@ -17,6 +19,7 @@ def _serialize(device):
 
 @devices_bp.route("", methods=["GET"], strict_slashes=False)
 @jwt_required()
+@cached_response
 def list_devices():
     user_id = get_jwt_identity()
     devices = device_service.list_devices(owner_id=user_id)
@@ -32,7 +35,7 @@ def create_device():
     try:
         device_kwargs = data.dict()
         if device_kwargs.get("data_cap") is None:
-            default_cap = current_app.config.get("DEFAULT_DEVICE_CAP")
+            default_cap = get_setting("default_device_cap")
             if default_cap is not None:
                 device_kwargs["data_cap"] = default_cap
         device = device_service.create_device(owner_id=user_id, **device_kwargs)
@@ -95,13 +98,27 @@ def set_device_cap(device_id: int):
             return jsonify({"status": "error", "message": "Invalid data_cap value"}), 400
 
     device.data_cap = data_cap
+    bump_generations([device.owner_id])
     db.session.commit()
 
     return jsonify({"status": "success", "data": _serialize(device)}), 200
 
 
+@devices_bp.route("/<int:device_id>/forecast", methods=["GET"])
+@jwt_required()
+def get_device_forecast(device_id: int):
+    """Projected data-cap exhaustion from the device's decayed usage rate."""
+    user_id = get_jwt_identity()
+    device = device_service.get_device(owner_id=user_id, device_id=device_id)
+    if not device:
+        return jsonify({"status": "error", "message": "Device not found"}), 404
+    forecast = counter_service.cap_forecasts([device_id])[device_id]
+    return jsonify({"status": "success", "data": forecast}), 200
+
+
 @devices_bp.route("/<int:device_id>/stats", methods=["GET"])
 @jwt_required()
+@cached_response
 def get_device_stats(device_id: int):
     """Get usage statistics for a device over a time period."""
     user_id = get_jwt_identity()
@@ -112,53 +129,37 @@ def get_device_stats(device_id: int):
     # Get hours parameter (default 24)
     hours = request.args.get('hours', 24, type=int)
     bucket_minutes = request.args.get('bucket_minutes', type=int)
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points < 2:
+        return jsonify({"status": "error", "message": "Invalid max_points value"}), 400
     since = datetime.utcnow() - timedelta(hours=hours)
     
-    # Query device stats
-    stats = DeviceStat.query.filter(
-        DeviceStat.device_id == device_id,
-        DeviceStat.timestamp >= since
-    ).order_by(DeviceStat.timestamp.asc()).all()
-
-    if bucket_minutes and bucket_minutes > 0:
-        bucket_seconds = bucket_minutes * 60
-        buckets = {}
-        for stat in stats:
-            ts = stat.timestamp
-            bucket_epoch = int(ts.timestamp() // bucket_seconds) * bucket_seconds
-            bucket_ts = datetime.utcfromtimestamp(bucket_epoch)
-            key = bucket_ts.isoformat()
-            if key not in buckets:
-                buckets[key] = {
-                    "timestamp": key,
-                    "bytes_uploaded": 0,
-                    "bytes_downloaded": 0,
-                }
-            buckets[key]["bytes_uploaded"] += stat.bytes_uploaded or 0
-            buckets[key]["bytes_downloaded"] += stat.bytes_downloaded or 0
-
-        data = [buckets[k] for k in sorted(buckets.keys())]
-        return jsonify({
-            "status": "success",
-            "data": data
-        }), 200
+    data = usage_service.device_stats_series(
+        device_id,
+        since,
+        bucket_minutes=bucket_minutes if bucket_minutes and bucket_minutes > 0 else None,
+        max_points=max_points,
+    )
     
     return jsonify({
         "status": "success",
-        "data": [stat.to_dict() for stat in stats]
+        "data": data
     }), 200
 
 
 @devices_bp.route("/<int:device_id>/stats", methods=["DELETE"])
 @jwt_required()
 def clear_device_stats(device_id: int):
-    """Delete all usage statistics for a device."""
+    """Delete all usage statistics for a device, in chunked transactions."""
     user_id = get_jwt_identity()
     device = device_service.get_device(owner_id=user_id, device_id=device_id)
     if not device:
         return jsonify({"status": "error", "message": "Device not found"}), 404
 
-    deleted = DeviceStat.query.filter(DeviceStat.device_id == device_id).delete(synchronize_session=False)
+    deleted = retention_service.delete_device_history(device_id)
+    DeviceUsageCounter.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+    DeviceUsageRate.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+    bump_generations([device.owner_id])
     db.session.commit()
 
     return jsonify({"status": "success", "data": {"deleted": deleted}}), 200
@@ -0,0 +1,86 @@
+"""Live event stream routes."""
+import json
+import time
+from typing import Optional
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from ...services.event_bus import TooManySubscribers, get_event_bus
+
+
+stream_bp = Blueprint("stream", __name__)
+
+
+def _sse(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="stream-token")
+
+
+def _stream_user() -> Optional[int]:
+    """The user a ``?token=`` stream token or an ``Authorization`` header JWT belongs to."""
+    token = request.args.get("token")
+    if token is not None:
+        try:
+            return int(_token_serializer().loads(token, max_age=current_app.config.get("STREAM_TOKEN_TTL_SECONDS", 60)))
+        except (BadSignature, TypeError, ValueError):
+            return None
+    verify_jwt_in_request(optional=True)
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+
+@stream_bp.route("/token", methods=["POST"])
+@jwt_required()
+def stream_token():
+    """Issue a short-lived token that opens ``GET /stream`` and nothing else.
+
+    Browsers' EventSource cannot set headers, so they pass this as
+    ``?token=`` rather than putting the access token in URLs and access logs.
+    """
+    ttl = current_app.config.get("STREAM_TOKEN_TTL_SECONDS", 60)
+    token = _token_serializer().dumps(int(get_jwt_identity()))
+    return jsonify({"status": "success", "data": {"token": token, "expires_in": ttl}})
+
+
+@stream_bp.route("", methods=["GET"], strict_slashes=False)
+def stream_events():
+    """Server-Sent Events of usage deltas and alert triggers for the user's devices.
+
+    Takes a stream token as ``?token=`` or an access token as a header.
+    Usage deltas arrive merged per device when the client reads slower than
+    data is ingested; an ``overflow`` event means alert events were dropped
+    and the client should refetch.
+    """
+    user_id = _stream_user()
+    if user_id is None:
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    app = current_app._get_current_object()
+    bus = get_event_bus(app)
+    try:
+        subscription = bus.subscribe(user_id)
+    except TooManySubscribers as exc:
+        return jsonify({"status": "error", "message": str(exc)}), 429
+    heartbeat = app.config.get("STREAM_HEARTBEAT_SECONDS", 15)
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            last_sent = time.monotonic()
+            while not subscription.closed:
+                bus.pump(app)
+                batch = subscription.next_batch(timeout=min(bus.poll_seconds, heartbeat))
+                if batch:
+                    last_sent = time.monotonic()
+                    yield "".join(_sse(event_type, data) for event_type, data in batch)
+                elif time.monotonic() - last_sent >= heartbeat:
+                    # Comment line; keeps proxies from timing out and detects dead clients.
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+        finally:
+            bus.unsubscribe(subscription)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(generate(), mimetype="text/event-stream", headers=headers)
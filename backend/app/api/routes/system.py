@@ -1,30 +1,111 @@
 """System and health endpoints."""
-from flask import Blueprint, jsonify, request, current_app
-from flask_jwt_extended import jwt_required
+import hmac
+from functools import wraps
+from flask import Blueprint, Response, jsonify, request, current_app
+from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
+from ...instrumentation import render_metrics
+from ...services import auth_service
+from ...services.ingest_queue import get_ingest_queue
+from ...services.settings_store import get_settings_store
+from ...tasks import JOBS, get_job_runner
 
 
 system_bp = Blueprint("system", __name__)
 
 
+def admin_required(f):
+    """Decorator limiting a route to users listed in ``ADMIN_EMAILS``."""
+    @wraps(f)
+    @jwt_required()
+    def decorated(*args, **kwargs):
+        if not auth_service.is_admin(get_jwt_identity()):
+            return jsonify({"status": "error", "message": "Admin access required"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+
 @system_bp.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
 
+@system_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Request, job, queue and cache metrics in the Prometheus text format.
+
+    Scrapers send ``METRICS_TOKEN`` as a bearer token; admins may use their
+    JWT. Only ``METRICS_PUBLIC`` opens it to anonymous clients.
+    """
+    if not current_app.config.get("METRICS_PUBLIC"):
+        token = current_app.config.get("METRICS_TOKEN")
+        if not (token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")):
+            verify_jwt_in_request(optional=True)
+            user_id = get_jwt_identity()
+            if user_id is None:
+                return jsonify({"status": "error", "message": "Unauthorized"}), 401
+            if not auth_service.is_admin(user_id):
+                return jsonify({"status": "error", "message": "Admin access required"}), 403
+    return Response(render_metrics(current_app), mimetype="text/plain; version=0.0.4")
+
+
+@system_bp.route("/ingest-queue", methods=["GET"])
+@admin_required
+def ingest_queue_stats():
+    """Depth, age and throughput counters of the durable ingest queue.
+
+    The queue is shared by every owner, so this is limited to admins.
+    """
+    if not current_app.config.get("INGEST_QUEUE_ENABLED"):
+        return jsonify({"status": "success", "data": {"enabled": False}})
+    stats = get_ingest_queue(current_app).stats()
+    return jsonify({"status": "success", "data": {"enabled": True, **stats}})
+
+
+@system_bp.route("/ingest-queue/dead-letters/requeue", methods=["POST"])
+@admin_required
+def requeue_dead_letters():
+    """Give dead-lettered payloads (all, or the given ``ids``) a fresh set of attempts."""
+    if not current_app.config.get("INGEST_QUEUE_ENABLED"):
+        return jsonify({"status": "error", "message": "Ingest queue is disabled"}), 409
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    if ids is not None and not (
+        isinstance(ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+    ):
+        return jsonify({"status": "error", "message": "ids must be a list of integers"}), 400
+    requeued = get_ingest_queue(current_app).requeue_dead_letters(ids)
+    return jsonify({"status": "success", "data": {"requeued": requeued}})
+
+
+@system_bp.route("/jobs", methods=["GET"])
+@admin_required
+def list_jobs():
+    """Schedule, counters, duration histograms and last-run state of background jobs."""
+    return jsonify({"status": "success", "data": get_job_runner(current_app).status()})
+
+
+@system_bp.route("/jobs/<name>/run", methods=["POST"])
+@admin_required
+def run_job(name: str):
+    """Dispatch a job now; it is skipped if a run is already in progress.
+
+    Jobs rewrite every owner's data, so this is limited to admins.
+    """
+    if name not in JOBS:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    get_job_runner(current_app).enqueue(name)
+    return jsonify({"status": "success", "data": {"job": name, "queued": True}}), 202
+
+
 @system_bp.route("/settings", methods=["GET"])
 @jwt_required()
 def get_settings():
-    return jsonify({
-        "status": "success",
-        "data": {
-            "default_device_cap": current_app.config.get("DEFAULT_DEVICE_CAP")
-        }
-    }), 200
+    return jsonify({"status": "success", "data": get_settings_store(current_app).all()}), 200
 
 
 @system_bp.route("/settings", methods=["PUT"])
 @jwt_required()
 def update_settings():
+    """Persist settings for every worker; other processes pick them up within ``SETTINGS_REFRESH_SECONDS``."""
     payload = request.get_json(silent=True) or {}
     default_cap = payload.get("default_device_cap", None)
 
@@ -36,10 +117,5 @@ def update_settings():
         except (TypeError, ValueError):
             return jsonify({"status": "error", "message": "Invalid default_device_cap"}), 400
 
-    current_app.config["DEFAULT_DEVICE_CAP"] = default_cap
-    return jsonify({
-        "status": "success",
-        "data": {
-            "default_device_cap": current_app.config.get("DEFAULT_DEVICE_CAP")
-        }
-    }), 200
+    data = get_settings_store(current_app).update({"default_device_cap": default_cap})
+    return jsonify({"status": "success", "data": data}), 200
@@ -1,12 +1,16 @@
 """Usage routes."""
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ...services import device_service, usage_service
-from ...schemas.usage import UsageQuery
+from pydantic import ValidationError
+from ...services import auth_service, device_service, export_service, retention_service, usage_service
+from ...services.counter_service import COUNTER_WINDOWS
+from ...schemas.usage import ExportQuery, SummaryQuery, TopQuery, UsageQuery
 
 
 usage_bp = Blueprint("usage", __name__)
 
+TOP_MAX_LIMIT = 100
+
 
 def _device_owned(user_id: int, device_id: int):
     return device_service.get_device(owner_id=user_id, device_id=device_id)
@@ -23,3 +27,109 @@ def usage_for_device(device_id: int):
     query = UsageQuery(**request.args)
     usage = usage_service.usage_for_device(device_id=device_id, start=query.start, end=query.end)
     return jsonify({"status": "success", "data": usage})
+
+
+@usage_bp.route("/summary", methods=["GET"])
+@jwt_required()
+def usage_summary():
+    """Usage and cap consumption for all of the user's devices in one response."""
+    user_id = get_jwt_identity()
+    try:
+        query = SummaryQuery(**request.args)
+    except ValidationError:
+        return jsonify({"status": "error", "message": "Invalid summary parameters"}), 400
+
+    if query.window not in COUNTER_WINDOWS:
+        return jsonify({"status": "error", "message": "Invalid window"}), 400
+    if query.sort not in usage_service.SUMMARY_SORT_KEYS or query.order not in ("asc", "desc"):
+        return jsonify({"status": "error", "message": "Invalid sort"}), 400
+    if query.limit is not None and query.limit < 1:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+
+    start = usage_service.parse_iso(query.start)
+    end = usage_service.parse_iso(query.end)
+    if (query.start and start is None) or (query.end and end is None):
+        return jsonify({"status": "error", "message": "Invalid start or end timestamp"}), 400
+
+    summary = usage_service.usage_summary(
+        user_id,
+        window=query.window,
+        start=start,
+        end=end,
+        sort_by=query.sort,
+        descending=query.order == "desc",
+        limit=query.limit,
+    )
+    return jsonify({"status": "success", "data": summary})
+
+
+@usage_bp.route("/top", methods=["GET"])
+@jwt_required()
+def top_devices():
+    """Devices with the most usage over the last hour, day or week.
+
+    ``scope=all`` ranks every owner's devices and is limited to admins.
+    """
+    user_id = int(get_jwt_identity())
+    try:
+        query = TopQuery(**request.args)
+    except ValidationError:
+        return jsonify({"status": "error", "message": "Invalid top parameters"}), 400
+
+    if query.window not in usage_service.TOP_WINDOWS:
+        return jsonify({"status": "error", "message": "Invalid window"}), 400
+    if query.metric not in usage_service.TOP_METRICS:
+        return jsonify({"status": "error", "message": "Invalid metric"}), 400
+    if not 1 <= query.limit <= TOP_MAX_LIMIT:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    if query.scope not in ("owner", "all"):
+        return jsonify({"status": "error", "message": "Invalid scope"}), 400
+    if query.scope == "all" and not auth_service.is_admin(user_id):
+        return jsonify({"status": "error", "message": "Admin access required"}), 403
+
+    owner_id = None if query.scope == "all" else user_id
+    ranking = usage_service.cached_top_devices(owner_id, query.window, query.metric, query.limit)
+    return jsonify({"status": "success", "data": {**ranking, "scope": query.scope}})
+
+
+@usage_bp.route("/export", methods=["GET"])
+@jwt_required()
+def export_usage():
+    """Stream raw usage history for one or all of the user's devices."""
+    user_id = get_jwt_identity()
+    try:
+        query = ExportQuery(**request.args)
+    except ValidationError:
+        return jsonify({"status": "error", "message": "Invalid export parameters"}), 400
+
+    fmt = query.format.lower()
+    if fmt not in export_service.EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": "Unsupported export format"}), 400
+    if fmt == "parquet" and not export_service.parquet_available():
+        return jsonify({"status": "error", "message": "Parquet export is not available"}), 501
+    if query.device_id is not None and not _device_owned(user_id, query.device_id):
+        return jsonify({"status": "error", "message": "Device not found"}), 404
+
+    start = usage_service.parse_iso(query.start)
+    end = usage_service.parse_iso(query.end)
+    if (query.start and start is None) or (query.end and end is None):
+        return jsonify({"status": "error", "message": "Invalid start or end timestamp"}), 400
+
+    rows = export_service.export_rows(user_id, device_id=query.device_id, start=start, end=end)
+    body = export_service.encode_export(fmt, rows)
+    headers = {"Content-Disposition": f'attachment; filename="usage-export.{fmt}"', "Vary": "Accept-Encoding"}
+    pruned_before = retention_service.raw_history_start()
+    if pruned_before is not None and (start is None or start < pruned_before):
+        # Raw history before the retention cutoff is gone; say so rather than look complete.
+        headers["X-Data-Truncated-Before"] = pruned_before.isoformat()
+    # Parquet pages are already compressed.
+    if fmt != "parquet" and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = export_service.gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=export_service.EXPORT_FORMATS[fmt],
+        headers=headers,
+        direct_passthrough=True,
+    )
@@ -1,24 +1,20 @@
 """Application factory for the backend service."""
 from flask import Flask, jsonify
 import os
+from typing import Optional
 from flask_jwt_extended import JWTManager
 from pydantic import ValidationError
-# Use hardcoded settings for local runs (no external config required)
+from .config.database import engine_options, engine_report, install_sqlite_pragmas
+from .config.settings import get_settings
 from .extensions import db, jwt, cors
+from .instrumentation import init_instrumentation
 from .api import init_api
+from .services.ingest_queue import start_ingest_writers
+from .tasks import init_jobs
 
 
-def create_app() -> Flask:
-	# Hardcoded configuration (development / demo mode)
-	class _S:
-		secret_key = "dev-secret-key"
-		jwt_secret_key = "dev-jwt-secret"
-		# store sqlite DB in backend folder for easy local runs
-		database_url = "sqlite:///./wifi_monitor.db"
-		cors_origins = "*"
-		api_prefix = "/api/v1"
-
-	settings = _S()
+def create_app(test_config: Optional[dict] = None) -> Flask:
+	settings = get_settings()
 
 	app = Flask(__name__)
 	app.config.update(
@@ -26,10 +22,69 @@ def create_app() -> Flask:
 		JWT_SECRET_KEY=settings.jwt_secret_key,
 		SQLALCHEMY_DATABASE_URI=settings.database_url,
 		SQLALCHEMY_TRACK_MODIFICATIONS=False,
-		DEFAULT_DEVICE_CAP=None,
+		# Default only; the live value is the persisted "default_device_cap" setting.
+		DEFAULT_DEVICE_CAP=int(os.environ["DEFAULT_DEVICE_CAP"]) if os.getenv("DEFAULT_DEVICE_CAP") else None,
+		SETTINGS_REFRESH_SECONDS=float(os.getenv("SETTINGS_REFRESH_SECONDS", "1")),
+		ADMIN_EMAILS=frozenset(
+			email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+		),
+		AGENT_AUTH_CACHE_TTL=int(os.getenv("AGENT_AUTH_CACHE_TTL", "60")),
+		AGENT_MAX_PAYLOAD_BYTES=int(os.getenv("AGENT_MAX_PAYLOAD_BYTES", str(16 * 1024 * 1024))),
+		AGENT_LAST_SYNC_FLUSH_SECONDS=int(os.getenv("AGENT_LAST_SYNC_FLUSH_SECONDS", "5")),
+		BILLING_PERIOD_START_DAY=int(os.getenv("BILLING_PERIOD_START_DAY", "1")),
+		CAP_FORECAST_HALF_LIFE_HOURS=float(os.getenv("CAP_FORECAST_HALF_LIFE_HOURS", "24")),
+		JOB_BROKER=os.getenv("JOB_BROKER", "local"),
+		JOB_SCHEDULER_ENABLED=os.getenv("JOB_SCHEDULER_ENABLED", "1").lower() in ("1", "true", "yes"),
+		JOB_WORKERS=int(os.getenv("JOB_WORKERS", "4")),
+		JOB_LOCK_TTL_SECONDS=float(os.getenv("JOB_LOCK_TTL_SECONDS", "900")),
+		ROLLUP_COMPACT_INTERVAL_SECONDS=float(os.getenv("ROLLUP_COMPACT_INTERVAL_SECONDS", "60")),
+		RETENTION_PRUNE_INTERVAL_SECONDS=float(os.getenv("RETENTION_PRUNE_INTERVAL_SECONDS", "3600")),
+		COUNTER_RECONCILE_INTERVAL_SECONDS=float(os.getenv("COUNTER_RECONCILE_INTERVAL_SECONDS", "86400")),
+		ALERT_DIGEST_INTERVAL_SECONDS=float(os.getenv("ALERT_DIGEST_INTERVAL_SECONDS", "86400")),
+		NOTIFICATION_DELIVERY_INTERVAL_SECONDS=float(os.getenv("NOTIFICATION_DELIVERY_INTERVAL_SECONDS", "300")),
+		NOTIFICATION_DELIVERY_MAX_AGE_SECONDS=float(os.getenv("NOTIFICATION_DELIVERY_MAX_AGE_SECONDS", "86400")),
+		RETENTION_RAW_DAYS=int(os.getenv("RETENTION_RAW_DAYS", "7")),
+		RETENTION_MINUTE_DAYS=int(os.getenv("RETENTION_MINUTE_DAYS", "90")),
+		RETENTION_HOUR_DAYS=int(os.getenv("RETENTION_HOUR_DAYS", "730")),
+		RETENTION_DAY_DAYS=int(os.getenv("RETENTION_DAY_DAYS", "0")),
+		RETENTION_CHUNK_ROWS=int(os.getenv("RETENTION_CHUNK_ROWS", "5000")),
+		RETENTION_CHUNK_PAUSE_SECONDS=float(os.getenv("RETENTION_CHUNK_PAUSE_SECONDS", "0.05")),
+		METRICS_ENABLED=os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes"),
+		# Exposes per-request SQL counts to clients: for debugging and benchmarks only.
+		METRICS_QUERY_HEADER=os.getenv("METRICS_QUERY_HEADER", "0").lower() in ("1", "true", "yes"),
+		METRICS_TOKEN=os.getenv("METRICS_TOKEN", ""),
+		METRICS_PUBLIC=os.getenv("METRICS_PUBLIC", "0").lower() in ("1", "true", "yes"),
+		TOP_DEVICES_CACHE_SECONDS=float(os.getenv("TOP_DEVICES_CACHE_SECONDS", "15")),
+		RESPONSE_CACHE_ENABLED=os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes"),
+		RESPONSE_CACHE_MAX_ENTRIES=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048")),
+		RESPONSE_CACHE_TTL_SECONDS=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60")),
+		STREAM_HEARTBEAT_SECONDS=float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15")),
+		STREAM_MAX_PENDING=int(os.getenv("STREAM_MAX_PENDING", "100")),
+		STREAM_MAX_SUBSCRIBERS_PER_OWNER=int(os.getenv("STREAM_MAX_SUBSCRIBERS_PER_OWNER", "20")),
+		STREAM_POLL_SECONDS=float(os.getenv("STREAM_POLL_SECONDS", "1")),
+		STREAM_TOKEN_TTL_SECONDS=int(os.getenv("STREAM_TOKEN_TTL_SECONDS", "60")),
 		VOICE_SERVICE_URL=os.getenv("VOICE_SERVICE_URL", ""),
 		VOICE_SERVICE_TOKEN=os.getenv("VOICE_SERVICE_TOKEN", ""),
 		VOICE_SERVICE_ALERT_TYPES=os.getenv("VOICE_SERVICE_ALERT_TYPES", "ddos_detected,dos_detected"),
+		VOICE_DISPATCH_QUEUE_SIZE=int(os.getenv("VOICE_DISPATCH_QUEUE_SIZE", "100")),
+		VOICE_DISPATCH_WORKERS=int(os.getenv("VOICE_DISPATCH_WORKERS", "2")),
+		VOICE_DISPATCH_RETRIES=int(os.getenv("VOICE_DISPATCH_RETRIES", "3")),
+		VOICE_DISPATCH_BACKOFF_SECONDS=float(os.getenv("VOICE_DISPATCH_BACKOFF_SECONDS", "0.5")),
+		INGEST_DEDUP_WINDOW=int(os.getenv("INGEST_DEDUP_WINDOW", "64")),
+		INGEST_QUEUE_ENABLED=os.getenv("INGEST_QUEUE_ENABLED", "1").lower() in ("1", "true", "yes"),
+		INGEST_QUEUE_PATH=os.getenv("INGEST_QUEUE_PATH", ""),
+		INGEST_QUEUE_MAX_DEPTH=int(os.getenv("INGEST_QUEUE_MAX_DEPTH", "10000")),
+		INGEST_QUEUE_MAX_ATTEMPTS=int(os.getenv("INGEST_QUEUE_MAX_ATTEMPTS", "5")),
+		INGEST_QUEUE_RETRY_AFTER_SECONDS=int(os.getenv("INGEST_QUEUE_RETRY_AFTER_SECONDS", "5")),
+		INGEST_QUEUE_BACKOFF_SECONDS=float(os.getenv("INGEST_QUEUE_BACKOFF_SECONDS", "2")),
+		INGEST_QUEUE_MAX_BACKOFF_SECONDS=float(os.getenv("INGEST_QUEUE_MAX_BACKOFF_SECONDS", "300")),
+		INGEST_WRITER_THREADS=int(os.getenv("INGEST_WRITER_THREADS", "1")),
+		INGEST_WRITER_BATCH_SIZE=int(os.getenv("INGEST_WRITER_BATCH_SIZE", "200")),
+	)
+	if test_config:
+		app.config.update(test_config)
+	app.config.setdefault(
+		"SQLALCHEMY_ENGINE_OPTIONS", engine_options(settings, app.config["SQLALCHEMY_DATABASE_URI"])
 	)
 
 	# Configure CORS FIRST to handle preflight requests properly
@@ -50,11 +105,29 @@ def create_app() -> Flask:
 	init_api(app, prefix=settings.api_prefix)
 
 	with app.app_context():
+		install_sqlite_pragmas(db.engine, settings)
+		init_instrumentation(app, db.engine)
 		db.create_all()
+		app.logger.info("Database engine: %s", engine_report(db.engine))
 
 	return app
 
 
+def start_background_services(app: Flask) -> None:
+	"""Start the job scheduler and ingest writers for a serving process.
+
+	Called by the server entrypoints (``wsgi.py``, ``run.py``) only, so
+	scripts, tests and Celery workers that build an app never start threads.
+	"""
+	init_jobs(app)
+	if app.config.get("INGEST_QUEUE_ENABLED") and not app.testing:
+		start_ingest_writers(
+			app,
+			workers=app.config["INGEST_WRITER_THREADS"],
+			batch_size=app.config["INGEST_WRITER_BATCH_SIZE"],
+		)
+
+
 def register_error_handlers(app: Flask) -> None:
 	@app.errorhandler(404)
 	def not_found(error):
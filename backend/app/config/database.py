@@ -0,0 +1,73 @@
+"""SQLAlchemy engine options and per-connection tuning derived from Settings."""
+from typing import Any, Dict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from .settings import Settings
+
+
+def is_sqlite(url: str) -> bool:
+	return make_url(url).get_backend_name() == "sqlite"
+
+
+def engine_options(settings: Settings, url: str) -> Dict[str, Any]:
+	"""Return SQLALCHEMY_ENGINE_OPTIONS for ``url``."""
+	if is_sqlite(url):
+		# The busy timeout is also set as a pragma; the driver-level timeout
+		# covers the window before the connect hook runs.
+		return {"connect_args": {"timeout": settings.sqlite_busy_timeout_ms / 1000}}
+	return {
+		"pool_size": settings.db_pool_size,
+		"max_overflow": settings.db_max_overflow,
+		"pool_timeout": settings.db_pool_timeout,
+		"pool_recycle": settings.db_pool_recycle,
+		"pool_pre_ping": settings.db_pool_pre_ping,
+	}
+
+
+def sqlite_pragmas(settings: Settings) -> Dict[str, Any]:
+	return {
+		"journal_mode": settings.sqlite_journal_mode,
+		"synchronous": settings.sqlite_synchronous,
+		"busy_timeout": settings.sqlite_busy_timeout_ms,
+		# Negative cache_size is in KiB rather than pages.
+		"cache_size": -settings.sqlite_cache_size_kib,
+		"mmap_size": settings.sqlite_mmap_size,
+	}
+
+
+def install_sqlite_pragmas(engine: Engine, settings: Settings) -> None:
+	"""Apply the configured pragmas to every new connection of a SQLite engine."""
+	if engine.dialect.name != "sqlite":
+		return
+	pragmas = sqlite_pragmas(settings)
+
+	@event.listens_for(engine, "connect")
+	def _apply(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		try:
+			for name, value in pragmas.items():
+				cursor.execute(f"PRAGMA {name}={value}")
+		finally:
+			cursor.close()
+
+
+def engine_report(engine: Engine) -> Dict[str, Any]:
+	"""Effective engine settings, read back from the database where possible."""
+	pool = engine.pool
+	report: Dict[str, Any] = {
+		"url": engine.url.render_as_string(hide_password=True),
+		"dialect": engine.dialect.name,
+		"driver": engine.dialect.driver,
+		"pool": type(pool).__name__,
+	}
+	for name in ("size", "_max_overflow", "_timeout", "_recycle", "_pre_ping"):
+		value = getattr(pool, name, None)
+		if value is not None:
+			report[f"pool_{name.lstrip('_')}"] = value() if callable(value) else value
+	if engine.dialect.name == "sqlite":
+		with engine.connect() as conn:
+			report["pragmas"] = {
+				name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+				for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")
+			}
+	return report
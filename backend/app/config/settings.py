@@ -1,24 +1,41 @@
 """Application configuration using environment variables with sensible defaults."""
 from functools import lru_cache
 import os
-from pydantic import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
+	model_config = SettingsConfigDict(
+		env_file=os.getenv(
+			"BACKEND_ENV_FILE",
+			os.path.join(os.path.dirname(__file__), "../../../config/.env"),
+		),
+		env_file_encoding="utf-8",
+		extra="ignore",
+	)
+
 	app_name: str = "wifi-monitor-backend"
-	secret_key: str = "change_me"
-	jwt_secret_key: str = "change_me_jwt"
-	database_url: str = "sqlite:///../wifi_monitor.db"
+	secret_key: str = "dev-secret-key"
+	jwt_secret_key: str = "dev-jwt-secret"
+	# Relative SQLite paths resolve against the Flask instance folder.
+	database_url: str = "sqlite:///./wifi_monitor.db"
 	api_prefix: str = "/api/v1"
 	debug: bool = False
 	cors_origins: str = "*"
 
-	class Config:
-		env_file = os.getenv(
-			"BACKEND_ENV_FILE",
-			os.path.join(os.path.dirname(__file__), "../../../config/.env"),
-		)
-		env_file_encoding = "utf-8"
+	# Connection pool (server databases such as PostgreSQL).
+	db_pool_size: int = 10
+	db_max_overflow: int = 20
+	db_pool_timeout: int = 30
+	db_pool_recycle: int = 1800
+	db_pool_pre_ping: bool = True
+
+	# Pragmas applied to every new SQLite connection.
+	sqlite_journal_mode: str = "WAL"
+	sqlite_synchronous: str = "NORMAL"
+	sqlite_busy_timeout_ms: int = 5000
+	sqlite_cache_size_kib: int = 65536
+	sqlite_mmap_size: int = 256 * 1024 * 1024
 
 
 @lru_cache()
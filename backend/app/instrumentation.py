@@ -0,0 +1,151 @@
+"""Per-request SQL and latency instrumentation, exported in the Prometheus text format.
+
+Engine hooks count statements and time spent in the database for the
+request running on the current thread; request hooks turn that into
+per-route histograms and the ``X-DB-Queries`` header. Everything is kept in
+process (a lock-guarded bucket increment per request), so it can stay on
+under full ingest load.
+"""
+import threading
+import time
+from typing import Dict, List
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .metrics import QUERY_COUNT_BUCKETS, HistogramFamily, histogram_samples, metric_block, sample
+
+
+_create_lock = threading.Lock()
+# Routes without a URL rule (404s) share one label to keep cardinality bounded.
+UNMATCHED = "unmatched"
+
+
+class RequestMetrics:
+	"""Latency, query-count and database-time histograms per route."""
+
+	def __init__(self):
+		labels = ("method", "endpoint", "status")
+		self.latency = HistogramFamily(
+			"http_request_duration_seconds", "Time to produce a response, by route.", labels
+		)
+		self.db_queries = HistogramFamily(
+			"http_request_db_queries", "SQL statements executed per request, by route.", labels, QUERY_COUNT_BUCKETS
+		)
+		self.db_time = HistogramFamily(
+			"http_request_db_duration_seconds", "Time spent executing SQL per request, by route.", labels
+		)
+
+	def observe(self, labels: tuple, seconds: float, queries: int, db_seconds: float) -> None:
+		self.latency.observe(labels, seconds)
+		self.db_queries.observe(labels, queries)
+		self.db_time.observe(labels, db_seconds)
+
+	def render(self) -> List[str]:
+		return self.latency.render() + self.db_queries.render() + self.db_time.render()
+
+
+def get_request_metrics(app: Flask) -> RequestMetrics:
+	"""Return the app's request metrics, creating them on first use."""
+	with _create_lock:
+		metrics = app.extensions.get("request_metrics")
+		if metrics is None:
+			metrics = RequestMetrics()
+			app.extensions["request_metrics"] = metrics
+		return metrics
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	if has_request_context() and "db_queries" in g:
+		g.db_queries += 1
+		context._instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	started = getattr(context, "_instrumentation_started", None)
+	if started is not None and has_request_context() and "db_seconds" in g:
+		g.db_seconds += time.perf_counter() - started
+
+
+def install_query_hooks(engine: Engine) -> None:
+	"""Attribute every statement run on ``engine`` to the current request, if any."""
+	if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+		event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+		event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def init_instrumentation(app: Flask, engine: Engine) -> None:
+	"""Record per-route latency, query count and DB time.
+
+	``X-DB-Queries`` is only added with ``METRICS_QUERY_HEADER`` or in debug
+	mode, since it tells any client how much SQL its request ran.
+	"""
+	if not app.config.get("METRICS_ENABLED"):
+		return
+	install_query_hooks(engine)
+	metrics = get_request_metrics(app)
+	query_header = app.config.get("METRICS_QUERY_HEADER")
+
+	@app.before_request
+	def _start_request_timer():
+		g.request_started = time.perf_counter()
+		g.db_queries = 0
+		g.db_seconds = 0.0
+
+	@app.after_request
+	def _record_request(response):
+		started = g.pop("request_started", None)
+		if started is None:
+			return response
+		rule = request.url_rule
+		labels = (request.method, rule.rule if rule is not None else UNMATCHED, str(response.status_code))
+		metrics.observe(labels, time.perf_counter() - started, g.db_queries, g.db_seconds)
+		if query_header or app.debug:
+			response.headers["X-DB-Queries"] = str(g.db_queries)
+		return response
+
+
+def render_metrics(app: Flask) -> str:
+	"""Every in-process metric of ``app`` in the Prometheus text exposition format."""
+	lines: List[str] = []
+	if "request_metrics" in app.extensions:
+		lines += app.extensions["request_metrics"].render()
+
+	runner = app.extensions.get("job_runner")
+	if runner is not None:
+		jobs = runner.metrics()
+		lines.append("# HELP job_duration_seconds Background job run time.")
+		lines.append("# TYPE job_duration_seconds histogram")
+		for name, job in jobs.items():
+			lines += histogram_samples("job_duration_seconds", {"job": name}, job["duration_seconds"])
+		for counter in ("runs", "failures", "skipped"):
+			lines += metric_block(
+				f"job_{counter}_total", "counter", f"Background job {counter} since start.",
+				[sample(f"job_{counter}_total", {"job": name}, job[counter]) for name, job in jobs.items()],
+			)
+
+	queue = app.extensions.get("ingest_queue")
+	if queue is not None:
+		gauges = ("depth", "max_depth", "oldest_age_seconds", "dead_letters")
+		lines += _stats_block("ingest_queue", queue.stats(), gauges=gauges)
+
+	cache = app.extensions.get("response_cache")
+	if cache is not None:
+		lines += _stats_block("response_cache", cache.stats(), gauges=("entries", "max_entries"))
+
+	bus = app.extensions.get("event_bus")
+	if bus is not None:
+		lines += _stats_block("event_bus", bus.stats(), gauges=("owners", "subscriptions", "coalesced"))
+	return "\n".join(lines) + "\n"
+
+
+def _stats_block(prefix: str, stats: Dict[str, float], gauges: tuple) -> List[str]:
+	"""Render a service's ``stats()`` dict: listed keys as gauges, the rest as counters."""
+	lines: List[str] = []
+	for key, value in sorted(stats.items()):
+		if key in gauges:
+			name, metric_type = f"{prefix}_{key}", "gauge"
+		else:
+			name, metric_type = f"{prefix}_{key}_total", "counter"
+		help_text = f"{prefix.replace('_', ' ').capitalize()} {key.replace('_', ' ')}."
+		lines += metric_block(name, metric_type, help_text, [sample(name, {}, value)])
+	return lines
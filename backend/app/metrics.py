@@ -0,0 +1,90 @@
+"""In-process metric primitives and Prometheus text rendering."""
+import bisect
+import threading
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+
+# Seconds; wide enough for request handlers and for jobs that run minutes.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Statements per request; anything past the top bucket is a runaway N+1.
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250)
+
+
+class Histogram:
+	"""Cumulative-bucket histogram in the Prometheus style."""
+
+	def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+		self.buckets = tuple(sorted(buckets))
+		self._counts = [0] * (len(self.buckets) + 1)
+		self._count = 0
+		self._sum = 0.0
+		self._lock = threading.Lock()
+
+	def observe(self, value: float) -> None:
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			self._counts[index] += 1
+			self._count += 1
+			self._sum += value
+
+	def snapshot(self) -> Dict[str, object]:
+		with self._lock:
+			counts = list(self._counts)
+			total, value_sum = self._count, self._sum
+		cumulative, running = {}, 0
+		for bound, count in zip(self.buckets, counts):
+			running += count
+			cumulative[repr(float(bound))] = running
+		cumulative["+Inf"] = total
+		return {"buckets": cumulative, "count": total, "sum": round(value_sum, 6)}
+
+
+class HistogramFamily:
+	"""Histograms of one metric, one per combination of label values."""
+
+	def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+		self.name = name
+		self.help_text = help_text
+		self.label_names = tuple(label_names)
+		self.buckets = tuple(buckets)
+		self._children: Dict[Tuple[str, ...], Histogram] = {}
+		self._lock = threading.Lock()
+
+	def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+		child = self._children.get(label_values)
+		if child is None:
+			with self._lock:
+				child = self._children.setdefault(label_values, Histogram(self.buckets))
+		child.observe(value)
+
+	def render(self) -> List[str]:
+		with self._lock:
+			children = sorted(self._children.items())
+		lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+		for label_values, child in children:
+			lines.extend(histogram_samples(self.name, dict(zip(self.label_names, label_values)), child.snapshot()))
+		return lines
+
+
+def _escape(value: object) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def sample(name: str, labels: Mapping[str, object], value: float) -> str:
+	"""One line of the Prometheus text exposition format."""
+	if labels:
+		rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+		return f"{name}{{{rendered}}} {value}"
+	return f"{name} {value}"
+
+
+def histogram_samples(name: str, labels: Mapping[str, object], snapshot: Mapping[str, object]) -> List[str]:
+	"""``_bucket``/``_sum``/``_count`` lines for a ``Histogram.snapshot()``."""
+	lines = [sample(f"{name}_bucket", {**labels, "le": le}, count) for le, count in snapshot["buckets"].items()]
+	lines.append(sample(f"{name}_sum", labels, snapshot["sum"]))
+	lines.append(sample(f"{name}_count", labels, snapshot["count"]))
+	return lines
+
+
+def metric_block(name: str, metric_type: str, help_text: str, samples: Iterable[str]) -> List[str]:
+	return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", *samples]
@@ -1,8 +1,8 @@
 """Database models for the backend service."""
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from sqlalchemy import func, select
 import secrets
 from ..extensions import db
 
@@ -76,6 +76,12 @@ class Device(TimestampMixin, db.Model):
 	data_cap = db.Column(db.BigInteger, nullable=True)
 
 	stats = db.relationship("DeviceStat", backref="device", lazy=True, cascade="all, delete-orphan")
+	usage_counter = db.relationship(
+		"DeviceUsageCounter", uselist=False, lazy=True, cascade="all, delete-orphan"
+	)
+	usage_rate = db.relationship(
+		"DeviceUsageRate", uselist=False, lazy=True, cascade="all, delete-orphan"
+	)
 
 	def to_dict(self) -> dict:
 		return {
@@ -96,6 +102,10 @@ class Device(TimestampMixin, db.Model):
 
 class DeviceStat(db.Model):
 	__tablename__ = "device_stats"
+	__table_args__ = (
+		db.Index("ix_device_stats_device_ts", "device_id", "timestamp"),
+		{"postgresql_partition_by": "RANGE (timestamp)", "sqlite_autoincrement": True},
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), nullable=False)
@@ -115,6 +125,58 @@ class DeviceStat(db.Model):
 		}
 
 
+class DeviceUsageCounter(db.Model):
+	"""Running usage totals per device, maintained by the ingest transaction."""
+
+	__tablename__ = "device_usage_counters"
+
+	device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+	bytes_uploaded = db.Column(db.BigInteger, nullable=False, default=0)
+	bytes_downloaded = db.Column(db.BigInteger, nullable=False, default=0)
+	day_start = db.Column(db.Date, nullable=False)
+	day_uploaded = db.Column(db.BigInteger, nullable=False, default=0)
+	day_downloaded = db.Column(db.BigInteger, nullable=False, default=0)
+	period_start = db.Column(db.Date, nullable=False)
+	period_uploaded = db.Column(db.BigInteger, nullable=False, default=0)
+	period_downloaded = db.Column(db.BigInteger, nullable=False, default=0)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+	def to_dict(self) -> dict:
+		return {
+			"device_id": self.device_id,
+			"bytes_uploaded": self.bytes_uploaded,
+			"bytes_downloaded": self.bytes_downloaded,
+			"total_bytes": self.bytes_uploaded + self.bytes_downloaded,
+			"today": {
+				"start": self.day_start.isoformat(),
+				"bytes_uploaded": self.day_uploaded,
+				"bytes_downloaded": self.day_downloaded,
+				"total_bytes": self.day_uploaded + self.day_downloaded,
+			},
+			"billing_period": {
+				"start": self.period_start.isoformat(),
+				"bytes_uploaded": self.period_uploaded,
+				"bytes_downloaded": self.period_downloaded,
+				"total_bytes": self.period_uploaded + self.period_downloaded,
+			},
+		}
+
+
+class DeviceUsageRate(db.Model):
+	"""Exponentially decayed usage per device, folded in by the ingest transaction.
+
+	``decayed_bytes`` sums every sample weighted by ``exp(-age / tau)`` as of
+	``sample_at``, the newest sample folded in; ``since`` is the first one.
+	"""
+
+	__tablename__ = "device_usage_rates"
+
+	device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+	decayed_bytes = db.Column(db.Float, nullable=False, default=0.0)
+	sample_at = db.Column(db.DateTime, nullable=False)
+	since = db.Column(db.DateTime, nullable=False)
+
+
 class Alert(TimestampMixin, db.Model):
 	__tablename__ = "alerts"
 
@@ -142,6 +204,7 @@ class Alert(TimestampMixin, db.Model):
 
 class AlertHistory(db.Model):
 	__tablename__ = "alert_history"
+	__table_args__ = (db.Index("ix_alert_history_alert_triggered", "alert_id", "triggered_at"),)
 
 	id = db.Column(db.Integer, primary_key=True)
 	alert_id = db.Column(db.Integer, db.ForeignKey("alerts.id"), nullable=False)
@@ -183,34 +246,228 @@ class Notification(TimestampMixin, db.Model):
 		}
 
 
-def aggregate_device_usage(device_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+class NotificationDelivery(db.Model):
+	"""Marks a notification as handed to the voice service, so it is sent once."""
+
+	__tablename__ = "notification_deliveries"
+
+	notification_id = db.Column(db.Integer, db.ForeignKey("notifications.id"), primary_key=True)
+	delivered_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+from .rollups import (
+	EPOCH,
+	ROLLUP_MODELS,
+	DeviceStatDay,
+	DeviceStatHour,
+	DeviceStatMinute,
+	RollupWatermark,
+	ceil_to,
+	epoch_bucket,
+	floor_to,
+	rollup_watermarks,
+)
+
+
+from .partitions import (
+	delete_device_stats,
+	drop_partitions_before,
+	partitions_before,
+	register_partition_ddl,
+	rotate_partitions,
+	stats_source,
+)
+
+
+register_partition_ddl(DeviceStat.__table__)
+
+_OPEN_END = datetime(9999, 1, 1)
+
+
+def plan_usage_segments(
+	start: Optional[datetime],
+	end: Optional[datetime],
+	bucket_seconds: Optional[int] = None,
+	watermarks: Optional[dict] = None,
+) -> List[tuple]:
+	"""Split ``[start, end)`` into (model, start, end) segments read from the coarsest rollups.
+
+	A rollup level is only used for whole buckets it has already compacted and,
+	when ``bucket_seconds`` is given, only if its resolution divides the bucket.
+	Whatever is left at the edges is read from finer levels, ending at raw
+	``DeviceStat`` rows (model ``None``).
+	"""
+	watermarks = rollup_watermarks() if watermarks is None else watermarks
+	levels = [
+		model for model in reversed(ROLLUP_MODELS)
+		if model.resolution_seconds in watermarks
+		and (bucket_seconds is None or bucket_seconds % model.resolution_seconds == 0)
+	]
+	return _plan(start or EPOCH, end or _OPEN_END, levels, watermarks)
+
+
+def _plan(start: datetime, end: datetime, levels: list, watermarks: dict) -> List[tuple]:
+	if start >= end:
+		return []
+	if not levels:
+		return [(None, start, end)]
+	model, finer = levels[0], levels[1:]
+	seconds = model.resolution_seconds
+	first = ceil_to(start, seconds)
+	last = floor_to(min(end, watermarks[seconds]), seconds)
+	if first >= last:
+		return _plan(start, end, finer, watermarks)
+	return _plan(start, first, finer, watermarks) + [(model, first, last)] + _plan(last, end, finer, watermarks)
+
+
+def _segment_query(model, seg_start: datetime, seg_end: datetime, *columns):
+	lower = seg_start if seg_start > EPOCH else None
+	upper = seg_end if seg_end < _OPEN_END else None
+	if model is None:
+		source = stats_source(lower, upper)
+		ts = source.c.timestamp
+	else:
+		source = model.__table__
+		ts = source.c.bucket_start
 	query = db.session.query(
-		func.sum(DeviceStat.bytes_uploaded).label("uploaded"),
-		func.sum(DeviceStat.bytes_downloaded).label("downloaded"),
-	).filter(DeviceStat.device_id == device_id)
-
-	if start:
-		query = query.filter(DeviceStat.timestamp >= start)
-	if end:
-		query = query.filter(DeviceStat.timestamp <= end)
-
-	result = query.one()
-	uploaded = result.uploaded or 0
-	downloaded = result.downloaded or 0
-	return {
-		"device_id": device_id,
-		"bytes_uploaded": uploaded,
-		"bytes_downloaded": downloaded,
-		"total_bytes": uploaded + downloaded,
-	}
+		*[column(source, ts) for column in columns],
+		func.sum(source.c.bytes_uploaded).label("uploaded"),
+		func.sum(source.c.bytes_downloaded).label("downloaded"),
+	)
+	if lower is not None:
+		query = query.filter(ts >= lower)
+	if upper is not None:
+		query = query.filter(ts < upper)
+	return query, source
+
+
+def aggregate_device_usage(device_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+	usage = aggregate_usage_by_device([device_id], start=start, end=end).get(device_id)
+	if usage is None:
+		return {"device_id": device_id, "bytes_uploaded": 0, "bytes_downloaded": 0, "total_bytes": 0}
+	return usage
+
+
+def aggregate_usage_by_device(
+	device_ids: List[int],
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+) -> Dict[int, dict]:
+	"""Sum usage for many devices with one GROUP BY query per planned segment.
+
+	``end`` is inclusive, matching the original raw-stats query.
+	"""
+	if not device_ids:
+		return {}
+
+	end_exclusive = end + timedelta(microseconds=1) if end else None
+	totals: Dict[int, dict] = {}
+	for model, seg_start, seg_end in plan_usage_segments(start, end_exclusive):
+		query, source = _segment_query(model, seg_start, seg_end, lambda source, ts: source.c.device_id)
+		rows = query.filter(source.c.device_id.in_(device_ids)).group_by(source.c.device_id).all()
+		for device_id, uploaded, downloaded in rows:
+			entry = totals.setdefault(device_id, {
+				"device_id": device_id,
+				"bytes_uploaded": 0,
+				"bytes_downloaded": 0,
+				"total_bytes": 0,
+			})
+			entry["bytes_uploaded"] += uploaded or 0
+			entry["bytes_downloaded"] += downloaded or 0
+			entry["total_bytes"] = entry["bytes_uploaded"] + entry["bytes_downloaded"]
+	return totals
+
+
+def usage_totals_by_device(start: datetime, end: datetime, owner_id: Optional[int] = None) -> Dict[int, List[int]]:
+	"""``[uploaded, downloaded]`` per device over ``[start, end)``, optionally for one owner.
+
+	One ``GROUP BY device_id`` per planned segment, so cost follows the number
+	of rollup buckets in range rather than raw rows. Filtering on the device
+	ids, even for all owners, lets each segment seek the ``(device_id, time)``
+	keys device by device instead of sorting a time-range scan.
+	"""
+	totals: Dict[int, List[int]] = {}
+	devices = select(Device.id)
+	if owner_id is not None:
+		devices = devices.where(Device.owner_id == owner_id)
+	for model, seg_start, seg_end in plan_usage_segments(start, end):
+		query, source = _segment_query(model, seg_start, seg_end, lambda source, ts: source.c.device_id)
+		query = query.filter(source.c.device_id.in_(devices))
+		for device_id, uploaded, downloaded in query.group_by(source.c.device_id):
+			entry = totals.setdefault(device_id, [0, 0])
+			entry[0] += uploaded or 0
+			entry[1] += downloaded or 0
+	return totals
+
+
+def device_usage_series(device_id: int, start: datetime, end: Optional[datetime], bucket_seconds: int) -> List[dict]:
+	"""Usage per epoch-aligned bucket, grouped in SQL from the coarsest usable rollups."""
+	buckets: Dict[int, List[int]] = {}
+	for model, seg_start, seg_end in plan_usage_segments(start, end, bucket_seconds=bucket_seconds):
+		query, source = _segment_query(
+			model, seg_start, seg_end, lambda source, ts: epoch_bucket(ts, bucket_seconds).label("bucket")
+		)
+		rows = query.filter(source.c.device_id == device_id).group_by("bucket").all()
+		for bucket, uploaded, downloaded in rows:
+			totals = buckets.setdefault(int(bucket), [0, 0])
+			totals[0] += uploaded or 0
+			totals[1] += downloaded or 0
+
+	return [
+		{
+			"timestamp": (EPOCH + timedelta(seconds=bucket)).isoformat(),
+			"bytes_uploaded": uploaded,
+			"bytes_downloaded": downloaded,
+		}
+		for bucket, (uploaded, downloaded) in sorted(buckets.items())
+	]
+
+
+from .upsert import bulk_upsert
+from .chunked import delete_in_chunks
+from .jobs import JobState
+from .generations import OwnerGeneration
+from .batches import AgentBatchWindow
+from .settings import RuntimeSetting, RuntimeSettingsVersion
+from .stream import StreamEvent, StreamListener
+from .retention import RetentionCutoff
 
 
 __all__ = [
 	"User",
 	"Device",
 	"DeviceStat",
+	"DeviceUsageCounter",
+	"DeviceUsageRate",
+	"EPOCH",
+	"DeviceStatMinute",
+	"DeviceStatHour",
+	"DeviceStatDay",
+	"RollupWatermark",
+	"ROLLUP_MODELS",
 	"Alert",
 	"AlertHistory",
 	"Notification",
+	"NotificationDelivery",
+	"JobState",
+	"OwnerGeneration",
+	"AgentBatchWindow",
+	"RuntimeSetting",
+	"RuntimeSettingsVersion",
+	"StreamEvent",
+	"StreamListener",
+	"RetentionCutoff",
 	"aggregate_device_usage",
+	"aggregate_usage_by_device",
+	"device_usage_series",
+	"usage_totals_by_device",
+	"epoch_bucket",
+	"plan_usage_segments",
+	"bulk_upsert",
+	"delete_in_chunks",
+	"delete_device_stats",
+	"drop_partitions_before",
+	"partitions_before",
+	"rotate_partitions",
+	"stats_source",
 ]
@@ -0,0 +1,15 @@
+"""Per-agent record of stats batches already ingested."""
+from datetime import datetime
+from ..extensions import db
+
+
+class AgentBatchWindow(db.Model):
+	"""Dedup index of one agent's batch ids: a watermark plus the recent ids above it."""
+
+	__tablename__ = "agent_batch_windows"
+
+	agent_id = db.Column(db.Integer, db.ForeignKey("agents.id"), primary_key=True)
+	watermark = db.Column(db.BigInteger, nullable=False, default=0)
+	# Comma-separated, ascending.
+	recent = db.Column(db.Text, nullable=False, default="")
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
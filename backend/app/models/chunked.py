@@ -0,0 +1,26 @@
+"""Deletes split into short transactions."""
+import time
+from sqlalchemy import Table, select, tuple_
+from ..extensions import db
+
+
+def delete_in_chunks(table: Table, condition, chunk_rows: int, pause_seconds: float = 0.0) -> int:
+	"""Delete ``table`` rows matching ``condition``, ``chunk_rows`` at a time.
+
+	Every chunk is one ``DELETE ... WHERE pk IN (SELECT pk ... LIMIT n)``
+	committed on its own, so writers such as ingest wait for at most one
+	chunk rather than the whole delete; ``pause_seconds`` between chunks
+	gives them room to get in. Commits any pending work. Returns rows deleted.
+	"""
+	keys = list(table.primary_key.columns)
+	target = keys[0] if len(keys) == 1 else tuple_(*keys)
+	deleted = 0
+	while True:
+		chunk = select(*keys).where(condition).limit(chunk_rows)
+		count = db.session.execute(table.delete().where(target.in_(chunk))).rowcount
+		db.session.commit()
+		deleted += count
+		if count < chunk_rows:
+			return deleted
+		if pause_seconds:
+			time.sleep(pause_seconds)
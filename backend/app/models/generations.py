@@ -0,0 +1,13 @@
+"""Per-owner change counters used to validate cached responses."""
+from datetime import datetime
+from ..extensions import db
+
+
+class OwnerGeneration(db.Model):
+	"""Bumped whenever data shown on an owner's dashboards changes."""
+
+	__tablename__ = "owner_generations"
+
+	owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+	generation = db.Column(db.BigInteger, nullable=False, default=0)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
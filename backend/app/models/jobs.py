@@ -0,0 +1,33 @@
+"""Persistent state for background jobs."""
+from ..extensions import db
+
+
+class JobState(db.Model):
+	"""Lease lock and last-run bookkeeping for one job, shared by every process."""
+
+	__tablename__ = "job_state"
+
+	name = db.Column(db.String(64), primary_key=True)
+	locked_by = db.Column(db.String(128), nullable=True)
+	locked_until = db.Column(db.DateTime, nullable=True)
+	last_started_at = db.Column(db.DateTime, nullable=True)
+	last_finished_at = db.Column(db.DateTime, nullable=True)
+	last_success_at = db.Column(db.DateTime, nullable=True)
+	last_status = db.Column(db.String(16), nullable=True)
+	last_error = db.Column(db.Text, nullable=True)
+	last_duration_ms = db.Column(db.Float, nullable=True)
+	run_count = db.Column(db.Integer, nullable=False, default=0)
+
+	def to_dict(self) -> dict:
+		return {
+			"name": self.name,
+			"locked_by": self.locked_by,
+			"locked_until": self.locked_until.isoformat() if self.locked_until else None,
+			"last_started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+			"last_finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+			"last_success_at": self.last_success_at.isoformat() if self.last_success_at else None,
+			"last_status": self.last_status,
+			"last_error": self.last_error,
+			"last_duration_ms": self.last_duration_ms,
+			"run_count": self.run_count,
+		}
@@ -0,0 +1,258 @@
+"""Monthly time partitioning for raw device stats.
+
+On PostgreSQL ``device_stats`` is a declaratively partitioned parent with one
+``device_stats_pYYYYMM`` child per month plus a default partition, and the
+planner prunes partitions itself. The current and next month's partitions are
+created with the table; rows that still reach the default partition are moved
+out when their month's partition is created. On SQLite ``device_stats`` is the hot table
+for the current month and older rows are rotated into ``device_stats_pYYYYMM``
+tables with the same layout; ``stats_source`` prunes those by time range.
+Either way, dropping a month of history is a cheap table drop.
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import Column, Index, Table, event, func, select, text, union_all
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+from ..extensions import db
+from .chunked import delete_in_chunks
+
+
+PARTITION_PREFIX = "device_stats_p"
+DEFAULT_PARTITION = "device_stats_default"
+_PARTITION_NAME = re.compile(r"^device_stats_p(\d{4})(\d{2})$")
+_partition_tables: Dict[str, Table] = {}
+
+
+def month_start(value: datetime) -> datetime:
+	return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+	return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+	return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+	match = _PARTITION_NAME.match(name)
+	return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_native_partitioning() -> bool:
+	return db.session.get_bind().dialect.name == "postgresql"
+
+
+def _stats_table() -> Table:
+	return db.metadata.tables["device_stats"]
+
+
+def partition_table(name: str) -> Table:
+	"""Table object for a month partition, mirroring device_stats columns."""
+	table = _partition_tables.get(name)
+	if table is None:
+		parent = _stats_table()
+		table = Table(
+			name,
+			db.MetaData(),
+			*[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in parent.columns],
+			Index(f"ix_{name}_device_ts", "device_id", "timestamp"),
+		)
+		_partition_tables[name] = table
+	return table
+
+
+def existing_partitions() -> List[str]:
+	"""Month partition names present in the database, oldest first."""
+	if is_native_partitioning():
+		rows = db.session.execute(text(
+			"SELECT c.relname FROM pg_inherits i "
+			"JOIN pg_class c ON c.oid = i.inhrelid "
+			"JOIN pg_class p ON p.oid = i.inhparent "
+			"WHERE p.relname = 'device_stats'"
+		))
+	else:
+		rows = db.session.execute(text(
+			"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'device_stats_p%'"
+		))
+	return sorted(name for (name,) in rows if partition_month(name))
+
+
+def _native_partition_ddl(month: datetime) -> str:
+	return (
+		f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF device_stats "
+		f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+	)
+
+
+def _create_native_partition(month: datetime) -> None:
+	"""Create a month partition, first moving that month's rows out of the default partition.
+
+	PostgreSQL refuses to create a partition whose range already has rows in
+	the default partition, so the default is detached while those rows are
+	re-inserted through the parent into the new partition.
+	"""
+	bounds = {"start": month, "end": next_month(month)}
+	in_month = "timestamp >= :start AND timestamp < :end"
+	stranded = db.session.execute(
+		text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})"), bounds
+	).scalar()
+	if not stranded:
+		db.session.execute(text(_native_partition_ddl(month)))
+		return
+	columns = ", ".join(c.name for c in _stats_table().columns)
+	db.session.execute(text(f"ALTER TABLE device_stats DETACH PARTITION {DEFAULT_PARTITION}"))
+	db.session.execute(text(_native_partition_ddl(month)))
+	db.session.execute(text(
+		f"INSERT INTO device_stats ({columns}) SELECT {columns} FROM {DEFAULT_PARTITION} WHERE {in_month}"
+	), bounds)
+	db.session.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+	db.session.execute(text(f"ALTER TABLE device_stats ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_partitions(months: List[datetime]) -> List[str]:
+	"""Create month partitions that do not exist yet. Returns names created; the caller commits."""
+	existing = set(existing_partitions())
+	created = []
+	for month in sorted({month_start(m) for m in months}):
+		name = partition_name(month)
+		if name in existing:
+			continue
+		if is_native_partitioning():
+			_create_native_partition(month)
+		else:
+			partition_table(name).create(db.session.connection(), checkfirst=True)
+		created.append(name)
+	return created
+
+
+def stats_source(start: Optional[datetime] = None, end: Optional[datetime] = None):
+	"""Selectable over raw stats in ``[start, end)`` touching only overlapping partitions.
+
+	Exposes ``id``, ``device_id``, ``timestamp``, ``bytes_uploaded`` and
+	``bytes_downloaded`` columns via ``.c``.
+	"""
+	parent = _stats_table()
+	if is_native_partitioning():
+		return parent
+
+	tables = [parent]
+	for name in existing_partitions():
+		month = partition_month(name)
+		if (end is None or month < end) and (start is None or next_month(month) > start):
+			tables.append(partition_table(name))
+	if len(tables) == 1:
+		return parent
+
+	selects = []
+	for table in tables:
+		query = select(*[table.c[c.name] for c in parent.columns])
+		if start is not None:
+			query = query.where(table.c.timestamp >= start)
+		if end is not None:
+			query = query.where(table.c.timestamp < end)
+		selects.append(query)
+	return union_all(*selects).subquery("device_stats_range")
+
+
+def stat_tables() -> List[Table]:
+	"""Every physical table holding raw stats (the parent on PostgreSQL)."""
+	if is_native_partitioning():
+		return [_stats_table()]
+	return [_stats_table()] + [partition_table(name) for name in existing_partitions()]
+
+
+def delete_device_stats(device_id: int, chunk_rows: Optional[int] = None) -> int:
+	"""Delete a device's raw stats from every partition.
+
+	Without ``chunk_rows`` this is one statement per table and the caller
+	commits; with it, rows go ``chunk_rows`` per committed transaction.
+	"""
+	deleted = 0
+	for table in stat_tables():
+		if chunk_rows:
+			deleted += delete_in_chunks(table, table.c.device_id == device_id, chunk_rows)
+		else:
+			deleted += db.session.execute(table.delete().where(table.c.device_id == device_id)).rowcount
+	return deleted
+
+
+def rotate_partitions(now: Optional[datetime] = None) -> Dict[str, int]:
+	"""Keep partitions ready for ``now`` and, on SQLite, move older rows out of the hot table.
+
+	Returns rows moved per partition (always empty on PostgreSQL, where the
+	current and next month partitions are simply created ahead of time).
+	"""
+	now = now or datetime.utcnow()
+	current = month_start(now)
+	if is_native_partitioning():
+		ensure_partitions([current, next_month(current)])
+		return {}
+
+	parent = _stats_table()
+	oldest = db.session.execute(select(func.min(parent.c.timestamp)).where(parent.c.timestamp < current)).scalar()
+	moved: Dict[str, int] = {}
+	month = month_start(oldest) if oldest else current
+	while month < current:
+		upper = next_month(month)
+		ensure_partitions([month])
+		target = partition_table(partition_name(month))
+		columns = [c.name for c in parent.columns]
+		rows = select(*[parent.c[c] for c in columns]).where(parent.c.timestamp >= month, parent.c.timestamp < upper)
+		db.session.execute(target.insert().from_select(columns, rows))
+		count = db.session.execute(
+			parent.delete().where(parent.c.timestamp >= month, parent.c.timestamp < upper)
+		).rowcount
+		if count:
+			moved[partition_name(month)] = count
+		month = upper
+	return moved
+
+
+def partitions_before(cutoff: datetime) -> List[str]:
+	"""Month partitions whose rows all fall before ``cutoff``."""
+	return [name for name in existing_partitions() if next_month(partition_month(name)) <= cutoff]
+
+
+def drop_partitions_before(cutoff: datetime) -> List[str]:
+	"""Drop whole month partitions that end at or before ``cutoff``; the caller commits."""
+	dropped = []
+	for name in partitions_before(cutoff):
+		if is_native_partitioning():
+			db.session.execute(text(f"ALTER TABLE device_stats DETACH PARTITION {name}"))
+			db.session.execute(text(f"DROP TABLE {name}"))
+		else:
+			partition_table(name).drop(db.session.connection(), checkfirst=True)
+			_partition_tables.pop(name, None)
+		dropped.append(name)
+	return dropped
+
+
+@compiles(CreateTable, "postgresql")
+def _create_partitioned_stats(element, compiler, **kw):
+	"""Partition keys must be part of the primary key on PostgreSQL."""
+	ddl = compiler.visit_create_table(element, **kw)
+	if element.element.name == "device_stats":
+		ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, timestamp)")
+	return ddl
+
+
+def _create_initial_partitions(target, connection, **kw) -> None:
+	"""Create the default partition plus this and next month's with the table.
+
+	Without them every row would land in the default partition until the
+	first rotation, which could then no longer create that month's partition.
+	"""
+	if connection.dialect.name != "postgresql":
+		return
+	connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF device_stats DEFAULT"))
+	current = month_start(datetime.utcnow())
+	for month in (current, next_month(current)):
+		connection.execute(text(_native_partition_ddl(month)))
+
+
+def register_partition_ddl(stats_table: Table) -> None:
+	event.listen(stats_table, "after_create", _create_initial_partitions)
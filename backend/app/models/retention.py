@@ -0,0 +1,11 @@
+"""Record of how far retention has pruned each table."""
+from ..extensions import db
+
+
+class RetentionCutoff(db.Model):
+	"""Everything in ``table_name`` before ``pruned_before`` has been deleted by retention."""
+
+	__tablename__ = "retention_cutoffs"
+
+	table_name = db.Column(db.String(64), primary_key=True)
+	pruned_before = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,91 @@
+"""Multi-resolution rollups of device usage stats."""
+from datetime import datetime, timedelta
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from ..extensions import db
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class epoch_seconds(FunctionElement):
+	"""Integer seconds since the Unix epoch for a naive UTC timestamp column."""
+
+	type = BigInteger()
+	inherit_cache = True
+
+
+@compiles(epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+	return "CAST(EXTRACT(EPOCH FROM %s) AS BIGINT)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(epoch_seconds, "sqlite")
+def _epoch_seconds_sqlite(element, compiler, **kw):
+	return "CAST(strftime('%%s', %s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+def epoch_bucket(column, seconds: int):
+	"""SQL expression flooring ``column`` to a multiple of ``seconds`` since the epoch."""
+	return (epoch_seconds(column) // seconds) * seconds
+
+
+def floor_to(value: datetime, seconds: int) -> datetime:
+	return value - timedelta(seconds=(value - EPOCH).total_seconds() % seconds)
+
+
+def ceil_to(value: datetime, seconds: int) -> datetime:
+	floored = floor_to(value, seconds)
+	return floored if floored == value else floored + timedelta(seconds=seconds)
+
+
+class _RollupMixin:
+	device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+	# Own index for time-range scans across devices (rankings, retention).
+	bucket_start = db.Column(db.DateTime, primary_key=True, index=True)
+	bytes_uploaded = db.Column(db.BigInteger, nullable=False, default=0)
+	bytes_downloaded = db.Column(db.BigInteger, nullable=False, default=0)
+	samples = db.Column(db.Integer, nullable=False, default=0)
+
+	def to_dict(self) -> dict:
+		return {
+			"device_id": self.device_id,
+			"timestamp": self.bucket_start.isoformat(),
+			"bytes_uploaded": self.bytes_uploaded,
+			"bytes_downloaded": self.bytes_downloaded,
+			"total_bytes": self.bytes_uploaded + self.bytes_downloaded,
+			"samples": self.samples,
+		}
+
+
+class DeviceStatMinute(_RollupMixin, db.Model):
+	__tablename__ = "device_stats_1m"
+	resolution_seconds = 60
+
+
+class DeviceStatHour(_RollupMixin, db.Model):
+	__tablename__ = "device_stats_1h"
+	resolution_seconds = 3600
+
+
+class DeviceStatDay(_RollupMixin, db.Model):
+	__tablename__ = "device_stats_1d"
+	resolution_seconds = 86400
+
+
+# Finest first; each level is compacted from the one before it.
+ROLLUP_MODELS = (DeviceStatMinute, DeviceStatHour, DeviceStatDay)
+
+
+class RollupWatermark(db.Model):
+	"""Exclusive upper bound up to which a rollup table is complete."""
+
+	__tablename__ = "rollup_watermarks"
+
+	resolution_seconds = db.Column(db.Integer, primary_key=True)
+	compacted_until = db.Column(db.DateTime, nullable=False)
+
+
+def rollup_watermarks() -> dict:
+	return {row.resolution_seconds: row.compacted_until for row in RollupWatermark.query.all()}
@@ -0,0 +1,23 @@
+"""Runtime settings shared by every worker process."""
+from datetime import datetime
+from ..extensions import db
+
+
+class RuntimeSetting(db.Model):
+	"""An operator-adjustable setting, stored as JSON."""
+
+	__tablename__ = "runtime_settings"
+
+	key = db.Column(db.String(64), primary_key=True)
+	value = db.Column(db.Text, nullable=False)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RuntimeSettingsVersion(db.Model):
+	"""Single-row counter bumped with every settings write; workers poll it to refresh their cache."""
+
+	__tablename__ = "runtime_settings_version"
+
+	id = db.Column(db.Integer, primary_key=True)
+	version = db.Column(db.BigInteger, nullable=False, default=0)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
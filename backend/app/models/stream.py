@@ -0,0 +1,24 @@
+"""Cross-process state for the live event stream."""
+from datetime import datetime
+from ..extensions import db
+
+
+class StreamEvent(db.Model):
+	"""Outbox row written with the data it describes and polled by every serving process."""
+
+	__tablename__ = "stream_events"
+
+	id = db.Column(db.Integer, primary_key=True)
+	owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+	event_type = db.Column(db.String(16), nullable=False)
+	payload = db.Column(db.Text, nullable=False)
+	created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class StreamListener(db.Model):
+	"""An owner with an open stream on some process; writers only stage events for these."""
+
+	__tablename__ = "stream_listeners"
+
+	owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+	expires_at = db.Column(db.DateTime, nullable=False)
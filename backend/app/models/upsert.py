@@ -0,0 +1,69 @@
+"""Dialect-aware bulk upsert helpers."""
+from typing import Any, Dict, List, Sequence
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from ..extensions import db
+
+
+_ON_CONFLICT_DIALECTS = {
+	"sqlite": sqlite,
+	"postgresql": postgresql,
+}
+
+
+def bulk_upsert(
+	model,
+	rows: List[Dict[str, Any]],
+	index_elements: Sequence[str],
+	update_columns: Sequence[str] = (),
+	coalesce_columns: Sequence[str] = (),
+) -> None:
+	"""Insert ``rows`` or update the ones whose ``index_elements`` already exist.
+
+	``update_columns`` are overwritten from the incoming row, while
+	``coalesce_columns`` keep the stored value when the incoming one is NULL.
+	Every row must carry the same keys. On SQLite and PostgreSQL this is a
+	single ``INSERT ... ON CONFLICT DO UPDATE`` executemany; other dialects
+	fall back to one lookup, one UPDATE executemany and one INSERT.
+	"""
+	if not rows:
+		return
+
+	table = model.__table__
+	dialect = _ON_CONFLICT_DIALECTS.get(db.session.get_bind().dialect.name)
+	if dialect is None:
+		_fallback_upsert(table, rows, index_elements, update_columns, coalesce_columns)
+		return
+
+	stmt = dialect.insert(table)
+	set_ = {name: stmt.excluded[name] for name in update_columns}
+	set_.update({name: func.coalesce(stmt.excluded[name], table.c[name]) for name in coalesce_columns})
+	if set_:
+		stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=set_)
+	else:
+		stmt = stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+	db.session.execute(stmt, rows)
+
+
+def _fallback_upsert(table, rows, index_elements, update_columns, coalesce_columns) -> None:
+	if len(index_elements) != 1:
+		raise ValueError("Fallback upsert supports a single conflict column")
+	key = index_elements[0]
+	existing = {
+		value
+		for (value,) in db.session.execute(
+			table.select().with_only_columns(table.c[key]).where(table.c[key].in_([row[key] for row in rows]))
+		)
+	}
+
+	to_update = [row for row in rows if row[key] in existing]
+	if to_update and (update_columns or coalesce_columns):
+		values = {name: bindparam(f"b_{name}") for name in update_columns}
+		values.update({name: func.coalesce(bindparam(f"b_{name}"), table.c[name]) for name in coalesce_columns})
+		stmt = update(table).where(table.c[key] == bindparam(f"b_{key}")).values(values)
+		names = {key, *update_columns, *coalesce_columns}
+		db.session.execute(stmt, [{f"b_{name}": row.get(name) for name in names} for row in to_update])
+
+	to_insert = [row for row in rows if row[key] not in existing]
+	if to_insert:
+		db.session.execute(insert(table), to_insert)
@@ -8,6 +8,29 @@ class UsageQuery(BaseModel):
     end: Optional[str] = None
 
 
+class ExportQuery(BaseModel):
+    format: str = "ndjson"
+    device_id: Optional[int] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+
+
+class SummaryQuery(BaseModel):
+    window: str = "lifetime"
+    start: Optional[str] = None
+    end: Optional[str] = None
+    sort: str = "total_bytes"
+    order: str = "desc"
+    limit: Optional[int] = None
+
+
+class TopQuery(BaseModel):
+    window: str = "day"
+    metric: str = "total"
+    limit: int = 10
+    scope: str = "owner"
+
+
 class UsageResponse(BaseModel):
     device_id: int
     bytes_uploaded: int
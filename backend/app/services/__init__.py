@@ -9,6 +9,8 @@ from .device_service import (
 )
 from .alert_service import list_alerts, get_alert, create_alert, update_alert, record_alert_trigger
 from .usage_service import usage_for_device
+from .ingest_service import ingest_stats_batch
+from .agent_service import AgentIdentity, authenticate_agent
 
 __all__ = [
 	"register_user",
@@ -27,4 +29,7 @@ __all__ = [
 	"update_alert",
 	"record_alert_trigger",
 	"usage_for_device",
+	"ingest_stats_batch",
+	"AgentIdentity",
+	"authenticate_agent",
 ]
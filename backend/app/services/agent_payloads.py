@@ -0,0 +1,157 @@
+"""Decoding of agent upload bodies.
+
+Agents may compress bodies with ``Content-Encoding: gzip`` or ``zstd`` and
+send JSON or MessagePack (``Content-Type: application/msgpack``). A list
+field such as ``stats`` or ``devices`` is either the original list of
+objects or a columnar object of parallel arrays::
+
+    {"stats": {"mac_address": [...], "bytes_uploaded": [...], "bytes_downloaded": [...]}}
+
+Columnar payloads name each field once instead of once per device.
+zstd and MessagePack need the optional ``zstandard`` and ``msgpack``
+packages.
+"""
+import json
+import zlib
+from typing import Any, Dict, List, Optional
+
+
+JSON_TYPES = ("application/json", "")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+class PayloadError(Exception):
+    """Raised for bodies that cannot be decoded; carries the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _gunzip(body: bytes, max_bytes: int) -> bytes:
+    inflater = zlib.decompressobj(wbits=47)  # gzip or zlib header
+    try:
+        data = inflater.decompress(body, max_bytes + 1)
+    except zlib.error as exc:
+        raise PayloadError("Invalid gzip body") from exc
+    if len(data) > max_bytes or inflater.unconsumed_tail:
+        raise PayloadError("Decompressed body too large", 413)
+    return data
+
+
+def _unzstd(body: bytes, max_bytes: int) -> bytes:
+    try:
+        import zstandard
+    except ImportError:
+        raise PayloadError("zstd Content-Encoding is not supported by this server", 415)
+    reader = zstandard.ZstdDecompressor().stream_reader(body)
+    try:
+        data = reader.read(max_bytes + 1)
+    except zstandard.ZstdError as exc:
+        raise PayloadError("Invalid zstd body") from exc
+    if len(data) > max_bytes:
+        raise PayloadError("Decompressed body too large", 413)
+    return data
+
+
+def decompress(body: bytes, content_encoding: Optional[str], max_bytes: int) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("identity", ""):
+        if len(body) > max_bytes:
+            raise PayloadError("Body too large", 413)
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        return _gunzip(body, max_bytes)
+    if encoding == "zstd":
+        return _unzstd(body, max_bytes)
+    raise PayloadError(f"Unsupported Content-Encoding: {encoding}", 415)
+
+
+def parse(body: bytes, mimetype: Optional[str]) -> Any:
+    mimetype = (mimetype or "").lower()
+    if mimetype in MSGPACK_TYPES:
+        try:
+            import msgpack
+        except ImportError:
+            raise PayloadError("MessagePack bodies are not supported by this server", 415)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise PayloadError("Invalid MessagePack body") from exc
+    if mimetype not in JSON_TYPES:
+        raise PayloadError(f"Unsupported Content-Type: {mimetype}", 415)
+    try:
+        return json.loads(body) if body else {}
+    except ValueError as exc:
+        raise PayloadError("Invalid JSON body") from exc
+
+
+def read_payload(body: bytes, content_encoding: Optional[str], mimetype: Optional[str], max_bytes: int) -> Dict[str, Any]:
+    data = parse(decompress(body, content_encoding, max_bytes), mimetype)
+    if not isinstance(data, dict):
+        raise PayloadError("Payload must be an object")
+    return data
+
+
+def batch_id(data: Dict[str, Any]) -> Optional[int]:
+    """The upload's optional ``batch_id``: a positive integer the agent increases per batch."""
+    value = data.get("batch_id")
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise PayloadError("batch_id must be a positive integer")
+    return value
+
+
+def records(data: Dict[str, Any], field: str) -> List[Dict[str, Any]]:
+    """Return ``data[field]`` as a list of objects, expanding the columnar form."""
+    value = data.get(field, [])
+    if isinstance(value, dict):
+        columns = value
+        if not all(isinstance(column, list) for column in columns.values()):
+            raise PayloadError(f"Invalid {field} payload")
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise PayloadError(f"Columns of {field} differ in length")
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise PayloadError(f"Invalid {field} payload")
+    return value
+
+
+STAT_COUNTERS = ("bytes_uploaded", "bytes_downloaded")
+
+
+def _counter(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    number = int(value)
+    if number < 0:
+        raise ValueError(value)
+    return number
+
+
+def stat_records(stats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Check ``stats`` records and convert their byte counters to ints.
+
+    Done before a payload is accepted, so a bad value is answered with 400
+    instead of failing the background write it would otherwise be part of.
+    """
+    checked = []
+    for i, stat in enumerate(stats):
+        mac = stat.get("mac_address")
+        if mac is not None and not isinstance(mac, str):
+            raise PayloadError(f"stats[{i}].mac_address must be a string")
+        stat = dict(stat)
+        for field in STAT_COUNTERS:
+            if stat.get(field) is None:
+                continue
+            try:
+                stat[field] = _counter(stat[field])
+            except (TypeError, ValueError, OverflowError):
+                raise PayloadError(f"stats[{i}].{field} must be a non-negative integer")
+        checked.append(stat)
+    return checked
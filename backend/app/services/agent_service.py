@@ -0,0 +1,142 @@
+"""Agent API-key authentication with an in-process cache."""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, inspect, update
+from sqlalchemy.exc import SQLAlchemyError
+from ..extensions import db
+from ..models import Agent
+
+
+@dataclass(frozen=True)
+class AgentIdentity:
+    """Detached view of an authenticated agent, safe to share across requests."""
+
+    id: int
+    name: str
+    owner_id: int
+
+
+class AgentAuthCache:
+    """TTL cache of api_key -> AgentIdentity plus buffered last_sync timestamps."""
+
+    def __init__(self, ttl_seconds: float, flush_interval: float):
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self._entries: Dict[str, Tuple[AgentIdentity, float]] = {}
+        self._pending: Dict[int, datetime] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> Optional[AgentIdentity]:
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[api_key]
+                return None
+            return entry[0]
+
+    def put(self, api_key: str, identity: AgentIdentity) -> None:
+        with self._lock:
+            self._entries[api_key] = (identity, time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self, api_key: str) -> None:
+        with self._lock:
+            self._entries.pop(api_key, None)
+
+    def touch(self, agent_id: int, when: datetime) -> None:
+        with self._lock:
+            self._pending[agent_id] = when
+
+    def drain(self, force: bool = False) -> Dict[int, datetime]:
+        """Take pending last_sync values if the flush interval has elapsed."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._pending or (not force and now - self._last_flush < self.flush_interval):
+                return {}
+            pending, self._pending = self._pending, {}
+            self._last_flush = now
+            return pending
+
+    def requeue(self, pending: Dict[int, datetime]) -> None:
+        with self._lock:
+            for agent_id, when in pending.items():
+                if agent_id not in self._pending or self._pending[agent_id] < when:
+                    self._pending[agent_id] = when
+
+
+def _cache() -> AgentAuthCache:
+    cache = current_app.extensions.get("agent_auth_cache")
+    if cache is None:
+        cache = AgentAuthCache(
+            ttl_seconds=current_app.config.get("AGENT_AUTH_CACHE_TTL", 60),
+            flush_interval=current_app.config.get("AGENT_LAST_SYNC_FLUSH_SECONDS", 5),
+        )
+        current_app.extensions["agent_auth_cache"] = cache
+    return cache
+
+
+def authenticate_agent(api_key: str) -> Optional[AgentIdentity]:
+    """Resolve an active agent by API key, hitting the database only on cache miss."""
+    cache = _cache()
+    identity = cache.get(api_key)
+    if identity is not None:
+        return identity
+
+    agent = Agent.query.filter_by(api_key=api_key, is_active=True).first()
+    if not agent:
+        return None
+    identity = AgentIdentity(id=agent.id, name=agent.name, owner_id=agent.owner_id)
+    cache.put(api_key, identity)
+    return identity
+
+
+def record_agent_sync(agent_id: int, when: Optional[datetime] = None) -> None:
+    """Buffer a last_sync update; it is written by the next due flush."""
+    _cache().touch(agent_id, when or datetime.utcnow())
+
+
+def flush_last_sync(force: bool = False) -> int:
+    """Write buffered last_sync values in one executemany UPDATE. Returns agents updated."""
+    cache = _cache()
+    pending = cache.drain(force=force)
+    if not pending:
+        return 0
+
+    table = Agent.__table__
+    stmt = update(table).where(table.c.id == bindparam("b_id")).values(last_sync=bindparam("b_last_sync"))
+    try:
+        db.session.execute(stmt, [{"b_id": agent_id, "b_last_sync": when} for agent_id, when in pending.items()])
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        cache.requeue(pending)
+        current_app.logger.warning("Failed to flush last_sync for %d agent(s)", len(pending), exc_info=True)
+        return 0
+    return len(pending)
+
+
+@event.listens_for(Agent, "after_update")
+def _invalidate_on_change(mapper, connection, target: Agent) -> None:
+    if not has_app_context():
+        return
+    state = inspect(target)
+    active = state.attrs.is_active.history
+    key = state.attrs.api_key.history
+    if not active.has_changes() and not key.has_changes():
+        return
+    cache = _cache()
+    for api_key in (*key.deleted, *key.unchanged, *key.added):
+        if api_key:
+            cache.invalidate(api_key)
+
+
+@event.listens_for(Agent, "after_delete")
+def _invalidate_on_delete(mapper, connection, target: Agent) -> None:
+    if has_app_context() and target.api_key:
+        _cache().invalidate(target.api_key)
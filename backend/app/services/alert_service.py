@@ -1,12 +1,17 @@
 """Alert management services."""
-from typing import List, Optional
+import base64
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-import json
-import urllib.request
-import urllib.error
-from flask import current_app
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, func, insert, or_
+from sqlalchemy.orm import Session, contains_eager
 from ..extensions import db
-from ..models import Alert, AlertHistory, Device, aggregate_device_usage
+from ..models import Alert, AlertHistory, Device
+from .counter_service import cap_forecasts, lifetime_usage_by_device
+from .event_bus import ALERT_EVENT, stage_events, wants_events
+from .response_cache import bump_generations
+from .voice_dispatcher import get_voice_dispatcher, voice_alert_types
 
 
 def list_alerts(user_id: int) -> List[Alert]:
@@ -26,6 +31,7 @@ def create_alert(user_id: int, device_id: int, alert_type: str, threshold_value:
         is_enabled=is_enabled,
     )
     db.session.add(alert)
+    bump_generations([user_id])
     db.session.commit()
     return alert
 
@@ -34,122 +40,294 @@ def update_alert(alert: Alert, **kwargs) -> Alert:
     for key, value in kwargs.items():
         if value is not None:
             setattr(alert, key, value)
+    bump_generations([alert.user_id])
     db.session.commit()
     return alert
 
 
-def record_alert_trigger(alert: Alert, device_id: int, value: int) -> AlertHistory:
-    history = AlertHistory(alert_id=alert.id, device_id=device_id, value_at_trigger=value)
+def record_alert_trigger(alert: Alert, device_id: int, value: int, commit: bool = True) -> AlertHistory:
+    history = AlertHistory(alert_id=alert.id, device_id=device_id, value_at_trigger=value, triggered_at=datetime.utcnow())
     db.session.add(history)
-    db.session.commit()
-    _send_voice_notification(alert, device_id, value)
+    _queue_voice_notifications([(alert, device_id, value)])
+    _stage_alert_events([(alert, device_id, value)], history.triggered_at)
+    if commit:
+        bump_generations([alert.user_id])
+        db.session.commit()
+    else:
+        db.session.flush()
     return history
 
 
-def _send_voice_notification(alert: Alert, device_id: int, value: int) -> None:
-    """Send voice notification to optional external voice service."""
-    if not current_app:
+def _voice_message(alert_type: str, device_name: str) -> str:
+    if alert_type == "ddos_detected":
+        return f"DDoS detected on {device_name}."
+    if alert_type == "dos_detected":
+        return f"DoS detected on {device_name}."
+    if alert_type == "data_cap":
+        return f"Data cap exceeded on {device_name}."
+    if alert_type == "forecast_cap":
+        return f"{device_name} is on track to reach its data cap soon."
+    return f"Alert triggered for {device_name}."
+
+
+def _queue_voice_notifications(triggers: List[Tuple[Alert, int, int]]) -> None:
+    """Stage voice notifications for triggers; they are dispatched once the session commits."""
+    if not has_app_context() or get_voice_dispatcher(current_app) is None:
         return
 
-    service_url = (current_app.config.get("VOICE_SERVICE_URL") or "").strip()
-    if not service_url:
+    allowed_types = voice_alert_types(current_app)
+    triggers = [t for t in triggers if not allowed_types or t[0].alert_type.lower() in allowed_types]
+    if not triggers:
         return
 
-    types_raw = current_app.config.get("VOICE_SERVICE_ALERT_TYPES", "")
-    allowed_types = {t.strip().lower() for t in types_raw.split(",") if t.strip()}
-    if allowed_types and alert.alert_type.lower() not in allowed_types:
+    names = {
+        device_id: hostname or mac_address
+        for device_id, hostname, mac_address in db.session.query(Device.id, Device.hostname, Device.mac_address)
+        .filter(Device.id.in_({device_id for _, device_id, _ in triggers}))
+        .all()
+    }
+    pending = db.session.info.setdefault("pending_voice", [])
+    for alert, device_id, value in triggers:
+        device_name = names.get(device_id, "Unknown device")
+        pending.append(((device_id, alert.alert_type), {
+            "message": _voice_message(alert.alert_type, device_name),
+            "alert_type": alert.alert_type,
+            "device": device_name,
+            "value": value,
+        }))
+
+
+def _stage_alert_events(triggers: List[Tuple[Alert, int, int]], triggered_at: datetime) -> None:
+    """Stage live-stream alert events; they are published once the session commits."""
+    by_owner: Dict[int, List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)
+    for alert, device_id, value in triggers:
+        if wants_events(alert.user_id):
+            by_owner[alert.user_id].append((ALERT_EVENT, {
+                "alert_id": alert.id,
+                "alert_type": alert.alert_type,
+                "device_id": device_id,
+                "value_at_trigger": value,
+                "triggered_at": triggered_at.isoformat(),
+            }))
+    for owner_id, events in by_owner.items():
+        stage_events(owner_id, events)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_voice_after_commit(session) -> None:
+    pending = session.info.pop("pending_voice", None)
+    if not pending or not has_app_context():
         return
+    dispatcher = get_voice_dispatcher(current_app)
+    if dispatcher is None:
+        return
+    for key, payload in pending:
+        dispatcher.submit(key, payload)
 
-    device = Device.query.get(device_id)
-    device_name = device.hostname or device.mac_address if device else "Unknown device"
 
-    if alert.alert_type == "ddos_detected":
-        message = f"DDoS detected on {device_name}."
-    elif alert.alert_type == "dos_detected":
-        message = f"DoS detected on {device_name}."
-    elif alert.alert_type == "data_cap":
-        message = f"Data cap exceeded on {device_name}."
-    else:
-        message = f"Alert triggered for {device_name}."
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_voice_after_rollback(session, previous_transaction) -> None:
+    session.info.pop("pending_voice", None)
 
-    payload = {
-        "message": message,
-        "alert_type": alert.alert_type,
-        "device": device_name,
-        "value": value,
-    }
 
-    token = (current_app.config.get("VOICE_SERVICE_TOKEN") or "").strip()
-    headers = {"Content-Type": "application/json"}
-    if token:
-        headers["X-Voice-Token"] = token
+DATA_CAP_REPEAT_INTERVAL = timedelta(hours=1)
+FORECAST_CAP_REPEAT_INTERVAL = timedelta(hours=12)
 
-    try:
-        req = urllib.request.Request(
-            f"{service_url.rstrip('/')}/speak",
-            data=json.dumps(payload).encode("utf-8"),
-            headers=headers,
-            method="POST",
-        )
-        urllib.request.urlopen(req, timeout=3)
-    except urllib.error.URLError:
-        # Best-effort only
-        return
 
+def evaluate_usage_alerts(user_id: int, device_id: int, total_bytes: int, commit: bool = True) -> List[Dict[str, Any]]:
+    """Evaluate usage alerts for a device and record triggers when thresholds are exceeded.
 
-def evaluate_usage_alerts(user_id: int, device_id: int, total_bytes: int) -> List[AlertHistory]:
-    """Evaluate usage alerts for a device and record triggers when thresholds are exceeded."""
+    With ``commit=False`` writes are only flushed so the caller owns the transaction.
+    """
     if total_bytes is None:
         return []
+    return evaluate_usage_alerts_batch(
+        user_id, [{"device_id": device_id, "total_bytes": total_bytes}], commit=commit
+    )
+
+
+def _sample_total(row: Dict[str, Any]) -> int:
+    if row.get("total_bytes") is not None:
+        return int(row["total_bytes"])
+    return int(row.get("bytes_uploaded") or 0) + int(row.get("bytes_downloaded") or 0)
+
 
-    alerts = Alert.query.filter(
+def load_usage_rules(user_id: int, device_ids: List[int]) -> Tuple[List[Alert], Dict[int, List[Alert]]]:
+    """Load a user's enabled alert rules once, indexed into global and per-device scope."""
+    rules = Alert.query.filter(
         Alert.user_id == user_id,
         Alert.is_enabled.is_(True),
-        (Alert.device_id.is_(None)) | (Alert.device_id == device_id),
+        (Alert.device_id.is_(None)) | (Alert.device_id.in_(device_ids)),
     ).all()
 
-    triggered: List[AlertHistory] = []
-    for alert in alerts:
-        if alert.alert_type == "usage_threshold" and total_bytes >= alert.threshold_value:
-            triggered.append(record_alert_trigger(alert, device_id, total_bytes))
+    global_rules: List[Alert] = []
+    device_rules: Dict[int, List[Alert]] = defaultdict(list)
+    for rule in rules:
+        if rule.device_id is None:
+            global_rules.append(rule)
+        else:
+            device_rules[rule.device_id].append(rule)
+    return global_rules, device_rules
+
+
+def _data_cap_triggers(user_id: int, device_ids: List[int]) -> List[Tuple[Alert, int, int]]:
+    """Return (alert, device_id, usage) for capped devices whose usage reached the cap."""
+    caps = dict(
+        db.session.query(Device.id, Device.data_cap)
+        .filter(Device.id.in_(device_ids), Device.data_cap.isnot(None))
+        .all()
+    )
+    if not caps:
+        return []
 
-    # Also evaluate device-level data cap (if configured on the Device)
+    usage = lifetime_usage_by_device(list(caps))
+    over_cap = {
+        device_id: usage[device_id]["total_bytes"]
+        for device_id, cap in caps.items()
+        if usage.get(device_id, {}).get("total_bytes", 0) >= cap
+    }
+    if not over_cap:
+        return []
+
+    cap_alerts: Dict[int, Alert] = {}
+    for alert in Alert.query.filter(
+        Alert.user_id == user_id,
+        Alert.alert_type == "data_cap",
+        Alert.device_id.in_(list(over_cap)),
+    ).all():
+        if alert.threshold_value == caps[alert.device_id]:
+            cap_alerts.setdefault(alert.device_id, alert)
+
+    missing = [
+        Alert(user_id=user_id, device_id=device_id, alert_type="data_cap", threshold_value=caps[device_id], is_enabled=True)
+        for device_id in over_cap
+        if device_id not in cap_alerts
+    ]
+    if missing:
+        db.session.add_all(missing)
+        db.session.flush()
+        cap_alerts.update({alert.device_id: alert for alert in missing})
+
+    latest = dict(
+        db.session.query(AlertHistory.alert_id, func.max(AlertHistory.triggered_at))
+        .filter(AlertHistory.alert_id.in_([alert.id for alert in cap_alerts.values()]))
+        .group_by(AlertHistory.alert_id)
+        .all()
+    )
+    now = datetime.utcnow()
+    return [
+        (alert, device_id, over_cap[device_id])
+        for device_id, alert in cap_alerts.items()
+        if latest.get(alert.id) is None or (now - latest[alert.id]) > DATA_CAP_REPEAT_INTERVAL
+    ]
+
+
+def _forecast_cap_triggers(rules_by_device: Dict[int, List[Alert]]) -> List[Tuple[Alert, int, int]]:
+    """Return (alert, device_id, seconds_to_cap) for ``forecast_cap`` rules that are due.
+
+    A rule's ``threshold_value`` is the warning lead time in hours. Devices
+    already over their cap are left to the ``data_cap`` alert.
+    """
+    forecasts = cap_forecasts(list(rules_by_device))
+    due: List[Tuple[Alert, int, int]] = []
+    for device_id, rules in rules_by_device.items():
+        seconds = forecasts.get(device_id, {}).get("seconds_to_cap")
+        if not seconds:
+            continue
+        due.extend((rule, device_id, int(seconds)) for rule in rules if seconds <= rule.threshold_value * 3600)
+    if not due:
+        return []
+
+    latest = {
+        (alert_id, device_id): triggered_at
+        for alert_id, device_id, triggered_at in db.session.query(
+            AlertHistory.alert_id, AlertHistory.device_id, func.max(AlertHistory.triggered_at)
+        )
+        .filter(AlertHistory.alert_id.in_({alert.id for alert, _, _ in due}))
+        .group_by(AlertHistory.alert_id, AlertHistory.device_id)
+        .all()
+    }
+    now = datetime.utcnow()
+    return [
+        (alert, device_id, seconds)
+        for alert, device_id, seconds in due
+        if latest.get((alert.id, device_id)) is None
+        or (now - latest[(alert.id, device_id)]) > FORECAST_CAP_REPEAT_INTERVAL
+    ]
+
+
+def record_alert_triggers(triggers: List[Tuple[Alert, int, int]], commit: bool = True) -> List[Dict[str, Any]]:
+    """Record many (alert, device_id, value) triggers with one multi-row insert.
+
+    Returns the inserted history rows as dicts; ids are not fetched back.
+    """
+    if not triggers:
+        return []
+    now = datetime.utcnow()
+    rows = [
+        {"alert_id": alert.id, "device_id": device_id, "triggered_at": now, "value_at_trigger": value}
+        for alert, device_id, value in triggers
+    ]
+    db.session.execute(insert(AlertHistory), rows)
+    _queue_voice_notifications(triggers)
+    _stage_alert_events(triggers, now)
+    if commit:
+        bump_generations(alert.user_id for alert, _, _ in triggers)
+        db.session.commit()
+    return rows
+
+
+def evaluate_usage_alerts_batch(user_id: int, rows: List[Dict[str, Any]], commit: bool = False) -> List[Dict[str, Any]]:
+    """Evaluate usage alerts for a whole batch of ingested stat rows.
+
+    Each row carries ``device_id`` plus either ``total_bytes`` or
+    ``bytes_uploaded``/``bytes_downloaded``. Rules, caps, usage totals and the
+    latest data-cap triggers are each loaded with one query regardless of batch
+    size, and all triggers are written with one insert. ``forecast_cap`` rules
+    read the rates folded in by this same transaction. By default nothing is
+    committed so the caller owns the transaction.
+    """
+    if not rows:
+        return []
+
+    device_ids = list(dict.fromkeys(row["device_id"] for row in rows))
+    global_rules, device_rules = load_usage_rules(user_id, device_ids)
+
+    triggers: List[Tuple[Alert, int, int]] = []
+    forecast_rules: Dict[int, List[Alert]] = {}
+    for device_id in device_ids:
+        rules = [rule for rule in global_rules + device_rules.get(device_id, []) if rule.alert_type == "forecast_cap"]
+        if rules:
+            forecast_rules[device_id] = rules
+
+    for row in rows:
+        device_id = row["device_id"]
+        total_bytes = _sample_total(row)
+        triggers.extend(
+            (rule, device_id, total_bytes)
+            for rule in global_rules + device_rules.get(device_id, [])
+            if rule.alert_type == "usage_threshold" and total_bytes >= rule.threshold_value
+        )
+
+    triggers.extend(_data_cap_triggers(user_id, device_ids))
+    if forecast_rules:
+        triggers.extend(_forecast_cap_triggers(forecast_rules))
+    return record_alert_triggers(triggers, commit=commit)
+
+
+def encode_history_cursor(history: AlertHistory) -> str:
+    """Opaque keyset cursor pointing just past ``history`` in newest-first order."""
+    raw = f"{history.triggered_at.isoformat()}|{history.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
     try:
-        device = Device.query.get(device_id)
-    except Exception:
-        device = None
-
-    if device and device.data_cap is not None:
-        usage_totals = aggregate_device_usage(device_id)
-        cap_total = usage_totals.get("total_bytes", 0)
-        if cap_total >= device.data_cap:
-            data_cap_alert = Alert.query.filter_by(
-                user_id=user_id,
-                device_id=device_id,
-                alert_type="data_cap",
-                threshold_value=device.data_cap,
-            ).first()
-
-            if not data_cap_alert:
-                data_cap_alert = Alert(
-                    user_id=user_id,
-                    device_id=device_id,
-                    alert_type="data_cap",
-                    threshold_value=device.data_cap,
-                    is_enabled=True,
-                )
-                db.session.add(data_cap_alert)
-                db.session.commit()
-
-            latest = (
-                AlertHistory.query.filter_by(alert_id=data_cap_alert.id)
-                .order_by(AlertHistory.triggered_at.desc())
-                .first()
-            )
-            if latest is None or (datetime.utcnow() - latest.triggered_at) > timedelta(hours=1):
-                triggered.append(record_alert_trigger(data_cap_alert, device_id, cap_total))
-
-    return triggered
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        triggered_at, history_id = raw.split("|")
+        return datetime.fromisoformat(triggered_at), int(history_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
 
 
 def list_recent_history(
@@ -157,21 +335,36 @@ def list_recent_history(
     hours: Optional[int] = 24,
     limit: int = 100,
     offset: int = 0,
+    before: Optional[Tuple[datetime, int]] = None,
 ) -> List[AlertHistory]:
-    """Return AlertHistory entries for a user with optional time filter and pagination."""
-    query = AlertHistory.query.join(Alert).filter(Alert.user_id == user_id)
+    """Return AlertHistory entries for a user, newest first, with alert and device loaded.
+
+    Alert and device come from the same joined statement. Pass ``before`` (a
+    decoded cursor) to page by ``(triggered_at, id)`` instead of ``offset``
+    so every page costs the same however deep it is.
+    """
+    query = (
+        AlertHistory.query.join(AlertHistory.alert)
+        .outerjoin(AlertHistory.device)
+        .options(contains_eager(AlertHistory.alert), contains_eager(AlertHistory.device))
+        .filter(Alert.user_id == user_id)
+    )
 
     if hours is not None:
         since = datetime.utcnow() - timedelta(hours=hours)
         query = query.filter(AlertHistory.triggered_at >= since)
 
-    histories = (
-        query.order_by(AlertHistory.triggered_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
-    return histories
+    query = query.order_by(AlertHistory.triggered_at.desc(), AlertHistory.id.desc())
+    if before is not None:
+        triggered_at, history_id = before
+        query = query.filter(or_(
+            AlertHistory.triggered_at < triggered_at,
+            and_(AlertHistory.triggered_at == triggered_at, AlertHistory.id < history_id),
+        ))
+    elif offset:
+        query = query.offset(offset)
+
+    return query.limit(limit).all()
 
 
 def record_detection_alert(
@@ -220,5 +413,6 @@ def clear_alert_history(user_id: int) -> int:
     deleted = AlertHistory.query.filter(AlertHistory.alert_id.in_(alert_ids)).delete(
         synchronize_session=False
     )
+    bump_generations([user_id])
     db.session.commit()
     return deleted
@@ -1,5 +1,6 @@
 """Authentication and user management services."""
 from typing import Optional
+from flask import current_app
 from flask_jwt_extended import create_access_token
 from sqlalchemy.exc import IntegrityError
 from ..extensions import db
@@ -30,5 +31,14 @@ def authenticate(email: str, password: str) -> Optional[str]:
     return token
 
 
+def is_admin(user_id: int) -> bool:
+    """Whether the user's email is listed in ``ADMIN_EMAILS``."""
+    admins = current_app.config.get("ADMIN_EMAILS") or ()
+    if not admins:
+        return False
+    user = db.session.get(User, int(user_id))
+    return user is not None and user.email.lower() in admins
+
+
 def get_user(user_id: int) -> Optional[User]:
     return User.query.get(user_id)
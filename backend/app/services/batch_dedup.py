@@ -0,0 +1,119 @@
+"""Per-agent deduplication of stats batches.
+
+Agents number uploads with increasing batch ids and resend the same id when
+retrying, so a batch committed before the agent saw the response is not
+counted twice. Each agent keeps a watermark and the ids of its most recent
+batches above it. When the window overflows, the smallest id becomes the new
+watermark. An id in the window or equal to the watermark is a duplicate. An
+id below the watermark is stale: no retry can be that old, so it most likely
+comes from an agent whose counter went backwards, e.g. a Pi without an RTC
+booting with an old clock. Stale batches are answered with the next id the
+agent should use.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import bindparam, select, update
+from ..extensions import db
+from ..models import AgentBatchWindow, bulk_upsert
+
+
+NEW = "new"
+DUPLICATE = "duplicate"
+STALE = "stale"
+DEFAULT_WINDOW = 64
+
+
+class BatchWindow:
+    __slots__ = ("watermark", "recent")
+
+    def __init__(self, watermark: int = 0, recent: Optional[List[int]] = None):
+        self.watermark = watermark
+        self.recent = recent or []
+
+    @classmethod
+    def decode(cls, watermark: int, recent: str) -> "BatchWindow":
+        return cls(watermark or 0, [int(batch_id) for batch_id in recent.split(",") if batch_id])
+
+    def encode(self) -> str:
+        return ",".join(str(batch_id) for batch_id in self.recent)
+
+    def classify(self, batch_id: int) -> str:
+        if batch_id < self.watermark:
+            return STALE
+        if batch_id == self.watermark:
+            return DUPLICATE
+        index = bisect_left(self.recent, batch_id)
+        return DUPLICATE if index < len(self.recent) and self.recent[index] == batch_id else NEW
+
+    def add(self, batch_id: int, size: int) -> None:
+        insort(self.recent, batch_id)
+        while len(self.recent) > size:
+            self.watermark = max(self.watermark, self.recent.pop(0))
+
+    def next_batch_id(self) -> int:
+        return max([self.watermark, *self.recent[-1:]]) + 1
+
+
+def _window_size() -> int:
+    return current_app.config.get("INGEST_DEDUP_WINDOW", DEFAULT_WINDOW)
+
+
+def check_batch(agent_id: int, batch_id: int) -> Tuple[str, int]:
+    """Classify a batch id against committed state without writing; returns (status, next id)."""
+    row = db.session.execute(
+        select(AgentBatchWindow.watermark, AgentBatchWindow.recent).where(AgentBatchWindow.agent_id == agent_id)
+    ).first()
+    window = BatchWindow.decode(*row) if row else BatchWindow()
+    return window.classify(batch_id), window.next_batch_id()
+
+
+def claim_batches(claims: Iterable[Tuple[int, int]]) -> List[str]:
+    """Record ``(agent_id, batch_id)`` claims in the current transaction.
+
+    Returns each claim's status in order; only ``new`` claims should be
+    ingested. Claims are checked against each other as well, so one bulk
+    write can hold retries of the same batch. The caller commits.
+    """
+    claims = list(claims)
+    if not claims:
+        return []
+    agent_ids = sorted({agent_id for agent_id, _ in claims})
+    now = datetime.utcnow()
+    # Inserting first takes the write lock before the windows are read.
+    bulk_upsert(
+        AgentBatchWindow,
+        [{"agent_id": agent_id, "watermark": 0, "recent": "", "updated_at": now} for agent_id in agent_ids],
+        index_elements=["agent_id"],
+    )
+    rows = db.session.execute(
+        select(AgentBatchWindow.agent_id, AgentBatchWindow.watermark, AgentBatchWindow.recent)
+        .where(AgentBatchWindow.agent_id.in_(agent_ids))
+        .with_for_update()
+    ).all()
+    windows: Dict[int, BatchWindow] = {agent_id: BatchWindow.decode(watermark, recent) for agent_id, watermark, recent in rows}
+
+    size = _window_size()
+    statuses = []
+    changed = set()
+    for agent_id, batch_id in claims:
+        window = windows[agent_id]
+        status = window.classify(batch_id)
+        if status == NEW:
+            window.add(batch_id, size)
+            changed.add(agent_id)
+        statuses.append(status)
+
+    if changed:
+        table = AgentBatchWindow.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.agent_id == bindparam("b_agent_id"))
+            .values(watermark=bindparam("b_watermark"), recent=bindparam("b_recent"), updated_at=now),
+            [
+                {"b_agent_id": agent_id, "b_watermark": windows[agent_id].watermark, "b_recent": windows[agent_id].encode()}
+                for agent_id in sorted(changed)
+            ],
+        )
+    return statuses
@@ -0,0 +1,379 @@
+"""Incrementally maintained per-device usage counters and usage rates."""
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import bindparam, case, update
+from ..extensions import db
+from ..models import Device, DeviceUsageCounter, DeviceUsageRate, aggregate_usage_by_device, bulk_upsert
+
+
+RECONCILE_CHUNK = 500
+# Projections further out than this are reported as "not in sight".
+FORECAST_HORIZON = timedelta(days=3650)
+
+RateState = Tuple[float, datetime, datetime]
+
+
+def billing_period_start(day: date, start_day: int = 1) -> date:
+    """Return the first day of the billing period containing ``day``."""
+    start_day = min(max(int(start_day), 1), 28)
+    if day.day >= start_day:
+        return day.replace(day=start_day)
+    if day.month == 1:
+        return date(day.year - 1, 12, start_day)
+    return date(day.year, day.month - 1, start_day)
+
+
+def _windows(now: datetime) -> Tuple[date, date]:
+    start_day = current_app.config.get("BILLING_PERIOD_START_DAY", 1)
+    today = now.date()
+    return today, billing_period_start(today, start_day)
+
+
+def _seed_rows(device_ids: List[int], now: datetime) -> List[Dict[str, Any]]:
+    """Build counter rows for devices from raw stats with three grouped queries."""
+    today, period = _windows(now)
+    lifetime = aggregate_usage_by_device(device_ids)
+    day = aggregate_usage_by_device(device_ids, start=datetime.combine(today, time.min))
+    billing = aggregate_usage_by_device(device_ids, start=datetime.combine(period, time.min))
+    empty = {"bytes_uploaded": 0, "bytes_downloaded": 0}
+    return [
+        {
+            "device_id": device_id,
+            "bytes_uploaded": lifetime.get(device_id, empty)["bytes_uploaded"],
+            "bytes_downloaded": lifetime.get(device_id, empty)["bytes_downloaded"],
+            "day_start": today,
+            "day_uploaded": day.get(device_id, empty)["bytes_uploaded"],
+            "day_downloaded": day.get(device_id, empty)["bytes_downloaded"],
+            "period_start": period,
+            "period_uploaded": billing.get(device_id, empty)["bytes_uploaded"],
+            "period_downloaded": billing.get(device_id, empty)["bytes_downloaded"],
+            "updated_at": now,
+        }
+        for device_id in device_ids
+    ]
+
+
+def apply_usage_deltas(rows: List[Dict[str, Any]], now: Optional[datetime] = None) -> None:
+    """Fold a batch of stat rows into the counters and rates without committing.
+
+    Must run before the rows are written. Devices without a counter yet are
+    seeded from the stats stored so far, with ``ON CONFLICT DO NOTHING`` in
+    case a concurrent writer seeded them first. The batch is then added to
+    every counter by one UPDATE, so it is counted once whoever seeded. Day
+    and billing windows roll over inside the UPDATE so concurrent writers
+    stay consistent.
+    """
+    deltas: Dict[int, List[int]] = {}
+    for row in rows:
+        totals = deltas.setdefault(row["device_id"], [0, 0])
+        totals[0] += row.get("bytes_uploaded") or 0
+        totals[1] += row.get("bytes_downloaded") or 0
+    if not deltas:
+        return
+
+    now = now or datetime.utcnow()
+    today, period = _windows(now)
+    existing = {
+        device_id
+        for (device_id,) in db.session.query(DeviceUsageCounter.device_id)
+        .filter(DeviceUsageCounter.device_id.in_(list(deltas)))
+        .all()
+    }
+
+    missing = [device_id for device_id in deltas if device_id not in existing]
+    if missing:
+        bulk_upsert(DeviceUsageCounter, _seed_rows(missing, now), index_elements=["device_id"])
+
+    table = DeviceUsageCounter.__table__
+    up = bindparam("b_up")
+    down = bindparam("b_down")
+    day = bindparam("b_day")
+    stmt = (
+        update(table)
+        .where(table.c.device_id == bindparam("b_device_id"))
+        .values(
+            bytes_uploaded=table.c.bytes_uploaded + up,
+            bytes_downloaded=table.c.bytes_downloaded + down,
+            day_uploaded=case((table.c.day_start == day, table.c.day_uploaded), else_=0) + up,
+            day_downloaded=case((table.c.day_start == day, table.c.day_downloaded), else_=0) + down,
+            day_start=day,
+            period_uploaded=case((table.c.period_start == bindparam("b_period"), table.c.period_uploaded), else_=0) + up,
+            period_downloaded=case((table.c.period_start == bindparam("b_period"), table.c.period_downloaded), else_=0) + down,
+            period_start=bindparam("b_period"),
+            updated_at=now,
+        )
+    )
+    db.session.execute(
+        stmt,
+        [
+            {"b_device_id": device_id, "b_up": up_delta, "b_down": down_delta, "b_day": today, "b_period": period}
+            for device_id, (up_delta, down_delta) in deltas.items()
+        ],
+    )
+
+    apply_usage_rates(rows, now)
+
+
+def _rate_tau() -> float:
+    """Decay time constant in seconds, from the configured half-life."""
+    return current_app.config.get("CAP_FORECAST_HALF_LIFE_HOURS", 24) * 3600 / math.log(2)
+
+
+def fold_sample(state: Optional[RateState], at: datetime, nbytes: int, tau: float) -> RateState:
+    """Fold one sample into ``(decayed_bytes, sample_at, since)`` in O(1).
+
+    The first sample only starts the clock, since its bytes were used over an
+    unknown interval before it. A sample older than ``sample_at`` is decayed
+    to that time rather than moving it back.
+    """
+    if state is None:
+        return 0.0, at, at
+    decayed, sample_at, since = state
+    elapsed = (at - sample_at).total_seconds()
+    if elapsed >= 0:
+        return decayed * math.exp(-elapsed / tau) + nbytes, at, since
+    return decayed + nbytes * math.exp(elapsed / tau), sample_at, since
+
+
+def decayed_rate(state: RateState, now: datetime, tau: float) -> Optional[float]:
+    """Exponentially weighted bytes per second at ``now``; None before a second sample.
+
+    A steady rate ``r`` accumulates ``r * tau * (1 - exp(-age / tau))`` over a
+    history of ``age`` seconds, so dividing by that factor removes the
+    warm-up bias of young histories. Idle devices decay towards zero.
+    """
+    decayed, sample_at, since = state
+    age = (now - since).total_seconds()
+    if sample_at <= since or age <= 0:
+        return None
+    idle = max((now - sample_at).total_seconds(), 0.0)
+    return decayed * math.exp(-idle / tau) / (tau * -math.expm1(-age / tau))
+
+
+def apply_usage_rates(rows: List[Dict[str, Any]], now: Optional[datetime] = None) -> None:
+    """Fold stat rows into each device's decayed usage rate without committing.
+
+    One lookup and one upsert per batch; raw stats are never read. Unlike the
+    counters this is read-modify-write, so two batches for one device racing
+    each other keep only one of their updates, which just skews the estimate.
+    """
+    now = now or datetime.utcnow()
+    samples: Dict[int, List[Tuple[datetime, int]]] = defaultdict(list)
+    for row in rows:
+        nbytes = (row.get("bytes_uploaded") or 0) + (row.get("bytes_downloaded") or 0)
+        samples[row["device_id"]].append((row.get("timestamp") or now, nbytes))
+    if not samples:
+        return
+
+    rate = DeviceUsageRate.__table__
+    states: Dict[int, RateState] = {
+        device_id: (decayed, sample_at, since)
+        for device_id, decayed, sample_at, since in db.session.query(
+            rate.c.device_id, rate.c.decayed_bytes, rate.c.sample_at, rate.c.since
+        ).filter(rate.c.device_id.in_(list(samples)))
+    }
+    tau = _rate_tau()
+    folded = []
+    for device_id, device_samples in samples.items():
+        state = states.get(device_id)
+        for at, nbytes in sorted(device_samples, key=lambda sample: sample[0]):
+            state = fold_sample(state, at, nbytes, tau)
+        decayed, sample_at, since = state
+        folded.append({"device_id": device_id, "decayed_bytes": decayed, "sample_at": sample_at, "since": since})
+    bulk_upsert(DeviceUsageRate, folded, index_elements=["device_id"], update_columns=["decayed_bytes", "sample_at"])
+
+
+def cap_forecasts(device_ids: List[int], now: Optional[datetime] = None) -> Dict[int, dict]:
+    """Projected cap exhaustion per device from counters and rates, in one query.
+
+    ``seconds_to_cap`` is None without a cap, without a usable rate or when
+    the cap is beyond ``FORECAST_HORIZON``, and 0 once it has been reached.
+    """
+    if not device_ids:
+        return {}
+    now = now or datetime.utcnow()
+    tau = _rate_tau()
+    counter = DeviceUsageCounter.__table__
+    rate = DeviceUsageRate.__table__
+    rows = (
+        db.session.query(
+            Device.id,
+            Device.data_cap,
+            counter.c.bytes_uploaded,
+            counter.c.bytes_downloaded,
+            rate.c.decayed_bytes,
+            rate.c.sample_at,
+            rate.c.since,
+        )
+        .outerjoin(counter, counter.c.device_id == Device.id)
+        .outerjoin(rate, rate.c.device_id == Device.id)
+        .filter(Device.id.in_(device_ids))
+        .all()
+    )
+
+    forecasts = {}
+    for row in rows:
+        used = (row.bytes_uploaded or 0) + (row.bytes_downloaded or 0)
+        bytes_per_second = decayed_rate((row.decayed_bytes, row.sample_at, row.since), now, tau) if row.since else None
+        remaining = max(row.data_cap - used, 0) if row.data_cap is not None else None
+        seconds = None
+        if remaining == 0:
+            seconds = 0.0
+        elif remaining is not None and bytes_per_second:
+            seconds = remaining / bytes_per_second
+            if seconds > FORECAST_HORIZON.total_seconds():
+                seconds = None
+        forecasts[row.id] = {
+            "device_id": row.id,
+            "data_cap": row.data_cap,
+            "used_bytes": used,
+            "remaining_bytes": remaining,
+            "rate_bytes_per_second": bytes_per_second,
+            "seconds_to_cap": seconds,
+            "exhausts_at": (now + timedelta(seconds=seconds)).isoformat() if seconds else None,
+            "as_of": now.isoformat(),
+        }
+    return forecasts
+
+
+def usage_snapshot(counter: DeviceUsageCounter, now: Optional[datetime] = None) -> dict:
+    """Serialize a counter, zeroing day/period windows that have rolled over."""
+    today, period = _windows(now or datetime.utcnow())
+    data = counter.to_dict()
+    if counter.day_start != today:
+        data["today"] = {"start": today.isoformat(), "bytes_uploaded": 0, "bytes_downloaded": 0, "total_bytes": 0}
+    if counter.period_start != period:
+        data["billing_period"] = {"start": period.isoformat(), "bytes_uploaded": 0, "bytes_downloaded": 0, "total_bytes": 0}
+    return data
+
+
+def lifetime_usage_by_device(device_ids: List[int]) -> Dict[int, dict]:
+    """Lifetime totals per device from counters, falling back to raw stats when missing."""
+    if not device_ids:
+        return {}
+    totals = {
+        counter.device_id: {
+            "device_id": counter.device_id,
+            "bytes_uploaded": counter.bytes_uploaded,
+            "bytes_downloaded": counter.bytes_downloaded,
+            "total_bytes": counter.bytes_uploaded + counter.bytes_downloaded,
+        }
+        for counter in DeviceUsageCounter.query.filter(DeviceUsageCounter.device_id.in_(device_ids)).all()
+    }
+    missing = [device_id for device_id in device_ids if device_id not in totals]
+    if missing:
+        totals.update(aggregate_usage_by_device(missing))
+    return totals
+
+
+def device_usage(device_id: int) -> dict:
+    """Lifetime, daily and billing-period usage for one device in O(1)."""
+    counter = db.session.get(DeviceUsageCounter, device_id)
+    if counter is None:
+        usage = lifetime_usage_by_device([device_id]).get(device_id)
+        return usage or {"device_id": device_id, "bytes_uploaded": 0, "bytes_downloaded": 0, "total_bytes": 0}
+    return usage_snapshot(counter)
+
+
+COUNTER_WINDOWS = ("lifetime", "today", "billing_period")
+
+_WINDOW_COLUMNS = {
+    "lifetime": ("bytes_uploaded", "bytes_downloaded"),
+    "today": ("day_uploaded", "day_downloaded"),
+    "billing_period": ("period_uploaded", "period_downloaded"),
+}
+
+
+def owner_usage(owner_id: int, window: str = "lifetime", now: Optional[datetime] = None) -> List[dict]:
+    """Usage in a counter window for every device of an owner, from one joined query.
+
+    Each entry also carries the device's cap and lifetime total. Devices
+    without a counter yet are computed from raw stats.
+    """
+    upload_column, download_column = _WINDOW_COLUMNS[window]
+    now = now or datetime.utcnow()
+    today, period = _windows(now)
+    counter = DeviceUsageCounter.__table__
+    rows = (
+        db.session.query(
+            Device.id,
+            Device.mac_address,
+            Device.hostname,
+            Device.data_cap,
+            counter.c.device_id,
+            counter.c.bytes_uploaded,
+            counter.c.bytes_downloaded,
+            counter.c.day_start,
+            counter.c.day_uploaded,
+            counter.c.day_downloaded,
+            counter.c.period_start,
+            counter.c.period_uploaded,
+            counter.c.period_downloaded,
+        )
+        .outerjoin(counter, counter.c.device_id == Device.id)
+        .filter(Device.owner_id == owner_id)
+        .all()
+    )
+
+    missing = [row.id for row in rows if row.device_id is None]
+    seeded = {seed["device_id"]: seed for seed in _seed_rows(missing, now)} if missing else {}
+
+    usage = []
+    for row in rows:
+        values = seeded.get(row.id) or row._asdict()
+        stale = (window == "today" and values["day_start"] != today) or (
+            window == "billing_period" and values["period_start"] != period
+        )
+        uploaded = 0 if stale else values[upload_column]
+        downloaded = 0 if stale else values[download_column]
+        usage.append({
+            "device_id": row.id,
+            "mac_address": row.mac_address,
+            "hostname": row.hostname,
+            "data_cap": row.data_cap,
+            "bytes_uploaded": uploaded,
+            "bytes_downloaded": downloaded,
+            "total_bytes": uploaded + downloaded,
+            "lifetime_total_bytes": values["bytes_uploaded"] + values["bytes_downloaded"],
+        })
+    return usage
+
+
+def reconcile_counters(device_ids: Optional[List[int]] = None) -> int:
+    """Rebuild counters from raw stats, committing per chunk. Returns devices rebuilt.
+
+    Counters are rewritten in place, never deleted, so ingest keeps running.
+    A chunk's counter rows are locked first (``FOR UPDATE`` on PostgreSQL)
+    and raw stats are only aggregated afterwards. An ingest that already
+    committed is in the aggregate. One still in flight waits for the lock and
+    then adds its delta to the rebuilt row. A missing counter that ingest
+    seeds meanwhile is left as ingest wrote it.
+    """
+    if device_ids is None:
+        device_ids = [device_id for (device_id,) in db.session.query(Device.id).order_by(Device.id).all()]
+
+    columns = [column.name for column in DeviceUsageCounter.__table__.columns if column.name != "device_id"]
+    rebuilt = 0
+    for i in range(0, len(device_ids), RECONCILE_CHUNK):
+        chunk = device_ids[i:i + RECONCILE_CHUNK]
+        existing = {
+            device_id
+            for (device_id,) in db.session.query(DeviceUsageCounter.device_id)
+            .filter(DeviceUsageCounter.device_id.in_(chunk))
+            .order_by(DeviceUsageCounter.device_id)
+            .with_for_update()
+        }
+        rows = _seed_rows(chunk, datetime.utcnow())
+        bulk_upsert(
+            DeviceUsageCounter,
+            [row for row in rows if row["device_id"] in existing],
+            index_elements=["device_id"],
+            update_columns=columns,
+        )
+        bulk_upsert(DeviceUsageCounter, [row for row in rows if row["device_id"] not in existing], index_elements=["device_id"])
+        db.session.commit()
+        rebuilt += len(chunk)
+    return rebuilt
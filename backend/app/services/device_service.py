@@ -1,8 +1,14 @@
 """Device management services."""
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from sqlalchemy.exc import IntegrityError
 from ..extensions import db
-from ..models import Device
+from ..models import Device, bulk_upsert
+from .response_cache import bump_generations
+from .retention_service import delete_device_history
+
+
+SYNC_FIELDS = ("ip_address", "hostname", "manufacturer", "device_type")
 
 
 class DeviceError(Exception):
@@ -20,6 +26,7 @@ def get_device(owner_id: int, device_id: int) -> Optional[Device]:
 def create_device(owner_id: int, **kwargs) -> Device:
     device = Device(owner_id=owner_id, **kwargs)
     db.session.add(device)
+    bump_generations([owner_id])
     try:
         db.session.commit()
     except IntegrityError as exc:
@@ -32,10 +39,56 @@ def update_device(device: Device, **kwargs) -> Device:
     for key, value in kwargs.items():
         if value is not None:
             setattr(device, key, value)
+    bump_generations([device.owner_id])
     db.session.commit()
     return device
 
 
 def delete_device(device: Device) -> None:
+    delete_device_history(device.id)
     db.session.delete(device)
+    bump_generations([device.owner_id])
+    db.session.commit()
+
+
+def sync_agent_devices(owner_id: int, devices_data: List[Dict[str, Any]], default_cap: Optional[int] = None) -> List[str]:
+    """Upsert devices reported by an agent keyed on MAC address and commit.
+
+    New devices are created for ``owner_id`` with ``default_cap``. Existing
+    devices keep their owner, cap and ``first_seen``; reported fields only
+    overwrite stored values when non-empty. Returns the synced MACs in order.
+    """
+    now = datetime.utcnow()
+    synced: List[str] = []
+    rows: Dict[str, Dict[str, Any]] = {}
+    for dev_data in devices_data:
+        mac = dev_data.get("mac_address")
+        if not mac:
+            continue
+        synced.append(mac)
+        row = rows.setdefault(mac, {
+            "owner_id": owner_id,
+            "mac_address": mac,
+            **{field: None for field in SYNC_FIELDS},
+            "first_seen": now,
+            "last_seen": now,
+            "is_active": True,
+            "data_cap": default_cap,
+            "created_at": now,
+            "updated_at": now,
+        })
+        # Later reports of the same MAC win, but never blank out a field.
+        for field in SYNC_FIELDS:
+            row[field] = dev_data.get(field) or row[field]
+
+    bulk_upsert(
+        Device,
+        list(rows.values()),
+        index_elements=["mac_address"],
+        update_columns=["last_seen", "is_active", "updated_at"],
+        coalesce_columns=list(SYNC_FIELDS),
+    )
+    if rows:
+        bump_generations([owner_id])
     db.session.commit()
+    return synced
@@ -0,0 +1,298 @@
+"""Pub/sub bus feeding the live event stream.
+
+Writers stage events with ``stage_events``, which adds them to the
+``stream_events`` outbox in the writer's own transaction, so subscribers
+never see data that was not stored. Every serving process polls the outbox
+for the owners it has streams open for, so an event reaches its owner's
+streams whichever process committed it. Writers only stage events for owners
+in ``stream_listeners``, which each process keeps fresh for its open streams.
+
+Publishing never blocks: each subscription buffers its own pending events.
+Usage deltas for the same device are merged while they wait, and the other
+event kinds are bounded, dropping the oldest. A slow reader therefore gets
+fewer, larger messages and, after an overflow, an ``overflow`` event telling
+it to refetch.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from flask import Flask, current_app, has_app_context
+from sqlalchemy import insert
+from ..extensions import db
+from ..models import StreamEvent, StreamListener, bulk_upsert
+
+
+logger = logging.getLogger(__name__)
+_create_lock = threading.Lock()
+
+USAGE_EVENT = "usage"
+ALERT_EVENT = "alert"
+OVERFLOW_EVENT = "overflow"
+
+# A process refreshes its owners' listener rows every third of this.
+LISTENER_TTL = timedelta(seconds=30)
+# Transactions can commit out of id order; events this recent are re-read
+# on every poll and de-duplicated by id.
+COMMIT_GRACE = timedelta(seconds=10)
+# Outbox rows older than this have been seen by every poller and are pruned.
+EVENT_TTL = timedelta(minutes=2)
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """One connection's buffer of pending events."""
+
+    def __init__(self, owner_id: int, max_pending: int = 100):
+        self.owner_id = owner_id
+        self.max_pending = max_pending
+        self.closed = False
+        self.opened_at = datetime.utcnow()
+        self.coalesced = 0
+        self._usage: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._events: deque = deque()
+        self._dropped = 0
+        self._cond = threading.Condition()
+
+    def offer(self, event_type: str, data: Dict[str, Any]) -> None:
+        with self._cond:
+            if event_type == USAGE_EVENT:
+                pending = self._usage.get(data["device_id"])
+                if pending is None:
+                    self._usage[data["device_id"]] = dict(data)
+                else:
+                    pending["bytes_uploaded"] += data["bytes_uploaded"]
+                    pending["bytes_downloaded"] += data["bytes_downloaded"]
+                    pending["samples"] += data["samples"]
+                    pending["timestamp"] = max(pending["timestamp"], data["timestamp"])
+                    self.coalesced += 1
+            else:
+                if len(self._events) >= self.max_pending:
+                    self._events.popleft()
+                    self._dropped += 1
+                self._events.append((event_type, data))
+            self._cond.notify()
+
+    def next_batch(self, timeout: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Wait up to ``timeout`` for events and take everything pending."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or self._usage or self._events, timeout)
+            batch: List[Tuple[str, Dict[str, Any]]] = []
+            if self._dropped:
+                batch.append((OVERFLOW_EVENT, {"dropped": self._dropped}))
+                self._dropped = 0
+            batch.extend(self._events)
+            batch.extend((USAGE_EVENT, data) for data in self._usage.values())
+            self._events.clear()
+            self._usage.clear()
+            return batch
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class EventBus:
+    """Fan out per-owner events from the outbox to this process's live subscriptions."""
+
+    def __init__(self, max_pending: int = 100, max_subscribers_per_owner: int = 20, poll_seconds: float = 1.0):
+        self.max_pending = max_pending
+        self.max_subscribers_per_owner = max_subscribers_per_owner
+        self.poll_seconds = poll_seconds
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_poll = 0.0
+        self._last_announce = 0.0
+        self._last_prune = 0.0
+        self._seen: Dict[int, datetime] = {}
+        self._listeners: Set[int] = set()
+        self._listeners_loaded: Optional[float] = None
+        self._polls = 0
+
+    def subscribe(self, owner_id: int) -> Subscription:
+        """Open a subscription and announce the owner as listening; needs an app context."""
+        with self._lock:
+            subscribers = self._subscribers.setdefault(owner_id, set())
+            if len(subscribers) >= self.max_subscribers_per_owner:
+                raise TooManySubscribers(f"At most {self.max_subscribers_per_owner} live streams per user")
+            subscription = Subscription(owner_id, self.max_pending)
+            subscribers.add(subscription)
+        self._announce([owner_id])
+        db.session.commit()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.owner_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.owner_id]
+
+    def has_subscribers(self, owner_id: int) -> bool:
+        return bool(self._subscribers.get(owner_id))
+
+    def listening_owners(self) -> Set[int]:
+        """Owners with an open stream on any process, re-read at most every ``poll_seconds``."""
+        with self._lock:
+            local = set(self._subscribers)
+            stale = self._listeners_loaded is None or time.monotonic() - self._listeners_loaded >= self.poll_seconds
+        if stale:
+            rows = db.session.query(StreamListener.owner_id).filter(StreamListener.expires_at > datetime.utcnow())
+            listeners = {owner_id for (owner_id,) in rows}
+            with self._lock:
+                self._listeners, self._listeners_loaded = listeners, time.monotonic()
+        return local | self._listeners
+
+    def publish(self, owner_id: int, events: Iterable[Tuple[str, Dict[str, Any], datetime]]) -> None:
+        """Offer ``(event_type, data, created_at)`` events to subscriptions opened before they were created."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(owner_id, ()))
+        if not subscribers:
+            return
+        events = list(events)
+        for subscription in subscribers:
+            for event_type, data, created_at in events:
+                if created_at >= subscription.opened_at:
+                    subscription.offer(event_type, data)
+
+    def pump(self, app: Flask) -> None:
+        """Poll the outbox for this process's subscribers, at most every ``poll_seconds``.
+
+        Called by every open stream; whichever gets here first does the poll
+        for all of them and the others return at once.
+        """
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_poll < self.poll_seconds:
+                return
+            self._last_poll = time.monotonic()
+            with self._lock:
+                owners = sorted(self._subscribers)
+            if not owners:
+                return
+            with app.app_context():
+                try:
+                    self._poll(owners)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Polling stream events failed")
+                finally:
+                    db.session.remove()
+        finally:
+            self._poll_lock.release()
+
+    def _poll(self, owners: List[int]) -> None:
+        now = datetime.utcnow()
+        since = now - COMMIT_GRACE
+        rows = (
+            db.session.query(
+                StreamEvent.id, StreamEvent.owner_id, StreamEvent.event_type, StreamEvent.payload, StreamEvent.created_at
+            )
+            .filter(StreamEvent.created_at >= since, StreamEvent.owner_id.in_(owners))
+            .order_by(StreamEvent.id)
+            .all()
+        )
+        self._seen = {event_id: created_at for event_id, created_at in self._seen.items() if created_at >= since}
+        by_owner: Dict[int, List[Tuple[str, Dict[str, Any], datetime]]] = defaultdict(list)
+        for event_id, owner_id, event_type, payload, created_at in rows:
+            if event_id not in self._seen:
+                self._seen[event_id] = created_at
+                by_owner[owner_id].append((event_type, json.loads(payload), created_at))
+
+        if time.monotonic() - self._last_announce >= LISTENER_TTL.total_seconds() / 3:
+            self._announce(owners)
+        if time.monotonic() - self._last_prune >= EVENT_TTL.total_seconds():
+            self._last_prune = time.monotonic()
+            StreamEvent.query.filter(StreamEvent.created_at < now - EVENT_TTL).delete(synchronize_session=False)
+            StreamListener.query.filter(StreamListener.expires_at < now).delete(synchronize_session=False)
+        db.session.commit()
+        self._polls += 1
+
+        for owner_id, events in by_owner.items():
+            self.publish(owner_id, events)
+
+    def _announce(self, owner_ids: List[int]) -> None:
+        """Mark owners as listening for another ``LISTENER_TTL``; the caller commits."""
+        self._last_announce = time.monotonic()
+        expires_at = datetime.utcnow() + LISTENER_TTL
+        bulk_upsert(
+            StreamListener,
+            [{"owner_id": owner_id, "expires_at": expires_at} for owner_id in owner_ids],
+            index_elements=["owner_id"],
+            update_columns=["expires_at"],
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            subscriptions = [s for subscribers in self._subscribers.values() for s in subscribers]
+        return {
+            "owners": len({s.owner_id for s in subscriptions}),
+            "subscriptions": len(subscriptions),
+            "coalesced": sum(s.coalesced for s in subscriptions),
+            "polls": self._polls,
+        }
+
+
+def get_event_bus(app: Flask) -> EventBus:
+    """Return the app's event bus, creating it on first use."""
+    with _create_lock:
+        bus = app.extensions.get("event_bus")
+        if bus is None:
+            bus = EventBus(
+                max_pending=app.config.get("STREAM_MAX_PENDING", 100),
+                max_subscribers_per_owner=app.config.get("STREAM_MAX_SUBSCRIBERS_PER_OWNER", 20),
+                poll_seconds=app.config.get("STREAM_POLL_SECONDS", 1.0),
+            )
+            app.extensions["event_bus"] = bus
+        return bus
+
+
+def wants_events(owner_id: int) -> bool:
+    """Whether anyone is listening on any process, so writers can skip building payloads."""
+    return has_app_context() and int(owner_id) in get_event_bus(current_app).listening_owners()
+
+
+def stage_events(owner_id: int, events: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """Write events for ``owner_id`` to the outbox; they are streamed once the session commits."""
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            "owner_id": int(owner_id),
+            "event_type": event_type,
+            "payload": json.dumps(data, separators=(",", ":")),
+            "created_at": created_at,
+        }
+        for event_type, data in events
+    ]
+    if rows:
+        db.session.execute(insert(StreamEvent), rows)
+
+
+def usage_events(rows: Iterable[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Usage deltas for ingested ``device_stats`` rows."""
+    return [
+        (USAGE_EVENT, {
+            "device_id": row["device_id"],
+            "bytes_uploaded": row["bytes_uploaded"],
+            "bytes_downloaded": row["bytes_downloaded"],
+            "samples": 1,
+            "timestamp": _isoformat(row["timestamp"]),
+        })
+        for row in rows
+    ]
+
+
+def _isoformat(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
@@ -0,0 +1,200 @@
+"""Streaming export of raw device usage history."""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+from sqlalchemy import select
+from ..extensions import db
+from ..models import Device, stats_source
+
+
+# Rows fetched per server-side cursor batch.
+EXPORT_BATCH_ROWS = 5000
+
+# Encoded output is buffered up to roughly this many bytes per yielded chunk.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_COLUMNS = ("device_id", "mac_address", "timestamp", "bytes_uploaded", "bytes_downloaded")
+
+# Format name (also the file extension) -> content type.
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_rows(
+    owner_id: int,
+    device_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_ROWS,
+) -> Iterator[Tuple]:
+    """Yield ``EXPORT_COLUMNS`` tuples ordered by device and time.
+
+    Rows come from a server-side cursor in batches of ``batch_size`` so only
+    one batch is held in memory, and only partitions overlapping the range
+    are read.
+    """
+    source = stats_source(start, end)
+    devices = Device.__table__
+    stmt = (
+        select(
+            source.c.device_id,
+            devices.c.mac_address,
+            source.c.timestamp,
+            source.c.bytes_uploaded,
+            source.c.bytes_downloaded,
+        )
+        .join(devices, devices.c.id == source.c.device_id)
+        .where(devices.c.owner_id == owner_id)
+        .order_by(source.c.device_id, source.c.timestamp)
+    )
+    if device_id is not None:
+        stmt = stmt.where(source.c.device_id == device_id)
+    if start is not None:
+        stmt = stmt.where(source.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(source.c.timestamp < end)
+
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size, stream_results=True))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def _buffered(pieces: Iterable[str]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def ndjson_chunks(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    def lines():
+        for device_id, mac, ts, uploaded, downloaded in rows:
+            yield json.dumps({
+                "device_id": device_id,
+                "mac_address": mac,
+                "timestamp": ts.isoformat(),
+                "bytes_uploaded": uploaded,
+                "bytes_downloaded": downloaded,
+            }) + "\n"
+
+    return _buffered(lines())
+
+
+def csv_chunks(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    def lines():
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(EXPORT_COLUMNS)
+        for device_id, mac, ts, uploaded, downloaded in rows:
+            writer.writerow((device_id, mac, ts.isoformat(), uploaded, downloaded))
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        yield out.getvalue()
+
+    return _buffered(lines())
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose contents are taken out after each row group."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_chunks(rows: Iterable[Tuple], batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """Write one Parquet row group per ``batch_size`` rows and yield bytes as they are produced."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export requires pyarrow")
+
+    schema = pa.schema([
+        ("device_id", pa.int64()),
+        ("mac_address", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("bytes_uploaded", pa.int64()),
+        ("bytes_downloaded", pa.int64()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def write(batch):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_export(fmt: str, rows: Iterable[Tuple]) -> Iterator[bytes]:
+    if fmt == "ndjson":
+        return ndjson_chunks(rows)
+    if fmt == "csv":
+        return csv_chunks(rows)
+    if fmt == "parquet":
+        return parquet_chunks(rows)
+    raise ExportError(f"Unsupported export format: {fmt}")
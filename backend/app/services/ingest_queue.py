@@ -0,0 +1,299 @@
+"""Durable write-behind queue for agent stats uploads.
+
+Accepted payloads are appended to a local SQLite file (separate from the main
+database, so enqueueing never waits on stats writes) and drained by
+background writers that fold many payloads into one bulk ingest transaction.
+Entries are leased while being written and only deleted once the ingest
+commits, so a crashed writer's batch is picked up again after the lease.
+Failed writes are retried with exponential backoff. Only errors that are not
+about reaching the database count towards ``max_attempts``; entries that run
+out of attempts stay in the file as dead letters until an admin requeues them.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+from flask import Flask
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from ..extensions import db
+from .ingest_service import ingest_queued_payloads
+
+
+logger = logging.getLogger(__name__)
+_create_lock = threading.Lock()
+
+# Errors reaching the database rather than about the payload: retried without
+# spending an attempt, so an outage cannot dead-letter accepted payloads.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner_id INTEGER NOT NULL,
+    received_at TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    last_error TEXT,
+    agent_id INTEGER,
+    batch_id INTEGER,
+    retries INTEGER NOT NULL DEFAULT 0
+)
+"""
+# Columns added after the first release; added in place to existing queue files.
+_ADDED_COLUMNS = {"agent_id": "INTEGER", "batch_id": "INTEGER", "retries": "INTEGER NOT NULL DEFAULT 0"}
+
+
+class QueuedEntry(NamedTuple):
+    id: int
+    owner_id: int
+    received_at: datetime
+    stats: List[Dict[str, Any]]
+    agent_id: Optional[int]
+    batch_id: Optional[int]
+
+
+class QueueFull(Exception):
+    """Raised when the queue is at its configured depth limit."""
+
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"Ingest queue is full ({depth} entries)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class IngestQueue:
+    """Append-only SQLite queue of ``(owner_id, received_at, stats)`` entries."""
+
+    def __init__(
+        self,
+        path: str,
+        max_depth: int = 10000,
+        max_attempts: int = 5,
+        lease_seconds: float = 60,
+        retry_after_seconds: int = 5,
+        backoff_seconds: float = 2,
+        max_backoff_seconds: float = 300,
+    ):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {"enqueued": 0, "rejected": 0, "batches_written": 0, "entries_written": 0, "failures": 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(_SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(ingest_queue)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE ingest_queue ADD COLUMN {column} {column_type}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # An accepted (202) payload must survive power loss, not just a crash.
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def depth(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM ingest_queue WHERE attempts < ?", (self.max_attempts,)
+        ).fetchone()[0]
+
+    def enqueue(
+        self,
+        owner_id: int,
+        stats: List[Dict[str, Any]],
+        received_at: Optional[datetime] = None,
+        agent_id: Optional[int] = None,
+        batch_id: Optional[int] = None,
+    ) -> int:
+        """Durably append a payload. Raises QueueFull when at ``max_depth``."""
+        depth = self.depth()
+        if depth >= self.max_depth:
+            self.record("rejected")
+            raise QueueFull(depth, self.retry_after_seconds)
+        received_at = received_at or datetime.utcnow()
+        cursor = self._connect().execute(
+            "INSERT INTO ingest_queue (owner_id, received_at, payload, agent_id, batch_id) VALUES (?, ?, ?, ?, ?)",
+            (owner_id, received_at.isoformat(), json.dumps(stats, separators=(",", ":")), agent_id, batch_id),
+        )
+        self.record("enqueued")
+        return cursor.lastrowid
+
+    def claim(self, limit: int) -> List[QueuedEntry]:
+        """Lease up to ``limit`` of the oldest available entries."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, owner_id, received_at, payload, agent_id, batch_id FROM ingest_queue "
+                "WHERE attempts < ? AND (lease_until IS NULL OR lease_until < ?) "
+                "ORDER BY id LIMIT ?",
+                (self.max_attempts, now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE ingest_queue SET lease_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            QueuedEntry(entry_id, owner_id, datetime.fromisoformat(received_at), json.loads(payload), agent_id, batch_id)
+            for entry_id, owner_id, received_at, payload, agent_id, batch_id in rows
+        ]
+
+    def ack(self, ids: List[int]) -> None:
+        if ids:
+            self._connect().executemany("DELETE FROM ingest_queue WHERE id = ?", [(i,) for i in ids])
+
+    def release(self, ids: List[int], error: str, charge: bool = True) -> None:
+        """Return entries to the queue after a failed write, claimable again after a backoff.
+
+        The delay doubles with every failure of the entry, up to
+        ``max_backoff_seconds``. With ``charge`` the failure also counts
+        towards ``max_attempts``, after which the entry is a dead letter.
+        """
+        if ids:
+            self._connect().executemany(
+                "UPDATE ingest_queue SET attempts = attempts + ?, retries = retries + 1, "
+                "lease_until = ? + MIN(?, ? * (1 << MIN(retries, 20))), last_error = ? WHERE id = ?",
+                [
+                    (int(charge), time.time(), self.max_backoff_seconds, self.backoff_seconds, error[:500], i)
+                    for i in ids
+                ],
+            )
+
+    def requeue_dead_letters(self, ids: Optional[List[int]] = None) -> int:
+        """Make dead letters (all, or those in ``ids``) claimable again with fresh attempts."""
+        sql = "UPDATE ingest_queue SET attempts = 0, retries = 0, lease_until = NULL WHERE attempts >= ?"
+        conn = self._connect()
+        if ids is None:
+            return conn.execute(sql, (self.max_attempts,)).rowcount
+        return sum(conn.execute(sql + " AND id = ?", (self.max_attempts, i)).rowcount for i in ids)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        depth, oldest = conn.execute(
+            "SELECT COUNT(*), MIN(received_at) FROM ingest_queue WHERE attempts < ?", (self.max_attempts,)
+        ).fetchone()
+        dead = conn.execute(
+            "SELECT COUNT(*) FROM ingest_queue WHERE attempts >= ?", (self.max_attempts,)
+        ).fetchone()[0]
+        age = (datetime.utcnow() - datetime.fromisoformat(oldest)).total_seconds() if oldest else 0.0
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "oldest_age_seconds": round(age, 3),
+            "dead_letters": dead,
+        }
+
+
+def get_ingest_queue(app: Flask) -> IngestQueue:
+    """Return the app's ingest queue, opening it on first use."""
+    with _create_lock:
+        queue = app.extensions.get("ingest_queue")
+        if queue is None:
+            path = app.config.get("INGEST_QUEUE_PATH") or os.path.join(app.instance_path, "ingest_queue.db")
+            queue = IngestQueue(
+                path,
+                max_depth=app.config.get("INGEST_QUEUE_MAX_DEPTH", 10000),
+                max_attempts=app.config.get("INGEST_QUEUE_MAX_ATTEMPTS", 5),
+                retry_after_seconds=app.config.get("INGEST_QUEUE_RETRY_AFTER_SECONDS", 5),
+                backoff_seconds=app.config.get("INGEST_QUEUE_BACKOFF_SECONDS", 2),
+                max_backoff_seconds=app.config.get("INGEST_QUEUE_MAX_BACKOFF_SECONDS", 300),
+            )
+            app.extensions["ingest_queue"] = queue
+        return queue
+
+
+def drain_once(app: Flask, queue: IngestQueue, batch_size: int) -> int:
+    """Write one batch of queued payloads. Returns entries written."""
+    entries = queue.claim(batch_size)
+    if not entries:
+        return 0
+    return _write_entries(app, queue, entries)
+
+
+def _write_entries(app: Flask, queue: IngestQueue, entries: List[QueuedEntry]) -> int:
+    """Write ``entries`` in one transaction; on failure retry each half on its own.
+
+    Splitting isolates a payload that can never be written, so only that
+    entry is released (and eventually dead-lettered) instead of every entry
+    that happened to share its batch. When the database itself is failing
+    the whole batch is released without spending an attempt.
+    """
+    with app.app_context():
+        try:
+            ingest_queued_payloads([
+                (entry.owner_id, entry.stats, entry.agent_id, entry.batch_id) for entry in entries
+            ])
+        except TRANSIENT_ERRORS as exc:
+            db.session.rollback()
+            queue.record("failures")
+            queue.release([entry.id for entry in entries], repr(exc), charge=False)
+            logger.warning("Database unavailable, backing off %d queued ingest payload(s): %r", len(entries), exc)
+            return 0
+        except Exception as exc:
+            db.session.rollback()
+            queue.record("failures")
+            if len(entries) > 1:
+                logger.warning("Failed to write %d queued ingest payload(s), splitting: %r", len(entries), exc)
+                half = len(entries) // 2
+                return _write_entries(app, queue, entries[:half]) + _write_entries(app, queue, entries[half:])
+            queue.release([entries[0].id], repr(exc))
+            logger.exception("Failed to write queued ingest payload %d", entries[0].id)
+            return 0
+        finally:
+            db.session.remove()
+    ids = [entry.id for entry in entries]
+    queue.ack(ids)
+    queue.record("batches_written")
+    queue.record("entries_written", len(ids))
+    return len(ids)
+
+
+def start_ingest_writers(app: Flask, workers: int = 1, batch_size: int = 200, idle_seconds: float = 0.5) -> List[threading.Thread]:
+    """Drain the ingest queue on ``workers`` daemon threads."""
+    queue = get_ingest_queue(app)
+
+    def run() -> None:
+        while True:
+            try:
+                written = drain_once(app, queue, batch_size)
+            except Exception:
+                logger.exception("Ingest writer failed")
+                written = 0
+            if not written:
+                time.sleep(idle_seconds)
+
+    threads = []
+    for i in range(workers):
+        thread = threading.Thread(target=run, name=f"ingest-writer-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
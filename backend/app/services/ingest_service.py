@@ -0,0 +1,182 @@
+"""Bulk usage ingestion services."""
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import insert
+from ..extensions import db
+from ..models import Device, DeviceStat
+from . import alert_service, batch_dedup, counter_service
+from .event_bus import stage_events, usage_events, wants_events
+from .response_cache import bump_generations
+
+
+# Keep IN lists below SQLite's historical 999 bound-parameter limit.
+MAC_LOOKUP_CHUNK = 900
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def resolve_device_ids(macs: Iterable[str]) -> Dict[str, int]:
+    """Map MAC addresses to device ids with one IN query per chunk."""
+    unique = list(dict.fromkeys(m for m in macs if m))
+    resolved: Dict[str, int] = {}
+    for chunk in _chunks(unique, MAC_LOOKUP_CHUNK):
+        rows = db.session.query(Device.mac_address, Device.id).filter(Device.mac_address.in_(chunk)).all()
+        resolved.update({mac: device_id for mac, device_id in rows})
+    return resolved
+
+
+def _stat_rows(
+    stats_data: List[Dict[str, Any]], device_ids: Dict[str, int], timestamp: datetime
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Build device_stats rows for known MACs; unknown MACs are skipped."""
+    rows = []
+    ingested = []
+    for stat in stats_data:
+        mac = stat.get("mac_address")
+        device_id = device_ids.get(mac) if mac else None
+        if device_id is None:
+            continue
+        rows.append({
+            "device_id": device_id,
+            "timestamp": timestamp,
+            "bytes_uploaded": int(stat.get("bytes_uploaded") or 0),
+            "bytes_downloaded": int(stat.get("bytes_downloaded") or 0),
+        })
+        ingested.append(mac)
+    return rows, ingested
+
+
+def ingest_stats_batch(
+    owner_id: int,
+    stats_data: List[Dict[str, Any]],
+    now: Optional[datetime] = None,
+    agent_id: Optional[int] = None,
+    batch_id: Optional[int] = None,
+) -> dict:
+    """Insert a batch of agent stats and evaluate usage alerts in one transaction.
+
+    Unknown MACs are skipped, matching the per-row behaviour this replaces.
+    With a ``batch_id`` the batch is claimed in the same transaction and a
+    batch the agent already sent is skipped (``batch_status`` says why).
+    Returns the ingested MACs plus per-phase timings in milliseconds.
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+
+    if batch_id is not None:
+        status = batch_dedup.claim_batches([(agent_id, batch_id)])[0]
+        if status != batch_dedup.NEW:
+            db.session.rollback()
+            return {"ingested_count": 0, "ingested_macs": [], "alerts_triggered": 0, "batch_status": status}
+
+    phase = time.perf_counter()
+    device_ids = resolve_device_ids(stat.get("mac_address") for stat in stats_data)
+    resolve_ms = _elapsed_ms(phase)
+
+    rows, ingested = _stat_rows(stats_data, device_ids, now)
+
+    # Counters first: a device's first counter is seeded from the stats stored before this batch.
+    phase = time.perf_counter()
+    counter_service.apply_usage_deltas(rows, now)
+    counters_ms = _elapsed_ms(phase)
+
+    phase = time.perf_counter()
+    if rows:
+        db.session.execute(insert(DeviceStat), rows)
+    insert_ms = _elapsed_ms(phase)
+
+    phase = time.perf_counter()
+    triggered = alert_service.evaluate_usage_alerts_batch(owner_id, rows) if rows else []
+    alerts_ms = _elapsed_ms(phase)
+
+    phase = time.perf_counter()
+    if rows:
+        bump_generations([owner_id])
+        if wants_events(owner_id):
+            stage_events(owner_id, usage_events(rows))
+    db.session.commit()
+    commit_ms = _elapsed_ms(phase)
+
+    timings = {
+        "resolve_ms": resolve_ms,
+        "insert_ms": insert_ms,
+        "counters_ms": counters_ms,
+        "alerts_ms": alerts_ms,
+        "commit_ms": commit_ms,
+        "total_ms": _elapsed_ms(started),
+    }
+    current_app.logger.debug(
+        "Ingested %d/%d stats for owner %s: %s", len(rows), len(stats_data), owner_id, timings
+    )
+
+    return {
+        "ingested_count": len(ingested),
+        "ingested_macs": ingested,
+        "alerts_triggered": len(triggered),
+        "batch_status": batch_dedup.NEW if batch_id is not None else None,
+        "timings_ms": timings,
+    }
+
+
+QueuedPayload = Tuple[int, List[Dict[str, Any]], Optional[int], Optional[int]]
+
+
+def ingest_queued_payloads(payloads: List[QueuedPayload], now: Optional[datetime] = None) -> dict:
+    """Write many queued ``(owner_id, stats, agent_id, batch_id)`` payloads in one transaction.
+
+    Rows are stamped with the write time, not the time their payload was
+    received: by the time a payload drains, compaction may already have
+    closed the buckets it was received in and would never read it. Batch
+    ids are claimed in the same transaction, so a payload queued twice (or
+    rewritten after a writer crashed before acking) is only counted once.
+    MACs are resolved, rows inserted and counters updated once for the
+    whole set; alerts are evaluated once per owner.
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    numbered = [(agent_id, batch_id) for _, _, agent_id, batch_id in payloads if batch_id is not None]
+    statuses = iter(batch_dedup.claim_batches(numbered))
+    fresh = [payload for payload in payloads if payload[3] is None or next(statuses) == batch_dedup.NEW]
+    duplicates = len(payloads) - len(fresh)
+    payloads = fresh
+    device_ids = resolve_device_ids(
+        stat.get("mac_address") for _, stats_data, _, _ in payloads for stat in stats_data
+    )
+
+    rows_by_owner: Dict[int, List[Dict[str, Any]]] = {}
+    for owner_id, stats_data, _, _ in payloads:
+        rows, _ = _stat_rows(stats_data, device_ids, now)
+        rows_by_owner.setdefault(owner_id, []).extend(rows)
+
+    all_rows = [row for rows in rows_by_owner.values() for row in rows]
+    if all_rows:
+        counter_service.apply_usage_deltas(all_rows, now)
+        db.session.execute(insert(DeviceStat), all_rows)
+    triggered = 0
+    for owner_id, rows in rows_by_owner.items():
+        if rows:
+            triggered += len(alert_service.evaluate_usage_alerts_batch(owner_id, rows))
+    bump_generations(owner_id for owner_id, rows in rows_by_owner.items() if rows)
+    for owner_id, rows in rows_by_owner.items():
+        if rows and wants_events(owner_id):
+            stage_events(owner_id, usage_events(rows))
+    db.session.commit()
+
+    current_app.logger.debug(
+        "Wrote %d queued payload(s), %d stats in %.3f ms", len(payloads), len(all_rows), _elapsed_ms(started)
+    )
+    return {
+        "payloads": len(payloads),
+        "duplicates": duplicates,
+        "ingested_count": len(all_rows),
+        "alerts_triggered": triggered,
+    }
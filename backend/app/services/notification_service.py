@@ -0,0 +1,84 @@
+"""Alert digests and notification delivery."""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+from flask import current_app
+from sqlalchemy import func, insert
+from ..extensions import db
+from ..models import Alert, AlertHistory, Notification, NotificationDelivery, bulk_upsert
+from .voice_dispatcher import get_voice_dispatcher, voice_alert_types
+
+
+DIGEST_NOTIFICATION_TYPE = "alert_digest"
+
+
+def _digest_message(counts: Dict[str, int], since: datetime) -> str:
+    total = sum(counts.values())
+    parts = ", ".join(f"{count} {alert_type}" for alert_type, count in sorted(counts.items()))
+    noun = "alert" if total == 1 else "alerts"
+    return f"{total} {noun} since {since.strftime('%Y-%m-%d %H:%M')} UTC: {parts}."
+
+
+def create_alert_digests(since: datetime, until: datetime) -> int:
+    """Write one digest notification per user with alerts in ``[since, until)``.
+
+    Counts come from one grouped query. Returns notifications created.
+    """
+    rows = (
+        db.session.query(Alert.user_id, Alert.alert_type, func.count(AlertHistory.id))
+        .join(AlertHistory, AlertHistory.alert_id == Alert.id)
+        .filter(AlertHistory.triggered_at >= since, AlertHistory.triggered_at < until)
+        .group_by(Alert.user_id, Alert.alert_type)
+        .all()
+    )
+    counts: Dict[int, Dict[str, int]] = defaultdict(dict)
+    for user_id, alert_type, count in rows:
+        counts[user_id][alert_type] = count
+
+    notifications = [
+        {
+            "user_id": user_id,
+            "message": _digest_message(by_type, since),
+            "notification_type": DIGEST_NOTIFICATION_TYPE,
+            "is_read": False,
+            "created_at": until,
+            "updated_at": until,
+        }
+        for user_id, by_type in counts.items()
+    ]
+    if notifications:
+        db.session.execute(insert(Notification), notifications)
+    db.session.commit()
+    return len(notifications)
+
+
+def deliver_notifications(now: datetime) -> int:
+    """Hand notifications not delivered yet to the voice service, and mark them delivered.
+
+    Only types listed in ``VOICE_SERVICE_ALERT_TYPES`` are spoken, as for
+    alerts, so digests (``alert_digest``) are opt-in. Notifications older
+    than ``NOTIFICATION_DELIVERY_MAX_AGE_SECONDS`` are too stale to speak.
+    One the dispatcher drops stays undelivered and is retried next run.
+    Returns notifications submitted; 0 when no voice service is configured.
+    """
+    dispatcher = get_voice_dispatcher(current_app)
+    if dispatcher is None:
+        return 0
+    max_age = timedelta(seconds=current_app.config.get("NOTIFICATION_DELIVERY_MAX_AGE_SECONDS", 86400))
+    query = (
+        Notification.query.outerjoin(NotificationDelivery, NotificationDelivery.notification_id == Notification.id)
+        .filter(NotificationDelivery.notification_id.is_(None), Notification.created_at > now - max_age)
+    )
+    allowed_types = voice_alert_types(current_app)
+    if allowed_types:
+        query = query.filter(func.lower(Notification.notification_type).in_(allowed_types))
+    notifications: List[Notification] = query.order_by(Notification.id).all()
+
+    delivered = []
+    for notification in notifications:
+        payload = {"message": notification.message, "alert_type": notification.notification_type}
+        if dispatcher.submit(("notification", notification.id), payload):
+            delivered.append({"notification_id": notification.id, "delivered_at": now})
+    bulk_upsert(NotificationDelivery, delivered, index_elements=["notification_id"])
+    db.session.commit()
+    return len(delivered)
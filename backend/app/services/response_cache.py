@@ -0,0 +1,153 @@
+"""Per-owner response cache and conditional GET for dashboard read endpoints.
+
+Each owner has a generation counter in ``owner_generations``. A write that
+changes what the owner's dashboards show bumps it in the same transaction.
+Whoever commits does the bump; helpers called with ``commit=False`` leave it
+to their caller. Cached bodies and ETags are tied to the generation they were
+built at, so an unchanged poll costs one counter lookup. A matching
+``If-None-Match`` gets a 304, and a warm entry is replayed without running the
+endpoint's queries.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Dict, Iterable, Optional, Tuple
+from flask import Flask, current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select, update
+from ..extensions import db
+from ..models import OwnerGeneration, bulk_upsert
+
+
+_create_lock = threading.Lock()
+
+
+def bump_generations(owner_ids: Iterable[int]) -> None:
+    """Invalidate cached responses of ``owner_ids`` once the transaction commits."""
+    ids = sorted({int(owner_id) for owner_id in owner_ids if owner_id is not None})
+    if not ids:
+        return
+    bulk_upsert(OwnerGeneration, [{"owner_id": owner_id, "generation": 0} for owner_id in ids], index_elements=["owner_id"])
+    table = OwnerGeneration.__table__
+    db.session.execute(
+        update(table).where(table.c.owner_id.in_(ids)).values(generation=table.c.generation + 1)
+    )
+
+
+def bump_all_generations() -> None:
+    """Invalidate every owner's cached responses, e.g. after retention deletes data."""
+    table = OwnerGeneration.__table__
+    db.session.execute(update(table).values(generation=table.c.generation + 1))
+
+
+def current_generation(owner_id: int) -> int:
+    generation = db.session.execute(
+        select(OwnerGeneration.generation).where(OwnerGeneration.owner_id == owner_id)
+    ).scalar()
+    return generation or 0
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    body: bytes
+    mimetype: str
+
+
+class ResponseCache:
+    """Thread-safe LRU of rendered response bodies."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+def get_response_cache(app: Flask) -> ResponseCache:
+    """Return the app's response cache, creating it on first use."""
+    with _create_lock:
+        cache = app.extensions.get("response_cache")
+        if cache is None:
+            cache = ResponseCache(max_entries=app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 2048))
+            app.extensions["response_cache"] = cache
+        return cache
+
+
+def _etag(key: Tuple, generation: int, epoch: int) -> str:
+    return hashlib.blake2b(repr((key, generation, epoch)).encode(), digest_size=12).hexdigest()
+
+
+def cached_response(view):
+    """Serve a JWT-protected GET from the owner's response cache.
+
+    Apply below ``@jwt_required()``. The cache key is the owner, path and
+    query string. Only 200 responses are cached. Endpoints with relative time
+    windows (``hours=24``) drift without any write, so ETags also roll over
+    every ``RESPONSE_CACHE_TTL_SECONDS``.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        app = current_app._get_current_object()
+        if not app.config.get("RESPONSE_CACHE_ENABLED", True):
+            return view(*args, **kwargs)
+
+        owner_id = int(get_jwt_identity())
+        # Read before the view runs: a write landing in between yields newer
+        # data under the older tag, which the next poll simply refetches.
+        generation = current_generation(owner_id)
+        ttl = app.config.get("RESPONSE_CACHE_TTL_SECONDS") or 0
+        epoch = int(time.time() // ttl) if ttl else 0
+        key = (owner_id, request.path, tuple(sorted(request.args.items(multi=True))))
+        etag = _etag(key, generation, epoch)
+        cache = get_response_cache(app)
+
+        if request.if_none_match.contains_weak(etag):
+            cache.record("not_modified")
+            response = app.response_class(status=304)
+        else:
+            entry = cache.get(key)
+            if entry is not None and entry.etag == etag:
+                cache.record("hits")
+                response = app.response_class(entry.body, mimetype=entry.mimetype)
+            else:
+                cache.record("misses")
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cache.put(key, CachedResponse(etag, response.get_data(), response.mimetype))
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
@@ -0,0 +1,210 @@
+"""Retention pruning of raw stats and rollups.
+
+Each resolution keeps data for its own ``RETENTION_*_DAYS`` (0 keeps it
+forever) but is never pruned past what the next coarser level has compacted
+from it, so history is downsampled rather than lost. Whole raw month
+partitions are dropped; every other row goes in ``RETENTION_CHUNK_ROWS``-row
+transactions, so ingest never waits behind one long delete. Each prune
+records its cutoff in ``retention_cutoffs`` so readers of raw history can say
+where it now starts.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from flask import current_app
+from sqlalchemy import func, select, text
+from ..extensions import db
+from ..models import (
+    ROLLUP_MODELS,
+    RetentionCutoff,
+    bulk_upsert,
+    delete_device_stats,
+    delete_in_chunks,
+    drop_partitions_before,
+    partitions_before,
+)
+from ..models.partitions import partition_month, partition_table, stat_tables
+from ..models.rollups import rollup_watermarks
+from .response_cache import bump_all_generations
+from .rollup_service import delete_device_rollups
+
+
+logger = logging.getLogger(__name__)
+
+# Config key holding the retention in days for raw stats and each rollup level.
+RETENTION_CONFIG = {
+    0: "RETENTION_RAW_DAYS",
+    60: "RETENTION_MINUTE_DAYS",
+    3600: "RETENTION_HOUR_DAYS",
+    86400: "RETENTION_DAY_DAYS",
+}
+
+# Resolutions finest first; each level is compacted from the one before it.
+_RESOLUTIONS: List[int] = [0] + [model.resolution_seconds for model in ROLLUP_MODELS]
+
+
+def _retention(resolution_seconds: int) -> Optional[timedelta]:
+    days = current_app.config.get(RETENTION_CONFIG[resolution_seconds]) or 0
+    return timedelta(days=days) if days > 0 else None
+
+
+def retention_cutoff(resolution_seconds: int, now: datetime, watermarks: Dict[int, datetime]) -> Optional[datetime]:
+    """Oldest timestamp a level keeps, or None when nothing may be pruned.
+
+    The configured retention is capped at the next coarser level's
+    watermark; a level whose successor has never compacted is left alone.
+    """
+    keep = _retention(resolution_seconds)
+    if keep is None:
+        return None
+    cutoff = now - keep
+    index = _RESOLUTIONS.index(resolution_seconds)
+    if index + 1 == len(_RESOLUTIONS):
+        return cutoff
+    compacted = watermarks.get(_RESOLUTIONS[index + 1])
+    return min(cutoff, compacted) if compacted else None
+
+
+def raw_history_start() -> Optional[datetime]:
+    """Timestamp before which retention has deleted raw stats, or None if it never has."""
+    return db.session.execute(
+        select(RetentionCutoff.pruned_before).where(RetentionCutoff.table_name == "device_stats")
+    ).scalar()
+
+
+def _dialect() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def _free_bytes() -> Optional[int]:
+    """Bytes on SQLite's freelist, i.e. pages released for reuse; None elsewhere."""
+    if _dialect() != "sqlite":
+        return None
+    page_size = db.session.execute(text("PRAGMA page_size")).scalar()
+    return page_size * db.session.execute(text("PRAGMA freelist_count")).scalar()
+
+
+def _relation_bytes(name: str) -> int:
+    """On-disk size of a PostgreSQL table and its indexes (summed over partitions)."""
+    if _dialect() != "postgresql":
+        return 0
+    return int(db.session.execute(text(
+        "SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) "
+        "FROM pg_partition_tree(CAST(:name AS regclass)) WHERE isleaf"
+    ), {"name": name}).scalar())
+
+
+def _bytes_per_row(name: str) -> float:
+    """Average PostgreSQL row footprint, from the planner's row estimate."""
+    if _dialect() != "postgresql":
+        return 0.0
+    size, rows = db.session.execute(text(
+        "SELECT COALESCE(SUM(pg_total_relation_size(t.relid)), 0), COALESCE(SUM(GREATEST(c.reltuples, 0)), 0) "
+        "FROM pg_partition_tree(CAST(:name AS regclass)) t JOIN pg_class c ON c.oid = t.relid WHERE t.isleaf"
+    ), {"name": name}).one()
+    return float(size) / float(rows) if rows else 0.0
+
+
+class _Reclaimed:
+    """Rows and bytes freed by one level's pruning.
+
+    SQLite reports the exact growth of its freelist; PostgreSQL reports the
+    size of dropped partitions plus an estimate for deleted rows, whose space
+    becomes reusable once vacuumed.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.estimated_bytes = 0
+        self._free_before = _free_bytes()
+
+    def report(self, cutoff: datetime, **extra) -> dict:
+        if self._free_before is not None:
+            reclaimed = max(0, _free_bytes() - self._free_before)
+        else:
+            reclaimed = int(self.estimated_bytes)
+        return {"cutoff": cutoff.isoformat(), "rows": self.rows, "bytes": reclaimed, **extra}
+
+
+def _prune_raw(cutoff: datetime, chunk_rows: int, pause_seconds: float) -> dict:
+    reclaimed = _Reclaimed()
+    partitions = partitions_before(cutoff)
+    for name in partitions:
+        reclaimed.rows += db.session.execute(select(func.count()).select_from(partition_table(name))).scalar()
+        reclaimed.estimated_bytes += _relation_bytes(name)
+    drop_partitions_before(cutoff)
+    db.session.commit()
+
+    for table in stat_tables():
+        month = partition_month(table.name)
+        if month is not None and month >= cutoff:
+            continue
+        per_row = _bytes_per_row(table.name)
+        deleted = delete_in_chunks(table, table.c.timestamp < cutoff, chunk_rows, pause_seconds)
+        reclaimed.rows += deleted
+        reclaimed.estimated_bytes += deleted * per_row
+    return reclaimed.report(cutoff, partitions=len(partitions))
+
+
+def _prune_rollup(model, cutoff: datetime, chunk_rows: int, pause_seconds: float) -> dict:
+    reclaimed = _Reclaimed()
+    table = model.__table__
+    per_row = _bytes_per_row(table.name)
+    reclaimed.rows = delete_in_chunks(table, table.c.bucket_start < cutoff, chunk_rows, pause_seconds)
+    reclaimed.estimated_bytes = reclaimed.rows * per_row
+    return reclaimed.report(cutoff)
+
+
+def _record_cutoffs(cutoffs: Dict[str, datetime]) -> None:
+    """Advance each table's recorded cutoff; raising a retention later does not bring rows back."""
+    if not cutoffs:
+        return
+    recorded = dict(db.session.query(RetentionCutoff.table_name, RetentionCutoff.pruned_before))
+    rows = [
+        {"table_name": name, "pruned_before": max(cutoff, recorded.get(name, cutoff))}
+        for name, cutoff in cutoffs.items()
+    ]
+    bulk_upsert(RetentionCutoff, rows, index_elements=["table_name"], update_columns=["pruned_before"])
+    db.session.commit()
+
+
+def prune_retention(now: Optional[datetime] = None) -> Dict[str, dict]:
+    """Delete data older than each level's retention, in short transactions.
+
+    Returns, per pruned table, the cutoff plus rows and bytes reclaimed
+    (raw stats also count dropped month partitions), and a ``total``.
+    """
+    now = now or datetime.utcnow()
+    watermarks = rollup_watermarks()
+    chunk_rows = current_app.config.get("RETENTION_CHUNK_ROWS") or 5000
+    pause_seconds = current_app.config.get("RETENTION_CHUNK_PAUSE_SECONDS") or 0.0
+    report: Dict[str, dict] = {}
+
+    cutoff = retention_cutoff(0, now, watermarks)
+    if cutoff is not None:
+        report["device_stats"] = _prune_raw(cutoff, chunk_rows, pause_seconds)
+    for model in ROLLUP_MODELS:
+        cutoff = retention_cutoff(model.resolution_seconds, now, watermarks)
+        if cutoff is not None:
+            report[model.__tablename__] = _prune_rollup(model, cutoff, chunk_rows, pause_seconds)
+
+    _record_cutoffs({name: datetime.fromisoformat(level["cutoff"]) for name, level in report.items()})
+
+    total = {
+        "rows": sum(level["rows"] for level in report.values()),
+        "bytes": sum(level["bytes"] for level in report.values()),
+    }
+    if total["rows"]:
+        bump_all_generations()
+        db.session.commit()
+        logger.info("Retention pruned %d row(s), reclaiming %d byte(s)", total["rows"], total["bytes"])
+    report["total"] = total
+    return report
+
+
+def delete_device_history(device_id: int) -> int:
+    """Delete a device's raw stats and rollups in chunked transactions. Returns raw rows deleted."""
+    chunk_rows = current_app.config.get("RETENTION_CHUNK_ROWS") or 5000
+    deleted = delete_device_stats(device_id, chunk_rows=chunk_rows)
+    delete_device_rollups(device_id, chunk_rows=chunk_rows)
+    return deleted
@@ -0,0 +1,131 @@
+"""Compaction of raw device stats into 1-minute, 1-hour and 1-day rollups."""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func
+from ..extensions import db
+from ..models import bulk_upsert, delete_in_chunks, stats_source
+from ..models.rollups import (
+    EPOCH,
+    ROLLUP_MODELS,
+    RollupWatermark,
+    epoch_bucket,
+    floor_to,
+    rollup_watermarks,
+)
+
+
+# Buckets younger than this are left open for in-flight ingest transactions.
+COMPACTION_LAG = timedelta(minutes=2)
+
+# Upper bound on the time span compacted per transaction at each level.
+COMPACTION_WINDOWS = {
+    60: timedelta(hours=6),
+    3600: timedelta(days=7),
+    86400: timedelta(days=90),
+}
+
+
+def _source(index: int, start: Optional[datetime] = None, stop: Optional[datetime] = None):
+    """Return (selectable, timestamp column, samples expression) a level is compacted from."""
+    if index == 0:
+        source = stats_source(start, stop)
+        return source, source.c.timestamp, func.count()
+    finer = ROLLUP_MODELS[index - 1].__table__
+    return finer, finer.c.bucket_start, func.sum(finer.c.samples)
+
+
+def _compact_window(index: int, start: datetime, stop: datetime) -> int:
+    model = ROLLUP_MODELS[index]
+    source, ts, samples = _source(index, start, stop)
+    bucket = epoch_bucket(ts, model.resolution_seconds).label("bucket")
+    rows = (
+        db.session.query(
+            source.c.device_id,
+            bucket,
+            func.sum(source.c.bytes_uploaded),
+            func.sum(source.c.bytes_downloaded),
+            samples,
+        )
+        .filter(ts >= start, ts < stop)
+        .group_by(source.c.device_id, "bucket")
+        .all()
+    )
+    bulk_upsert(
+        model,
+        [
+            {
+                "device_id": device_id,
+                "bucket_start": EPOCH + timedelta(seconds=int(bucket_epoch)),
+                "bytes_uploaded": uploaded or 0,
+                "bytes_downloaded": downloaded or 0,
+                "samples": count or 0,
+            }
+            for device_id, bucket_epoch, uploaded, downloaded, count in rows
+        ],
+        index_elements=["device_id", "bucket_start"],
+        update_columns=["bytes_uploaded", "bytes_downloaded", "samples"],
+    )
+    return len(rows)
+
+
+def _set_watermark(seconds: int, until: datetime) -> None:
+    bulk_upsert(
+        RollupWatermark,
+        [{"resolution_seconds": seconds, "compacted_until": until}],
+        index_elements=["resolution_seconds"],
+        update_columns=["compacted_until"],
+    )
+
+
+def compact_rollups(now: Optional[datetime] = None) -> Dict[int, int]:
+    """Fold closed buckets into every rollup level, finest first.
+
+    Each level only reads what the level below has finished, and the
+    watermark advances in the same transaction as each window's upsert.
+    Returns rollup rows written per resolution.
+    """
+    now = now or datetime.utcnow()
+    watermarks = rollup_watermarks()
+    written: Dict[int, int] = {}
+    source_until: Optional[datetime] = now - COMPACTION_LAG
+
+    for index, model in enumerate(ROLLUP_MODELS):
+        seconds = model.resolution_seconds
+        if index:
+            source_until = watermarks.get(ROLLUP_MODELS[index - 1].resolution_seconds)
+        if source_until is None:
+            break
+        until = floor_to(source_until, seconds)
+
+        start = watermarks.get(seconds)
+        if start is None:
+            _, ts, _ = _source(index)
+            earliest = db.session.query(func.min(ts)).scalar()
+            start = floor_to(earliest, seconds) if earliest else until
+            # Nothing to compact yet still marks the level as usable.
+            _set_watermark(seconds, min(start, until))
+            db.session.commit()
+            watermarks[seconds] = min(start, until)
+
+        written[seconds] = 0
+        while start < until:
+            stop = min(until, start + COMPACTION_WINDOWS[seconds])
+            written[seconds] += _compact_window(index, start, stop)
+            _set_watermark(seconds, stop)
+            db.session.commit()
+            watermarks[seconds] = start = stop
+
+    return written
+
+
+def delete_device_rollups(device_id: int, chunk_rows: Optional[int] = None) -> None:
+    """Remove every rollup row for a device.
+
+    The caller commits, unless ``chunk_rows`` is given and rows go that many
+    per committed transaction.
+    """
+    for model in ROLLUP_MODELS:
+        if chunk_rows:
+            delete_in_chunks(model.__table__, model.device_id == device_id, chunk_rows)
+        else:
+            model.query.filter(model.device_id == device_id).delete(synchronize_session=False)
@@ -0,0 +1,106 @@
+"""Runtime settings shared by every worker process.
+
+Values live in ``runtime_settings``, and each write bumps the single-row
+counter in ``runtime_settings_version`` in the same transaction. Every
+process keeps all settings in memory and compares the counter at most once
+per ``SETTINGS_REFRESH_SECONDS``. Reads on hot paths such as agent syncs are
+a dict lookup, and a change reaches every worker within that interval.
+Settings never written fall back to their ``app.config`` default.
+"""
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+from flask import Flask, current_app
+from sqlalchemy import select, update
+from ..extensions import db
+from ..models import RuntimeSetting, RuntimeSettingsVersion, bulk_upsert
+
+
+_create_lock = threading.Lock()
+_VERSION_ROW = 1
+
+# Setting name -> app.config key holding its default.
+SETTINGS = {
+    "default_device_cap": "DEFAULT_DEVICE_CAP",
+}
+
+
+class SettingsStore:
+    """Per-process read cache over the persisted settings."""
+
+    def __init__(self, defaults: Dict[str, Any], refresh_seconds: float = 1.0):
+        self.defaults = defaults
+        self.refresh_seconds = refresh_seconds
+        self._values: Dict[str, Any] = {}
+        self._version: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _stored_version(self) -> int:
+        version = db.session.execute(
+            select(RuntimeSettingsVersion.version).where(RuntimeSettingsVersion.id == _VERSION_ROW)
+        ).scalar()
+        return version or 0
+
+    def refresh(self, force: bool = False) -> None:
+        """Reload settings if the shared version moved; a no-op within the refresh interval."""
+        if not force and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        # One thread checks; the others keep serving the cached values meanwhile.
+        if not self._lock.acquire(blocking=force or self._version is None):
+            return
+        try:
+            if not force and time.monotonic() - self._checked_at < self.refresh_seconds:
+                return
+            version = self._stored_version()
+            if version != self._version:
+                rows = db.session.execute(select(RuntimeSetting.key, RuntimeSetting.value)).all()
+                self._values = {key: json.loads(value) for key, value in rows if key in self.defaults}
+                self._version = version
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def get(self, name: str) -> Any:
+        self.refresh()
+        return self._values.get(name, self.defaults[name])
+
+    def all(self) -> Dict[str, Any]:
+        self.refresh()
+        return {name: self._values.get(name, default) for name, default in self.defaults.items()}
+
+    def update(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist ``values``, bump the shared version and commit. Returns every setting."""
+        unknown = set(values) - set(self.defaults)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        bulk_upsert(
+            RuntimeSetting,
+            [{"key": name, "value": json.dumps(value)} for name, value in values.items()],
+            index_elements=["key"],
+            update_columns=["value"],
+        )
+        bulk_upsert(RuntimeSettingsVersion, [{"id": _VERSION_ROW, "version": 0}], index_elements=["id"])
+        table = RuntimeSettingsVersion.__table__
+        db.session.execute(update(table).where(table.c.id == _VERSION_ROW).values(version=table.c.version + 1))
+        db.session.commit()
+        self.refresh(force=True)
+        return self.all()
+
+
+def get_settings_store(app: Flask) -> SettingsStore:
+    """Return the app's settings store, creating it on first use."""
+    with _create_lock:
+        store = app.extensions.get("settings_store")
+        if store is None:
+            store = SettingsStore(
+                {name: app.config.get(config_key) for name, config_key in SETTINGS.items()},
+                refresh_seconds=app.config.get("SETTINGS_REFRESH_SECONDS", 1.0),
+            )
+            app.extensions["settings_store"] = store
+        return store
+
+
+def get_setting(name: str) -> Any:
+    return get_settings_store(current_app).get(name)
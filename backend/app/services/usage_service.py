@@ -1,7 +1,48 @@
 """Usage aggregation services."""
-from datetime import datetime
-from typing import Optional
-from ..models import aggregate_device_usage
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from flask import Flask, current_app
+from sqlalchemy import func
+from ..extensions import db
+from ..models import (
+    EPOCH,
+    Device,
+    floor_to,
+    aggregate_device_usage,
+    aggregate_usage_by_device,
+    device_usage_series,
+    stats_source,
+    usage_totals_by_device,
+)
+from .counter_service import device_usage, owner_usage
+from .retention_service import raw_history_start
+
+
+_create_lock = threading.Lock()
+
+SUMMARY_SORT_KEYS = ("total_bytes", "bytes_uploaded", "bytes_downloaded", "cap_percent")
+
+# Ranking window -> (span, start alignment in seconds). Starting on a rollup
+# boundary spares the finer-grained segments a ragged start would need.
+TOP_WINDOWS = {
+    "hour": (timedelta(hours=1), 60),
+    "day": (timedelta(days=1), 3600),
+    "week": (timedelta(days=7), 3600),
+}
+# Ranking metric -> value from an ``[uploaded, downloaded]`` pair.
+TOP_METRICS: Dict[str, Callable[[List[int]], int]] = {
+    "upload": lambda usage: usage[0],
+    "download": lambda usage: usage[1],
+    "total": lambda usage: usage[0] + usage[1],
+}
+
+# When downsampling raw rows, pre-aggregate in SQL to this many buckets per
+# requested point so LTTB still has detail to choose from.
+DOWNSAMPLE_OVERSAMPLING = 4
 
 
 def parse_iso(dt_str: Optional[str]) -> Optional[datetime]:
@@ -16,4 +57,276 @@ def parse_iso(dt_str: Optional[str]) -> Optional[datetime]:
 def usage_for_device(device_id: int, start: Optional[str], end: Optional[str]) -> dict:
     start_dt = parse_iso(start)
     end_dt = parse_iso(end)
+    if start_dt is None and end_dt is None:
+        return device_usage(device_id)
     return aggregate_device_usage(device_id, start=start_dt, end=end_dt)
+
+
+def _point_total(point: dict) -> int:
+    return (point.get("bytes_uploaded") or 0) + (point.get("bytes_downloaded") or 0)
+
+
+def lttb(points: List[dict], threshold: int, value: Callable[[dict], float] = _point_total) -> List[dict]:
+    """Largest-Triangle-Three-Buckets downsampling of time-ordered points.
+
+    Keeps the first and last points and, for every bucket in between, the
+    point forming the largest triangle with the previously kept point and the
+    next bucket's average, which preserves peaks and the overall shape.
+    """
+    n = len(points)
+    if threshold >= n:
+        return points
+    if threshold <= 2:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    xs = [(datetime.fromisoformat(p["timestamp"]) - EPOCH).total_seconds() for p in points]
+    ys = [value(p) for p in points]
+    every = (n - 2) / (threshold - 2)
+    sampled = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+
+        best, best_area = avg_start - 1, -1.0
+        for j in range(int(math.floor(i * every)) + 1, int(math.floor((i + 1) * every)) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def raw_device_stats(device_id: int, since: datetime) -> List[dict]:
+    """Raw stat rows as dicts, selecting columns only instead of loading ORM objects."""
+    source = stats_source(since)
+    rows = (
+        db.session.query(
+            source.c.id,
+            source.c.timestamp,
+            source.c.bytes_uploaded,
+            source.c.bytes_downloaded,
+        )
+        .filter(source.c.device_id == device_id, source.c.timestamp >= since)
+        .order_by(source.c.timestamp.asc())
+    )
+    return [
+        {
+            "id": stat_id,
+            "device_id": device_id,
+            "timestamp": timestamp.isoformat(),
+            "bytes_uploaded": uploaded,
+            "bytes_downloaded": downloaded,
+            "total_bytes": (uploaded or 0) + (downloaded or 0),
+        }
+        for stat_id, timestamp, uploaded, downloaded in rows
+    ]
+
+
+def device_stats_series(
+    device_id: int,
+    since: datetime,
+    bucket_minutes: Optional[int] = None,
+    max_points: Optional[int] = None,
+) -> List[dict]:
+    """Stats for a chart: raw rows, SQL-bucketed sums, or either downsampled to ``max_points``.
+
+    Every point has the keys of ``raw_device_stats``; a bucket sums several
+    rows, so its ``id`` is None and its ``timestamp`` is the bucket start.
+    Without ``bucket_minutes`` and with more raw rows than ``max_points``, rows
+    are first grouped in SQL into minute-aligned buckets so memory stays
+    proportional to ``max_points`` rather than to the raw row count. Ranges
+    reaching back past raw retention come from minute rollups the same way.
+    """
+    if bucket_minutes:
+        data = _bucketed_stats(device_id, since, bucket_minutes * 60)
+    elif since < (raw_history_start() or since):
+        # Retention has deleted the older raw rows; minute rollups still cover them.
+        data = _bucketed_stats(device_id, since, 60)
+    elif max_points and _raw_count(device_id, since) > max_points:
+        span = (datetime.utcnow() - since).total_seconds()
+        bucket_seconds = max(60, math.ceil(span / (max_points * DOWNSAMPLE_OVERSAMPLING) / 60) * 60)
+        data = _bucketed_stats(device_id, since, bucket_seconds)
+    else:
+        data = raw_device_stats(device_id, since)
+
+    if max_points:
+        data = lttb(data, max_points)
+    return data
+
+
+def _bucketed_stats(device_id: int, since: datetime, bucket_seconds: int) -> List[dict]:
+    return [
+        {
+            "id": None,
+            "device_id": device_id,
+            "timestamp": point["timestamp"],
+            "bytes_uploaded": point["bytes_uploaded"],
+            "bytes_downloaded": point["bytes_downloaded"],
+            "total_bytes": point["bytes_uploaded"] + point["bytes_downloaded"],
+        }
+        for point in device_usage_series(device_id, start=since, end=None, bucket_seconds=bucket_seconds)
+    ]
+
+
+def _raw_count(device_id: int, since: datetime) -> int:
+    source = stats_source(since)
+    return (
+        db.session.query(func.count())
+        .select_from(source)
+        .filter(source.c.device_id == device_id, source.c.timestamp >= since)
+        .scalar()
+    )
+
+
+def usage_summary(
+    owner_id: int,
+    window: str = "lifetime",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sort_by: str = "total_bytes",
+    descending: bool = True,
+    limit: Optional[int] = None,
+) -> dict:
+    """Usage and cap consumption for all of an owner's devices.
+
+    Counter windows are served from one joined query over the usage
+    counters; an explicit ``start``/``end`` range is summed with one
+    ``GROUP BY device_id`` per rollup segment instead. ``cap_percent`` is
+    lifetime usage against the device cap, as the data-cap alert uses.
+    """
+    ranged = start is not None or end is not None
+    devices = owner_usage(owner_id, "lifetime" if ranged else window)
+    if ranged:
+        totals = aggregate_usage_by_device([d["device_id"] for d in devices], start=start, end=end)
+        for device in devices:
+            usage = totals.get(device["device_id"], {})
+            device["bytes_uploaded"] = usage.get("bytes_uploaded", 0)
+            device["bytes_downloaded"] = usage.get("bytes_downloaded", 0)
+            device["total_bytes"] = usage.get("total_bytes", 0)
+
+    for device in devices:
+        cap = device["data_cap"]
+        lifetime = device.pop("lifetime_total_bytes")
+        device["cap_percent"] = round(lifetime * 100.0 / cap, 2) if cap else None
+
+    summary_totals = {
+        "device_count": len(devices),
+        "bytes_uploaded": sum(d["bytes_uploaded"] for d in devices),
+        "bytes_downloaded": sum(d["bytes_downloaded"] for d in devices),
+        "total_bytes": sum(d["total_bytes"] for d in devices),
+    }
+    # Devices without a cap sort last whichever way cap_percent is ordered.
+    sign = -1 if descending else 1
+    devices.sort(key=lambda d: (d[sort_by] is None, sign * (d[sort_by] or 0), d["device_id"]))
+    if limit is not None:
+        devices = devices[:limit]
+
+    return {
+        "window": {
+            "name": "range" if ranged else window,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+        },
+        "totals": summary_totals,
+        "devices": devices,
+    }
+
+
+class TopDevicesCache:
+    """Rankings kept for a few seconds, so dashboards polling together share one computation."""
+
+    def __init__(self, ttl_seconds: float = 15, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple, Tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key: Tuple, value: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl_seconds, value)
+
+
+def get_top_devices_cache(app: Flask) -> TopDevicesCache:
+    """Return the app's top-devices cache, creating it on first use."""
+    with _create_lock:
+        cache = app.extensions.get("top_devices_cache")
+        if cache is None:
+            cache = TopDevicesCache(ttl_seconds=app.config.get("TOP_DEVICES_CACHE_SECONDS", 15))
+            app.extensions["top_devices_cache"] = cache
+        return cache
+
+
+def top_devices(
+    owner_id: Optional[int],
+    window: str = "day",
+    metric: str = "total",
+    limit: int = 10,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """The ``limit`` devices with the most usage over a trailing window.
+
+    The window runs from its span ago, floored to a rollup boundary, until
+    ``now``. Per-device sums come from the coarsest rollups covering it
+    (``usage_totals_by_device``); only the top ``limit`` are selected with a
+    heap and then loaded. ``owner_id`` None ranks devices of every owner.
+    """
+    now = now or datetime.utcnow()
+    span, align_seconds = TOP_WINDOWS[window]
+    start = floor_to(now - span, align_seconds)
+    value = TOP_METRICS[metric]
+    totals = usage_totals_by_device(start, now, owner_id=owner_id)
+    # Ties go to the lower device id so pages are stable between polls.
+    top = heapq.nlargest(limit, totals.items(), key=lambda item: (value(item[1]), -item[0]))
+    devices = {
+        device.id: device
+        for device in Device.query.filter(Device.id.in_([device_id for device_id, _ in top])).all()
+    } if top else {}
+
+    ranked = []
+    for device_id, (uploaded, downloaded) in top:
+        device = devices.get(device_id)
+        if device is None:
+            continue
+        ranked.append({
+            "device_id": device_id,
+            "owner_id": device.owner_id,
+            "hostname": device.hostname,
+            "mac_address": device.mac_address,
+            "bytes_uploaded": uploaded,
+            "bytes_downloaded": downloaded,
+            "total_bytes": uploaded + downloaded,
+        })
+    return {
+        "window": {"name": window, "start": start.isoformat(), "end": now.isoformat()},
+        "metric": metric,
+        "devices": ranked,
+    }
+
+
+def cached_top_devices(owner_id: Optional[int], window: str, metric: str, limit: int) -> Dict[str, Any]:
+    """``top_devices`` served from the app's short-lived cache."""
+    cache = get_top_devices_cache(current_app)
+    key = (owner_id, window, metric, limit)
+    ranking = cache.get(key)
+    if ranking is None:
+        ranking = top_devices(owner_id, window=window, metric=metric, limit=limit)
+        cache.put(key, ranking)
+    return ranking
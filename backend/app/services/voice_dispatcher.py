@@ -0,0 +1,151 @@
+"""Background dispatcher for voice-service notifications."""
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, Hashable, Optional, Set
+from flask import Flask
+
+
+logger = logging.getLogger(__name__)
+_create_lock = threading.Lock()
+
+
+class VoiceDispatcher:
+    """Deliver ``/speak`` payloads off the request path.
+
+    Payloads are keyed (typically by device and alert type); a payload whose
+    key is already waiting replaces the queued one instead of taking another
+    slot. The queue is bounded and overflow is dropped and counted, so callers
+    never block on a slow or dead voice service.
+    """
+
+    def __init__(
+        self,
+        service_url: str,
+        token: str = "",
+        queue_size: int = 100,
+        workers: int = 2,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        timeout: float = 3,
+    ):
+        self.service_url = service_url.rstrip("/")
+        self.token = token
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[Hashable]]" = queue.Queue(maxsize=queue_size)
+        self._pending: Dict[Hashable, dict] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counters = {"submitted": 0, "coalesced": 0, "sent": 0, "retried": 0, "dropped_full": 0, "dropped_failed": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"voice-dispatcher-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5) -> None:
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, key: Hashable, payload: dict) -> bool:
+        """Queue ``payload`` for delivery. Returns False if it had to be dropped."""
+        self.start()
+        with self._lock:
+            self._counters["submitted"] += 1
+            if key in self._pending:
+                self._pending[key] = payload
+                self._counters["coalesced"] += 1
+                return True
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                self._counters["dropped_full"] += 1
+                return False
+            self._pending[key] = payload
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "queue_depth": self._queue.qsize()}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self) -> None:
+        while True:
+            key = self._queue.get()
+            try:
+                if key is None:
+                    return
+                with self._lock:
+                    payload = self._pending.pop(key, None)
+                if payload is not None:
+                    self._deliver(payload)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, payload: dict) -> None:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["X-Voice-Token"] = self.token
+        body = json.dumps(payload).encode("utf-8")
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retried")
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+            try:
+                req = urllib.request.Request(f"{self.service_url}/speak", data=body, headers=headers, method="POST")
+                urllib.request.urlopen(req, timeout=self.timeout).close()
+            except (urllib.error.URLError, OSError) as exc:
+                logger.debug("Voice notification attempt %d failed: %s", attempt + 1, exc)
+                continue
+            self._count("sent")
+            return
+        self._count("dropped_failed")
+
+
+def voice_alert_types(app: Flask) -> Set[str]:
+    """Lower-cased types listed in ``VOICE_SERVICE_ALERT_TYPES``; empty means every type is spoken."""
+    types_raw = app.config.get("VOICE_SERVICE_ALERT_TYPES", "")
+    return {t.strip().lower() for t in types_raw.split(",") if t.strip()}
+
+
+def get_voice_dispatcher(app: Flask) -> Optional[VoiceDispatcher]:
+    """Return the app's dispatcher, creating it on first use; None if no service is configured."""
+    service_url = (app.config.get("VOICE_SERVICE_URL") or "").strip()
+    if not service_url:
+        return None
+    with _create_lock:
+        return _get_or_create(app, service_url)
+
+
+def _get_or_create(app: Flask, service_url: str) -> VoiceDispatcher:
+    dispatcher = app.extensions.get("voice_dispatcher")
+    if dispatcher is None:
+        dispatcher = VoiceDispatcher(
+            service_url,
+            token=(app.config.get("VOICE_SERVICE_TOKEN") or "").strip(),
+            queue_size=app.config.get("VOICE_DISPATCH_QUEUE_SIZE", 100),
+            workers=app.config.get("VOICE_DISPATCH_WORKERS", 2),
+            max_retries=app.config.get("VOICE_DISPATCH_RETRIES", 3),
+            backoff_seconds=app.config.get("VOICE_DISPATCH_BACKOFF_SECONDS", 0.5),
+        )
+        app.extensions["voice_dispatcher"] = dispatcher
+    return dispatcher
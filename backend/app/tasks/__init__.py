@@ -1,18 +1,28 @@
-"""Celery tasks placeholder for future async jobs.
+"""Background jobs.
 
-Uses in-memory broker/backend to avoid external Redis dependency. Replace with a
-real broker (e.g., RabbitMQ/SQS) when scaling background tasks.
+Jobs are registered in ``jobs`` and executed by a ``JobRunner``: scheduled on
+an interval from app config or dispatched on demand, with single-run locking
+and per-job duration histograms. The default ``local`` broker runs jobs on an
+in-process thread pool; ``JOB_BROKER=celery`` hands them to Celery workers.
 """
-from celery import Celery
+from flask import Flask
+from . import jobs  # noqa: F401  registers the built-in jobs
+from .runner import JOBS, JobRunner, JobSpec, get_job_runner, job
 
 
-celery_app = Celery(
-	"wifi_monitor_tasks",
-	broker="memory://",
-	backend="cache+memory://",
-)
+def init_jobs(app: Flask) -> JobRunner:
+	"""Create the app's job runner and start the scheduler unless disabled."""
+	runner = get_job_runner(app)
+	if app.config.get("JOB_SCHEDULER_ENABLED") and not app.testing:
+		runner.start()
+	return runner
 
 
-@celery_app.task
-def ping() -> str:
-	return "pong"
+__all__ = [
+	"JOBS",
+	"JobRunner",
+	"JobSpec",
+	"get_job_runner",
+	"init_jobs",
+	"job",
+]
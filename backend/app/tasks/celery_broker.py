@@ -0,0 +1,57 @@
+"""Optional Celery broker for background jobs.
+
+Used when ``JOB_BROKER=celery``. Start workers with
+``celery -A app.tasks.celery_broker worker``. The web processes schedule
+jobs; each worker process builds one app, without scheduler or ingest
+writers, and reuses it for every job it executes.
+"""
+import os
+import threading
+from typing import Optional
+from celery import Celery
+from celery.signals import worker_process_init
+from flask import Flask
+
+
+celery_app = Celery(
+	"wifi_monitor_tasks",
+	broker=os.getenv("CELERY_BROKER_URL", "memory://"),
+	backend=os.getenv("CELERY_RESULT_BACKEND", "cache+memory://"),
+)
+
+
+_app: Optional[Flask] = None
+_app_lock = threading.Lock()
+
+
+def get_worker_app() -> Flask:
+	"""This worker process's app, created on first use.
+
+	``create_app`` starts no background threads, so the app only holds the
+	engine and pool shared by every job run in this process.
+	"""
+	global _app
+	with _app_lock:
+		if _app is None:
+			from ..app import create_app
+
+			_app = create_app()
+		return _app
+
+
+@worker_process_init.connect
+def _init_worker_app(**kwargs) -> None:
+	get_worker_app()
+
+
+@celery_app.task
+def ping() -> str:
+	return "pong"
+
+
+@celery_app.task(name="wifi_monitor.run_job")
+def run_job(name: str) -> dict:
+	"""Execute a registered job in this worker under the job's single-run lock."""
+	from .runner import get_job_runner
+
+	return get_job_runner(get_worker_app()).run(name)
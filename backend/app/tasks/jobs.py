@@ -0,0 +1,63 @@
+"""Built-in background jobs."""
+from datetime import datetime, timedelta
+from typing import Optional
+from flask import current_app
+from ..extensions import db
+from ..models import rotate_partitions
+from ..services import counter_service, notification_service, retention_service, rollup_service
+from .runner import job
+
+
+def _window_start(now: datetime, last_success: Optional[datetime], interval_config: str) -> datetime:
+	"""Start of the window a windowed job covers: its last success, or one interval back."""
+	if last_success is not None:
+		return last_success
+	return now - timedelta(seconds=current_app.config.get(interval_config) or 86400)
+
+
+@job("compact_rollups", interval_config="ROLLUP_COMPACT_INTERVAL_SECONDS")
+def compact_rollups(now: datetime, last_success: Optional[datetime]) -> dict:
+	"""Rotate raw-stat partitions and fold closed buckets into the rollup tables.
+
+	Compaction reads every partition, so a failed rotation is logged and
+	reported but does not stop the rollups from advancing.
+	"""
+	rotation_error = None
+	try:
+		rotated = rotate_partitions(now)
+		db.session.commit()
+	except Exception as exc:
+		db.session.rollback()
+		current_app.logger.exception("Partition rotation failed")
+		rotated, rotation_error = {}, repr(exc)
+	written = rollup_service.compact_rollups(now)
+	return {
+		"rotated": rotated,
+		"rotation_error": rotation_error,
+		"written": {str(seconds): rows for seconds, rows in written.items()},
+	}
+
+
+@job("prune_retention", interval_config="RETENTION_PRUNE_INTERVAL_SECONDS")
+def prune_retention(now: datetime, last_success: Optional[datetime]) -> dict:
+	"""Drop raw stats and rollups older than their configured retention."""
+	return retention_service.prune_retention(now)
+
+
+@job("reconcile_counters", interval_config="COUNTER_RECONCILE_INTERVAL_SECONDS")
+def reconcile_counters(now: datetime, last_success: Optional[datetime]) -> dict:
+	"""Rebuild per-device usage counters from raw stats."""
+	return {"devices": counter_service.reconcile_counters()}
+
+
+@job("digest_alerts", interval_config="ALERT_DIGEST_INTERVAL_SECONDS", then=("deliver_notifications",))
+def digest_alerts(now: datetime, last_success: Optional[datetime]) -> dict:
+	"""Write one digest notification per user for alerts since the last digest."""
+	since = _window_start(now, last_success, "ALERT_DIGEST_INTERVAL_SECONDS")
+	return {"notifications": notification_service.create_alert_digests(since, now)}
+
+
+@job("deliver_notifications", interval_config="NOTIFICATION_DELIVERY_INTERVAL_SECONDS")
+def deliver_notifications(now: datetime, last_success: Optional[datetime]) -> dict:
+	"""Send notifications not delivered yet to the voice service."""
+	return {"submitted": notification_service.deliver_notifications(now)}
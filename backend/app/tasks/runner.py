@@ -0,0 +1,236 @@
+"""Job runner: scheduling, on-demand dispatch, single-run locking and timing."""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Flask
+from sqlalchemy import or_, update
+from ..extensions import db
+from ..metrics import Histogram
+from ..models import JobState, bulk_upsert
+
+
+logger = logging.getLogger(__name__)
+_create_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class JobSpec:
+	name: str
+	func: Callable[[datetime, Optional[datetime]], Any]
+	interval_config: Optional[str] = None
+	description: str = ""
+	# Jobs dispatched after this one succeeds.
+	then: Tuple[str, ...] = ()
+
+
+JOBS: Dict[str, JobSpec] = {}
+
+
+def job(name: str, interval_config: Optional[str] = None, then: Tuple[str, ...] = ()):
+	"""Register ``func(now, last_success_at)`` as a job, scheduled every ``app.config[interval_config]`` seconds."""
+
+	def register(func):
+		description = (func.__doc__ or "").strip().splitlines()[0] if func.__doc__ else ""
+		JOBS[name] = JobSpec(name, func, interval_config, description, tuple(then))
+		return func
+
+	return register
+
+
+def _lock_owner() -> str:
+	return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def acquire_job_lock(name: str, owner: str, ttl: timedelta, now: datetime) -> bool:
+	"""Take the job's lease in the database; False if another process holds it."""
+	bulk_upsert(JobState, [{"name": name, "run_count": 0}], index_elements=["name"])
+	table = JobState.__table__
+	result = db.session.execute(
+		update(table)
+		.where(table.c.name == name, or_(table.c.locked_until.is_(None), table.c.locked_until < now))
+		.values(locked_by=owner, locked_until=now + ttl, last_started_at=now)
+	)
+	db.session.commit()
+	return result.rowcount == 1
+
+
+def release_job_lock(name: str, owner: str, started_at: datetime, status: str, error: Optional[str], duration_ms: float) -> None:
+	table = JobState.__table__
+	values = {
+		"locked_by": None,
+		"locked_until": None,
+		"last_finished_at": datetime.utcnow(),
+		"last_status": status,
+		"last_error": error,
+		"last_duration_ms": duration_ms,
+		"run_count": table.c.run_count + 1,
+	}
+	if status == "ok":
+		# The start time, so the next run's window begins where this one's ended.
+		values["last_success_at"] = started_at
+	db.session.execute(update(table).where(table.c.name == name, table.c.locked_by == owner).values(**values))
+	db.session.commit()
+
+
+class JobRunner:
+	"""Runs registered jobs on a schedule or on demand.
+
+	A job runs at most once at a time: an in-process lock stops overlapping
+	runs in one process and a lease row in ``job_state`` stops them across
+	processes. With the ``local`` broker jobs execute on this process's
+	thread pool and need nothing but the database; ``celery`` sends them to
+	Celery workers instead.
+	"""
+
+	def __init__(self, app: Flask, broker: str = "local", workers: int = 4, lock_ttl_seconds: float = 900):
+		self.app = app
+		self.broker = broker
+		self.lock_ttl = timedelta(seconds=lock_ttl_seconds)
+		self._local_locks = {name: threading.Lock() for name in JOBS}
+		self._durations = {name: Histogram() for name in JOBS}
+		self._counters = {name: {"runs": 0, "failures": 0, "skipped": 0} for name in JOBS}
+		self._lock = threading.Lock()
+		self._scheduler = BackgroundScheduler(
+			executors={"default": ThreadPoolExecutor(workers)},
+			job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 60},
+			timezone="UTC",
+		)
+
+	def interval(self, name: str) -> Optional[float]:
+		spec = JOBS[name]
+		return (self.app.config.get(spec.interval_config) or None) if spec.interval_config else None
+
+	def start(self) -> None:
+		for name in JOBS:
+			interval = self.interval(name)
+			if interval:
+				self._scheduler.add_job(
+					self._scheduled, "interval", seconds=interval, args=(name,), id=name, replace_existing=True
+				)
+		self._scheduler.start()
+
+	def shutdown(self, wait: bool = False) -> None:
+		if self._scheduler.running:
+			self._scheduler.shutdown(wait=wait)
+
+	def _scheduled(self, name: str) -> None:
+		if self.broker == "celery":
+			self._send_to_celery(name)
+		else:
+			self.run(name)
+
+	def _send_to_celery(self, name: str) -> None:
+		from .celery_broker import run_job
+
+		run_job.delay(name)
+
+	def enqueue(self, name: str) -> None:
+		"""Run a job as soon as possible without waiting for it."""
+		if name not in JOBS:
+			raise KeyError(name)
+		if self.broker == "celery":
+			self._send_to_celery(name)
+		elif self._scheduler.running:
+			self._scheduler.add_job(self.run, args=(name,), id=f"{name}:{uuid.uuid4().hex}")
+		else:
+			threading.Thread(target=self.run, args=(name,), name=f"job-{name}", daemon=True).start()
+
+	def _count(self, name: str, counter: str) -> None:
+		with self._lock:
+			self._counters[name][counter] += 1
+
+	def run(self, name: str) -> Dict[str, Any]:
+		"""Run a job now in this thread, unless it is already running anywhere."""
+		spec = JOBS[name]
+		local_lock = self._local_locks[name]
+		if not local_lock.acquire(blocking=False):
+			self._count(name, "skipped")
+			return {"job": name, "status": "skipped"}
+		try:
+			with self.app.app_context():
+				try:
+					return self._run_locked(spec)
+				finally:
+					db.session.remove()
+		finally:
+			local_lock.release()
+
+	def _run_locked(self, spec: JobSpec) -> Dict[str, Any]:
+		now = datetime.utcnow()
+		owner = _lock_owner()
+		if not acquire_job_lock(spec.name, owner, self.lock_ttl, now):
+			self._count(spec.name, "skipped")
+			return {"job": spec.name, "status": "skipped"}
+
+		last_success = db.session.get(JobState, spec.name).last_success_at
+		started = time.perf_counter()
+		status, error, result = "ok", None, None
+		try:
+			result = spec.func(now, last_success)
+		except Exception as exc:
+			db.session.rollback()
+			status, error = "error", repr(exc)
+			logger.exception("Job %s failed", spec.name)
+		duration = time.perf_counter() - started
+		self._durations[spec.name].observe(duration)
+		self._count(spec.name, "runs")
+		if status != "ok":
+			self._count(spec.name, "failures")
+		duration_ms = round(duration * 1000, 3)
+		release_job_lock(spec.name, owner, now, status, error, duration_ms)
+
+		if status == "ok":
+			for follow_up in spec.then:
+				self.enqueue(follow_up)
+		return {"job": spec.name, "status": status, "result": result, "error": error, "duration_ms": duration_ms}
+
+	def metrics(self) -> Dict[str, dict]:
+		"""In-process counters and duration histogram per job, without touching the database."""
+		with self._lock:
+			counters = {name: dict(values) for name, values in self._counters.items()}
+		return {
+			name: {**counters[name], "duration_seconds": self._durations[name].snapshot()}
+			for name in JOBS
+		}
+
+	def status(self) -> Dict[str, dict]:
+		"""Per-job schedule, counters, duration histogram and persisted last-run state."""
+		with self.app.app_context():
+			states = {state.name: state.to_dict() for state in JobState.query.all()}
+		report = {}
+		for name, spec in JOBS.items():
+			scheduled = self._scheduler.get_job(name) if self._scheduler.running else None
+			with self._lock:
+				counters = dict(self._counters[name])
+			report[name] = {
+				"description": spec.description,
+				"interval_seconds": self.interval(name),
+				"next_run_at": scheduled.next_run_time.isoformat() if scheduled and scheduled.next_run_time else None,
+				**counters,
+				"duration_seconds": self._durations[name].snapshot(),
+				"state": states.get(name),
+			}
+		return report
+
+
+def get_job_runner(app: Flask) -> JobRunner:
+	"""Return the app's job runner, creating it on first use."""
+	with _create_lock:
+		runner = app.extensions.get("job_runner")
+		if runner is None:
+			runner = JobRunner(
+				app,
+				broker=app.config.get("JOB_BROKER", "local"),
+				workers=app.config.get("JOB_WORKERS", 4),
+				lock_ttl_seconds=app.config.get("JOB_LOCK_TTL_SECONDS", 900),
+			)
+			app.extensions["job_runner"] = runner
+		return runner
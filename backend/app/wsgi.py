@@ -1,6 +1,9 @@
 """WSGI entrypoint for Gunicorn."""
 # Import the application factory from the `app` module where it's defined.
-from .app import create_app
+from .app import create_app, start_background_services
 
 
+# Each worker imports this module and runs its own scheduler and ingest
+# writers; don't use gunicorn --preload, threads don't survive the fork.
 app = create_app()
+start_background_services(app)
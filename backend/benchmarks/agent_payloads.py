@@ -0,0 +1,91 @@
+"""Benchmark agent upload formats: body size, agent encode time, server decode time.
+
+Compares the original JSON list of objects against columnar JSON and
+MessagePack, each uncompressed, gzip and zstd (formats whose optional
+package is missing are skipped)::
+
+    python backend/benchmarks/agent_payloads.py --devices 10 50 250
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path[:0] = [str(ROOT), str(ROOT / "pi-agent" / "src")]
+
+from backend.app.services.agent_payloads import read_payload, records  # noqa: E402
+from payloads import encode_payload, msgpack, zstandard  # noqa: E402
+
+
+FORMATS = [
+    ("rows json", False, False),
+    ("columnar json", True, False),
+    ("columnar msgpack", True, True),
+]
+COMPRESSIONS = ["none", "gzip", "zstd"]
+
+
+def sample_stats(devices: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [
+        {
+            "mac_address": ":".join(f"{rng.randrange(256):02X}" for _ in range(6)),
+            "bytes_uploaded": rng.randrange(0, 50_000_000),
+            "bytes_downloaded": rng.randrange(0, 500_000_000),
+            "timestamp": f"2026-01-01T00:{i % 60:02d}:00",
+        }
+        for i in range(devices)
+    ]
+
+
+def best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(devices: int, repeat: int) -> list:
+    stats = sample_stats(devices)
+    results = []
+    for name, columnar, use_msgpack in FORMATS:
+        if use_msgpack and msgpack is None:
+            continue
+        for compression in COMPRESSIONS:
+            if compression == "zstd" and zstandard is None:
+                continue
+            body, headers = encode_payload("stats", stats, compression, columnar, use_msgpack)
+            encoding = headers.get("Content-Encoding")
+            content_type = headers["Content-Type"]
+            encode = best_of(lambda: encode_payload("stats", stats, compression, columnar, use_msgpack), repeat)
+            decode = best_of(
+                lambda: records(read_payload(body, encoding, content_type, 64 * 1024 * 1024), "stats"), repeat
+            )
+            assert records(read_payload(body, encoding, content_type, 64 * 1024 * 1024), "stats") == stats
+            results.append((name, compression, len(body), encode * 1e6, decode * 1e6))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 50, 250])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for devices in args.devices:
+        results = run(devices, args.repeat)
+        baseline = results[0][2]
+        print(f"\n{devices} devices")
+        print(f"{'format':<18} {'encoding':<8} {'bytes':>8} {'size':>7} {'encode us':>10} {'decode us':>10}")
+        for name, compression, size, encode_us, decode_us in results:
+            print(
+                f"{name:<18} {compression:<8} {size:>8} {size / baseline:>6.0%} {encode_us:>10.1f} {decode_us:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Load-test hot API endpoints in process: latency percentiles, throughput and queries per request.
+
+Builds the app with ``create_app`` against a fresh SQLite file (or a scratch
+database given with ``--database-url``, whose tables are dropped first),
+seeds users, agents, devices, alert rules and days of stats, then drives
+each scenario from concurrent test clients. ``ingest_stats_queued`` posts to
+the default 202 path and then drains the ingest queue; its throughput and
+``drain_ms`` include the writer's time. Results are compared with the stored
+baselines for the database dialect; a regression exits non-zero::
+
+    python backend/benchmarks/load.py
+    python backend/benchmarks/load.py --users 10 --days 14 --clients 8 --requests 500
+    python backend/benchmarks/load.py --save-baseline
+
+Latency is checked against ``p95_ms`` with ``--tolerance`` (relative) and
+``--slack-ms`` (absolute) headroom, since concurrent SQLite writers are
+noisy; queries per request are checked exactly, so a new N+1 fails even on
+a fast machine. Baselines are only compared for the workload they were
+recorded with.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+from flask import Flask  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from backend.app.app import create_app  # noqa: E402
+from backend.app.extensions import db  # noqa: E402
+from backend.app.models import Agent, Alert, AlertHistory, Device, DeviceStat, User, rotate_partitions  # noqa: E402
+from backend.app.services.ingest_queue import drain_once, get_ingest_queue  # noqa: E402
+from backend.app.services.rollup_service import compact_rollups  # noqa: E402
+
+
+BASELINES = Path(__file__).with_name("baselines.json")
+API = "/api/v1"
+# Queries per request may drift this much before it counts as a regression.
+QUERY_SLACK = 0.05
+# Scenarios run with the ingest queue on; the queue is drained before timing stops.
+QUEUED_SCENARIOS = ("ingest_stats_queued",)
+# About one sample in ten exceeds this, so triggers are written under load too.
+USAGE_THRESHOLD = 1_000_000
+
+
+@dataclass(frozen=True)
+class Workload:
+    users: int = 3
+    agents_per_user: int = 2
+    devices_per_agent: int = 20
+    days: int = 7
+    interval_minutes: int = 15
+    alert_history_per_user: int = 500
+    clients: int = 4
+    requests: int = 200
+    seed: int = 1
+
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput_rps: float
+    queries_per_request: float
+    drain_ms: float = 0.0
+
+
+class QueryCounter:
+    """Counts statements per thread, so concurrent clients are attributed separately."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._local = threading.local()
+
+    def _count(self, conn, cursor, statement, *args):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def take(self) -> int:
+        count = getattr(self._local, "count", 0)
+        self._local.count = 0
+        return count
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+
+@dataclass
+class Fixture:
+    """What the scenarios need to know about the seeded data."""
+
+    tokens: List[str]
+    api_keys: List[str]
+    agent_macs: List[List[str]]
+    device_ids: List[List[int]]
+
+
+def build_app(database_url: Optional[str] = None) -> Flask:
+    scratch = Path(tempfile.mkdtemp(prefix="wifi-bench-"))
+    if database_url is None:
+        database_url = f"sqlite:///{scratch / 'bench.db'}"
+    app = create_app({
+        # No scheduler or writer threads competing with the measured requests;
+        # queued scenarios switch the queue on and drain it themselves.
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "INGEST_QUEUE_ENABLED": False,
+        "INGEST_QUEUE_PATH": str(scratch / "ingest_queue.db"),
+        "INGEST_QUEUE_MAX_DEPTH": 1_000_000,
+        "RESPONSE_CACHE_ENABLED": False,
+    })
+    if not database_url.startswith("sqlite"):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+    return app
+
+
+def seed(app: Flask, workload: Workload, now: datetime) -> Fixture:
+    """Create users with agents, devices, raw stats, rollups, alert rules and history.
+
+    Every device gets a ``usage_threshold`` rule and half of them a data cap
+    they have not reached; each user has a global ``forecast_cap`` rule. So
+    ingest evaluates every rule type and writes some triggers.
+    """
+    rng = random.Random(workload.seed)
+    fixture = Fixture([], [], [], [])
+    samples = workload.days * 24 * 60 // workload.interval_minutes
+    with app.app_context():
+        for u in range(workload.users):
+            user = User(email=f"bench{u}@example.com")
+            user.set_password("bench-password")
+            db.session.add(user)
+            db.session.flush()
+            user_devices = []
+            for a in range(workload.agents_per_user):
+                agent = Agent(name=f"bench-{u}-{a}", owner_id=user.id, api_key=Agent.generate_api_key())
+                macs = [f"02:{u:02X}:{a:02X}:00:{d >> 8:02X}:{d & 0xFF:02X}" for d in range(workload.devices_per_agent)]
+                devices = [
+                    Device(owner_id=user.id, mac_address=mac, hostname=f"host-{mac[-5:]}", data_cap=10 ** 14 if d % 2 else None)
+                    for d, mac in enumerate(macs)
+                ]
+                db.session.add(agent)
+                db.session.add_all(devices)
+                db.session.flush()
+                fixture.api_keys.append(agent.api_key)
+                fixture.agent_macs.append(macs)
+                fixture.device_ids.append([device.id for device in devices])
+                user_devices.extend(devices)
+                for device in devices:
+                    db.session.execute(DeviceStat.__table__.insert(), [
+                        {
+                            "device_id": device.id,
+                            "timestamp": now - timedelta(minutes=workload.interval_minutes * i),
+                            "bytes_uploaded": rng.randrange(0, 5_000_000),
+                            "bytes_downloaded": rng.randrange(0, 50_000_000),
+                        }
+                        for i in range(1, samples + 1)
+                    ])
+
+            alerts = [
+                Alert(user_id=user.id, device_id=device.id, alert_type="usage_threshold", threshold_value=USAGE_THRESHOLD)
+                for device in user_devices
+            ]
+            db.session.add_all(alerts)
+            db.session.add(Alert(user_id=user.id, alert_type="forecast_cap", threshold_value=24))
+            db.session.flush()
+            db.session.execute(AlertHistory.__table__.insert(), [
+                {
+                    "alert_id": alerts[i % len(alerts)].id,
+                    "device_id": alerts[i % len(alerts)].device_id,
+                    "triggered_at": now - timedelta(seconds=rng.randrange(workload.days * 86400)),
+                    "value_at_trigger": rng.randrange(10 ** 9),
+                }
+                for i in range(workload.alert_history_per_user)
+            ])
+            fixture.tokens.append(create_access_token(identity=str(user.id)))
+            db.session.commit()
+
+        rotate_partitions(now)
+        db.session.commit()
+        compact_rollups(now)
+    return fixture
+
+
+def _ingest(fixture: Fixture, batch_ids) -> Callable:
+    def request(client, n: int, rng: random.Random):
+        agent = n % len(fixture.api_keys)
+        stats = [
+            {"mac_address": mac, "bytes_uploaded": rng.randrange(100_000), "bytes_downloaded": rng.randrange(1_000_000)}
+            for mac in fixture.agent_macs[agent]
+        ]
+        return client.post(
+            f"{API}/agents/stats",
+            json={"stats": stats, "batch_id": next(batch_ids)},
+            headers={"X-Agent-API-Key": fixture.api_keys[agent]},
+        )
+
+    return request
+
+
+def _sync_devices(fixture: Fixture) -> Callable:
+    def request(client, n: int, rng: random.Random):
+        agent = n % len(fixture.api_keys)
+        devices = [
+            {"mac_address": mac, "ip_address": f"10.0.{agent % 256}.{rng.randrange(2, 250)}"}
+            for mac in fixture.agent_macs[agent]
+        ]
+        return client.post(
+            f"{API}/agents/devices", json={"devices": devices}, headers={"X-Agent-API-Key": fixture.api_keys[agent]}
+        )
+
+    return request
+
+
+def _user_get(fixture: Fixture, workload: Workload, path: Callable) -> Callable:
+    def request(client, n: int, rng: random.Random):
+        agent = n % len(fixture.api_keys)
+        token = fixture.tokens[agent // workload.agents_per_user]
+        return client.get(path(agent, rng), headers={"Authorization": f"Bearer {token}"})
+
+    return request
+
+
+def scenarios(fixture: Fixture, workload: Workload) -> Dict[str, Callable]:
+    """Request builders ``request(client, n, rng)`` per scenario."""
+    hours = workload.days * 24
+    batch_ids = itertools.count(1)
+    return {
+        "ingest_stats": _ingest(fixture, batch_ids),
+        "ingest_stats_queued": _ingest(fixture, batch_ids),
+        "sync_devices": _sync_devices(fixture),
+        "get_device_stats": _user_get(
+            fixture,
+            workload,
+            lambda agent, rng: f"{API}/devices/{rng.choice(fixture.device_ids[agent])}/stats?hours={hours}&max_points=200",
+        ),
+        "recent_alert_history": _user_get(
+            fixture, workload, lambda agent, rng: f"{API}/alerts/history?hours={hours}&limit=50"
+        ),
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def drain_queue(app: Flask) -> int:
+    """Write everything in the ingest queue as the background writers would. Returns entries left."""
+    queue = get_ingest_queue(app)
+    while drain_once(app, queue, app.config["INGEST_WRITER_BATCH_SIZE"]):
+        pass
+    return queue.depth()
+
+
+def run_scenario(
+    app: Flask, name: str, request: Callable, workload: Workload, finish: Optional[Callable[[], int]] = None
+) -> Result:
+    """Drive ``request`` from concurrent clients.
+
+    ``finish`` runs after the clients, inside the timed window, and returns
+    a number of failed requests; its queries count towards the scenario.
+    """
+    with app.app_context():
+        engine = db.engine
+    counter = QueryCounter(engine)
+    per_client = [workload.requests // workload.clients + (i < workload.requests % workload.clients) for i in range(workload.clients)]
+
+    def client_loop(index: int):
+        client = app.test_client()
+        rng = random.Random(workload.seed * 1000 + index)
+        latencies, queries, errors = [], 0, 0
+        for k in range(per_client[index]):
+            counter.take()
+            started = time.perf_counter()
+            response = request(client, index + k * workload.clients, rng)
+            latencies.append(time.perf_counter() - started)
+            queries += counter.take()
+            if response.status_code >= 400:
+                errors += 1
+        return latencies, queries, errors
+
+    finish_errors, finish_queries, finish_seconds = 0, 0, 0.0
+    with counter, ThreadPoolExecutor(workload.clients) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(client_loop, range(workload.clients)))
+        if finish is not None:
+            counter.take()
+            finish_started = time.perf_counter()
+            finish_errors = finish()
+            finish_seconds = time.perf_counter() - finish_started
+            finish_queries = counter.take()
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for outcome in outcomes for latency in outcome[0])
+    total = len(latencies)
+    return Result(
+        scenario=name,
+        requests=total,
+        errors=sum(outcome[2] for outcome in outcomes) + finish_errors,
+        p50_ms=round(percentile(latencies, 50), 3),
+        p95_ms=round(percentile(latencies, 95), 3),
+        p99_ms=round(percentile(latencies, 99), 3),
+        throughput_rps=round(total / elapsed, 1) if elapsed else 0.0,
+        queries_per_request=round((sum(outcome[1] for outcome in outcomes) + finish_queries) / total, 3) if total else 0.0,
+        drain_ms=round(finish_seconds * 1000, 3),
+    )
+
+
+def run(app: Flask, workload: Workload, only: Optional[List[str]] = None) -> List[Result]:
+    fixture = seed(app, workload, datetime.utcnow())
+    results = []
+    for name, request in scenarios(fixture, workload).items():
+        if only and name not in only:
+            continue
+        if name not in QUEUED_SCENARIOS:
+            results.append(run_scenario(app, name, request, workload))
+            continue
+        app.config["INGEST_QUEUE_ENABLED"] = True
+        try:
+            results.append(run_scenario(app, name, request, workload, finish=lambda: drain_queue(app)))
+        finally:
+            app.config["INGEST_QUEUE_ENABLED"] = False
+    return results
+
+
+def compare(results: List[Result], baseline: dict, tolerance: float, slack_ms: float = 0.0) -> List[str]:
+    """Regressions of ``results`` against one dialect's baseline entry."""
+    failures = []
+    for result in results:
+        if result.errors:
+            failures.append(f"{result.scenario}: {result.errors} request(s) failed")
+        expected = baseline.get("scenarios", {}).get(result.scenario)
+        if expected is None:
+            continue
+        limit = expected["p95_ms"] * (1 + tolerance) + slack_ms
+        if result.p95_ms > limit:
+            failures.append(f"{result.scenario}: p95 {result.p95_ms:.1f} ms > {limit:.1f} ms")
+        if "drain_ms" in expected:
+            drain_limit = expected["drain_ms"] * (1 + tolerance) + slack_ms
+            if result.drain_ms > drain_limit:
+                failures.append(f"{result.scenario}: drain {result.drain_ms:.1f} ms > {drain_limit:.1f} ms")
+        if result.queries_per_request > expected["queries_per_request"] + QUERY_SLACK:
+            failures.append(
+                f"{result.scenario}: {result.queries_per_request} queries/request > {expected['queries_per_request']}"
+            )
+    return failures
+
+
+def _baseline_entry(result: Result) -> dict:
+    entry = {"p95_ms": result.p95_ms, "queries_per_request": result.queries_per_request}
+    if result.drain_ms:
+        entry["drain_ms"] = result.drain_ms
+    return entry
+
+
+def _print(results: List[Result]) -> None:
+    print(
+        f"{'scenario':<22} {'reqs':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'req/s':>8} {'q/req':>7} {'drain ms':>9}"
+    )
+    for r in results:
+        print(
+            f"{r.scenario:<22} {r.requests:>6} {r.errors:>6} {r.p50_ms:>8.2f} {r.p95_ms:>8.2f} "
+            f"{r.p99_ms:>8.2f} {r.throughput_rps:>8.1f} {r.queries_per_request:>7.2f} {r.drain_ms:>9.1f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    defaults = Workload()
+    for field in ("users", "agents_per_user", "devices_per_agent", "days", "interval_minutes",
+                  "alert_history_per_user", "clients", "requests", "seed"):
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=getattr(defaults, field))
+    parser.add_argument("--database-url", help="scratch database to use instead of a temp SQLite file (tables are dropped)")
+    parser.add_argument("--scenario", action="append", help="run only this scenario (repeatable)")
+    parser.add_argument("--baselines", type=Path, default=BASELINES)
+    parser.add_argument("--tolerance", type=float, default=1.0, help="allowed p95 slowdown over baseline (1.0 = 100%%)")
+    parser.add_argument("--slack-ms", type=float, default=20.0, help="allowed p95 slowdown in ms on top of --tolerance")
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    workload = Workload(**{field: getattr(args, field) for field in asdict(defaults)})
+    app = build_app(args.database_url)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    results = run(app, workload, args.scenario)
+
+    if args.json:
+        print(json.dumps({"dialect": dialect, "workload": asdict(workload), "results": [asdict(r) for r in results]}, indent=2))
+    else:
+        print(f"{dialect}: {workload}")
+        _print(results)
+
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    if args.save_baseline:
+        baselines[dialect] = {
+            "workload": asdict(workload),
+            "scenarios": {r.scenario: _baseline_entry(r) for r in results},
+        }
+        args.baselines.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Saved {dialect} baseline to {args.baselines}")
+        return 0
+
+    baseline = baselines.get(dialect)
+    if baseline is None or baseline["workload"] != asdict(workload):
+        print(f"No {dialect} baseline for this workload; not checking for regressions.")
+        failures = compare(results, {}, args.tolerance)
+    else:
+        failures = compare(results, baseline, args.tolerance, args.slack_ms)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
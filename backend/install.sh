@@ -16,6 +16,12 @@ SERVICE_NAME="wifi-monitor-backend"
 SERVICE_USER="wifi-monitor"
 APP_PORT=5000
 WORKERS=4
+# Threaded workers: each open live stream (GET /stream) holds one thread, not
+# a whole worker, and the timeout only fires for a worker that stops
+# responding, not for a long-lived response.
+WORKER_CLASS=gthread
+THREADS=16
+TIMEOUT=60
 
 echo -e "${GREEN}╔════════════════════════════════════════╗${NC}"
 echo -e "${GREEN}║  WiFi Monitor Backend Installation    ║${NC}"
@@ -153,6 +159,9 @@ Environment="PATH=$INSTALL_DIR/venv/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin
 Environment="BACKEND_ENV_FILE=$ENV_FILE"
 ExecStart=$INSTALL_DIR/venv/bin/gunicorn \
     --workers $WORKERS \
+    --worker-class $WORKER_CLASS \
+    --threads $THREADS \
+    --timeout $TIMEOUT \
     --bind 0.0.0.0:$APP_PORT \
     --access-logfile $INSTALL_DIR/logs/access.log \
     --error-logfile  $INSTALL_DIR/logs/error.log \
@@ -238,5 +247,5 @@ echo ""
 echo -e "${GREEN}Installation location: $INSTALL_DIR${NC}"
 echo -e "${GREEN}Service user:         $SERVICE_USER${NC}"
 echo -e "${GREEN}Listening on port:    $APP_PORT${NC}"
-echo -e "${GREEN}Gunicorn workers:     $WORKERS${NC}"
+echo -e "${GREEN}Gunicorn workers:     $WORKERS x $THREADS threads ($WORKER_CLASS)${NC}"
 echo ""
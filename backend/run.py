@@ -6,11 +6,15 @@ Run this from the `backend` directory with an activated venv:
 
 It imports the application factory and starts Flask's development server.
 """
-from app.app import create_app
+import os
+from app.app import create_app, start_background_services
 
 
 app = create_app()
 
 
 if __name__ == "__main__":
+    # With the reloader only the child process serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
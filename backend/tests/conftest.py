@@ -0,0 +1,160 @@
+"""Shared fixtures for backend tests."""
+from contextlib import contextmanager
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from backend.app.app import create_app
+from backend.app.extensions import db
+from backend.app.models import Agent, Device, DeviceStat, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "INGEST_QUEUE_ENABLED": False,
+        "INGEST_QUEUE_PATH": str(tmp_path / "ingest_queue.db"),
+        "METRICS_QUERY_HEADER": True,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def worker_app(app, tmp_path):
+    """Build more apps on the test database, standing in for other gunicorn workers."""
+    workers = []
+
+    def build(**config):
+        worker = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": app.config["SQLALCHEMY_DATABASE_URI"],
+            "INGEST_QUEUE_ENABLED": False,
+            "INGEST_QUEUE_PATH": str(tmp_path / f"worker_{len(workers)}_queue.db"),
+            **config,
+        })
+        workers.append(worker)
+        return worker
+
+    yield build
+    for worker in workers:
+        with worker.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def agent(app):
+    """Create a user with a registered agent and return (user_id, api_key)."""
+    with app.app_context():
+        user = User(email="owner@example.com")
+        user.set_password("secret123")
+        db.session.add(user)
+        db.session.flush()
+        agent = Agent(name="pi-agent", owner_id=user.id, api_key=Agent.generate_api_key())
+        db.session.add(agent)
+        db.session.commit()
+        return user.id, agent.api_key
+
+
+@pytest.fixture
+def agent_client(app, agent):
+    _, api_key = agent
+    client = app.test_client()
+    client.environ_base["HTTP_X_AGENT_API_KEY"] = api_key
+    return client
+
+
+@pytest.fixture
+def user_client(app, agent):
+    user_id, _ = agent
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return client
+
+
+@pytest.fixture
+def capture_sql(app):
+    """Context manager collecting the SQL statements run on an engine, the app's by default.
+
+    ``with capture_sql() as statements:`` records every statement issued
+    inside the block, e.g. to assert how many queries a request costs.
+    """
+    @contextmanager
+    def capture(engine=None):
+        if engine is None:
+            with app.app_context():
+                engine = db.engine
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+    return capture
+
+
+@pytest.fixture
+def sync_devices(agent_client):
+    """Sync devices through the agent API: the given MAC addresses, or ``count`` generated ones.
+
+    Returns the synced MAC addresses in order.
+    """
+    def sync(*macs, count=0):
+        macs = list(macs) or [f"AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}" for i in range(count)]
+        resp = agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": mac} for mac in macs]})
+        assert resp.status_code == 200
+        return macs
+
+    return sync
+
+
+@pytest.fixture
+def post_stats(agent_client):
+    """Post one stats batch through the agent API and return the response.
+
+    Each usage is a ``(mac_address, bytes_uploaded, bytes_downloaded)`` tuple.
+    """
+    def post(*usage, batch_id=None):
+        body = {"stats": [
+            {"mac_address": mac, "bytes_uploaded": uploaded, "bytes_downloaded": downloaded}
+            for mac, uploaded, downloaded in usage
+        ]}
+        if batch_id is not None:
+            body["batch_id"] = batch_id
+        return agent_client.post("/api/v1/agents/stats", json=body)
+
+    return post
+
+
+@pytest.fixture
+def seed_stats(app):
+    """Create a device and bulk insert its raw stats; returns the device id.
+
+    Each sample is a ``(timestamp, bytes_uploaded, bytes_downloaded)`` tuple.
+    """
+    def seed(owner_id, samples, mac_address="AA:BB:CC:00:00:01", **device_fields):
+        with app.app_context():
+            device = Device(owner_id=owner_id, mac_address=mac_address, **device_fields)
+            db.session.add(device)
+            db.session.flush()
+            rows = [
+                {"device_id": device.id, "timestamp": ts, "bytes_uploaded": uploaded, "bytes_downloaded": downloaded}
+                for ts, uploaded, downloaded in samples
+            ]
+            if rows:
+                db.session.execute(DeviceStat.__table__.insert(), rows)
+            db.session.commit()
+            return device.id
+
+    return seed
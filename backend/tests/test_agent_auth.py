@@ -0,0 +1,32 @@
+"""Tests for cached agent authentication and buffered last_sync writes."""
+from backend.app.models import Agent
+
+
+def test_cached_key_skips_database(app, agent_client, capture_sql):
+    assert agent_client.get("/api/v1/agents/ping").status_code == 200
+
+    with capture_sql() as statements:
+        agent_client.get("/api/v1/agents/ping")
+
+    assert statements == []
+
+
+def test_deactivation_invalidates_cache(app, agent_client, user_client):
+    assert agent_client.get("/api/v1/agents/ping").status_code == 200
+    with app.app_context():
+        agent_id = Agent.query.one().id
+
+    resp = user_client.post(f"/api/v1/agents/{agent_id}/deactivate")
+
+    assert resp.status_code == 200
+    assert agent_client.get("/api/v1/agents/ping").status_code == 401
+
+
+def test_last_sync_is_flushed_in_bulk(app, agent_client, user_client):
+    agent_client.get("/api/v1/agents/ping")
+    with app.app_context():
+        assert Agent.query.one().last_sync is None
+
+    agents = user_client.get("/api/v1/agents").get_json()["data"]
+
+    assert agents[0]["last_sync"] is not None
@@ -0,0 +1,60 @@
+"""Tests for bulk agent stats ingestion."""
+from backend.app.extensions import db
+from backend.app.models import Alert, AlertHistory, Device, DeviceStat
+
+
+def test_ingest_skips_unknown_macs_and_reports_timings(app, sync_devices, post_stats):
+    macs = sync_devices(count=3)
+
+    resp = post_stats(*[(mac, 10, 5) for mac in macs], ("FF:FF:FF:FF:FF:FF", 1, 0))
+
+    assert resp.status_code == 201
+    data = resp.get_json()["data"]
+    assert data["ingested_count"] == 3
+    assert data["ingested_macs"] == macs
+    assert set(data["timings_ms"]) >= {"resolve_ms", "insert_ms", "alerts_ms", "total_ms"}
+    with app.app_context():
+        assert DeviceStat.query.count() == 3
+
+
+def test_ingest_query_count_does_not_grow_with_devices(app, agent, sync_devices, post_stats, capture_sql):
+    user_id, _ = agent
+    with app.app_context():
+        db.session.add(Alert(user_id=user_id, alert_type="usage_threshold", threshold_value=1))
+        db.session.commit()
+
+    small = sync_devices(count=5)
+    large = sync_devices(count=200)[5:]
+    with capture_sql() as small_queries:
+        post_stats(*[(mac, 1, 1) for mac in small])
+    with capture_sql() as large_queries:
+        resp = post_stats(*[(mac, 1, 1) for mac in large])
+
+    assert resp.status_code == 201
+    with app.app_context():
+        assert AlertHistory.query.count() == 200
+    assert len([q for q in large_queries if "device_stats" in q and q.startswith("INSERT")]) == 1
+    assert len([q for q in large_queries if "devices.mac_address IN" in q]) == 1
+    # The stream listener lookup is cached per second, not issued per request.
+    assert len([q for q in large_queries if "stream_listeners" not in q]) == len(
+        [q for q in small_queries if "stream_listeners" not in q]
+    )
+
+
+def test_data_cap_triggers_once_per_batch(app, agent, sync_devices, post_stats):
+    user_id, _ = agent
+    mac = sync_devices(count=1)[0]
+    with app.app_context():
+        device = Device.query.filter_by(mac_address=mac).one()
+        device.data_cap = 100
+        db.session.commit()
+
+    first = post_stats((mac, 60, 0), (mac, 60, 0)).get_json()["data"]
+    second = post_stats((mac, 60, 0), (mac, 60, 0)).get_json()["data"]
+
+    assert first["alerts_triggered"] == 1
+    assert second["alerts_triggered"] == 0
+    with app.app_context():
+        history = AlertHistory.query.one()
+        assert history.value_at_trigger == 120
+        assert Alert.query.filter_by(user_id=user_id, alert_type="data_cap").count() == 1
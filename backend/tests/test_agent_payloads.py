@@ -0,0 +1,63 @@
+"""Tests for compressed, MessagePack and columnar agent uploads."""
+import gzip
+import json
+import pytest
+from backend.app.models import DeviceStat, Device
+
+
+MACS = [f"AA:BB:CC:00:07:{i:02X}" for i in range(3)]
+
+
+def _columns(records):
+    return {name: [record[name] for record in records] for name in records[0]}
+
+
+def _stats():
+    return [{"mac_address": mac, "bytes_uploaded": 10 * (i + 1), "bytes_downloaded": i} for i, mac in enumerate(MACS)]
+
+
+def _post(client, path, body, content_type="application/json", encoding=None):
+    headers = {"Content-Type": content_type}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return client.post(path, data=body, headers=headers)
+
+
+def test_gzip_columnar_json(app, agent_client):
+    devices = {"devices": _columns([{"mac_address": mac, "hostname": f"h{i}"} for i, mac in enumerate(MACS)])}
+    resp = _post(agent_client, "/api/v1/agents/devices", gzip.compress(json.dumps(devices).encode()), encoding="gzip")
+    assert resp.status_code == 200
+    assert resp.get_json()["data"]["synced_macs"] == MACS
+
+    body = gzip.compress(json.dumps({"stats": _columns(_stats())}).encode())
+    resp = _post(agent_client, "/api/v1/agents/stats", body, encoding="gzip")
+    assert resp.status_code == 201
+    assert resp.get_json()["data"]["ingested_count"] == 3
+    with app.app_context():
+        assert sorted(s.bytes_uploaded for s in DeviceStat.query.all()) == [10, 20, 30]
+        assert {d.hostname for d in Device.query.all()} == {"h0", "h1", "h2"}
+
+
+def test_zstd_msgpack(app, agent_client):
+    msgpack = pytest.importorskip("msgpack")
+    zstandard = pytest.importorskip("zstandard")
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": mac} for mac in MACS]})
+
+    body = zstandard.ZstdCompressor().compress(msgpack.packb({"stats": _columns(_stats())}))
+    resp = _post(agent_client, "/api/v1/agents/stats", body, content_type="application/msgpack", encoding="zstd")
+
+    assert resp.status_code == 201
+    assert resp.get_json()["data"]["ingested_count"] == 3
+
+
+def test_rejects_bad_bodies(app, agent_client):
+    stats = json.dumps({"stats": _columns(_stats())}).encode()
+    assert _post(agent_client, "/api/v1/agents/stats", stats, encoding="br").status_code == 415
+    assert _post(agent_client, "/api/v1/agents/stats", stats, content_type="text/plain").status_code == 415
+    assert _post(agent_client, "/api/v1/agents/stats", b"not gzip", encoding="gzip").status_code == 400
+    ragged = json.dumps({"stats": {"mac_address": MACS, "bytes_uploaded": [1]}}).encode()
+    assert _post(agent_client, "/api/v1/agents/stats", ragged).status_code == 400
+
+    app.config["AGENT_MAX_PAYLOAD_BYTES"] = 1024
+    bomb = gzip.compress(b'{"stats": [' + b" " * 100000 + b"]}")
+    assert _post(agent_client, "/api/v1/agents/stats", bomb, encoding="gzip").status_code == 413
@@ -0,0 +1,62 @@
+"""Tests for keyset-paginated alert history."""
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import Alert, AlertHistory, Device
+
+
+def _seed(app, user_id, count=23):
+    now = datetime.utcnow()
+    with app.app_context():
+        devices = [Device(owner_id=user_id, mac_address=f"AA:BB:CC:00:03:0{i}", hostname=f"host-{i}") for i in range(3)]
+        db.session.add_all(devices)
+        db.session.flush()
+        alerts = [
+            Alert(user_id=user_id, device_id=device.id, alert_type="data_usage", threshold_value=10, is_enabled=True)
+            for device in devices
+        ]
+        db.session.add_all(alerts)
+        db.session.flush()
+        # Pairs of entries share a timestamp so the id tiebreak matters.
+        db.session.add_all([
+            AlertHistory(
+                alert_id=alerts[i % 3].id,
+                device_id=devices[i % 3].id,
+                triggered_at=now - timedelta(minutes=i // 2),
+                value_at_trigger=i,
+            )
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def test_cursor_pages_cover_history_once(app, agent, user_client, capture_sql):
+    _seed(app, agent[0])
+
+    seen, cursor = [], None
+    with capture_sql() as statements:
+        while True:
+            url = "/api/v1/alerts/history?limit=5" + (f"&cursor={cursor}" if cursor else "")
+            body = user_client.get(url).get_json()
+            seen.extend(body["data"])
+            cursor = body["meta"]["next_cursor"]
+            assert body["meta"]["has_more"] == (cursor is not None)
+            if not cursor:
+                break
+
+    assert len(seen) == 23
+    assert len({item["id"] for item in seen}) == 23
+    keys = [(item["triggered_at"], item["id"]) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+    assert all(item["alert_type"] == "data_usage" and item["device_hostname"] for item in seen)
+    # One joined statement per page (plus the cache's generation lookup); no lazy loads.
+    statements = [s for s in statements if "owner_generations" not in s]
+    assert len(statements) == 5
+    assert all("FROM alert_history JOIN alerts" in s for s in statements)
+
+
+def test_offset_and_bad_cursor(app, agent, user_client):
+    _seed(app, agent[0], count=4)
+    data = user_client.get("/api/v1/alerts/history?limit=2&offset=3").get_json()["data"]
+    assert [item["value_at_trigger"] for item in data] == [2]
+    assert user_client.get("/api/v1/alerts/history?cursor=!!!").status_code == 400
+    assert user_client.get("/api/v1/alerts/history?limit=0").status_code == 400
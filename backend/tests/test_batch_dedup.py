@@ -0,0 +1,82 @@
+"""Tests for idempotent stats batches."""
+import sqlite3
+import pytest
+from backend.app.models import DeviceStat, DeviceUsageCounter
+from backend.app.services.batch_dedup import DUPLICATE, NEW, STALE, BatchWindow
+from backend.app.services.ingest_queue import IngestQueue, drain_once, get_ingest_queue
+
+
+MAC = "AA:BB:CC:00:08:01"
+
+
+@pytest.fixture
+def send(sync_devices, post_stats):
+    """Post 10 B for ``MAC`` as the given batch."""
+    sync_devices(MAC)
+    return lambda batch_id: post_stats((MAC, 10, 0), batch_id=batch_id)
+
+
+def test_retried_batch_is_counted_once(app, send):
+    assert send(1).status_code == 201
+    retry = send(1)
+    assert retry.status_code == 200
+    assert retry.get_json()["data"] == {"batch_id": 1, "duplicate": True}
+    assert send(2).status_code == 201
+
+    with app.app_context():
+        assert DeviceStat.query.count() == 2
+        assert DeviceUsageCounter.query.one().bytes_uploaded == 20
+
+
+def test_queued_duplicates_are_dropped_by_the_writer(app, send):
+    app.config["INGEST_QUEUE_ENABLED"] = True
+    # Neither copy is committed yet, so both are accepted into the queue.
+    assert send(7).status_code == 202
+    assert send(7).status_code == 202
+
+    assert drain_once(app, get_ingest_queue(app), batch_size=10) == 2
+    with app.app_context():
+        assert DeviceStat.query.count() == 1
+    assert send(7).status_code == 200
+
+
+def test_stale_batch_gets_next_id(app, send):
+    app.config["INGEST_DEDUP_WINDOW"] = 2
+    for batch_id in (10, 11, 12):
+        assert send(batch_id).status_code == 201
+
+    stale = send(5)
+    assert stale.status_code == 409
+    assert stale.get_json()["data"]["next_batch_id"] == 13
+    assert send(10).status_code == 200
+    assert send("x").status_code == 400
+
+
+def test_window_eviction():
+    window = BatchWindow()
+    for batch_id in (1, 3, 2, 5, 4):
+        assert window.classify(batch_id) == NEW
+        window.add(batch_id, size=3)
+
+    assert window.watermark == 2
+    assert window.recent == [3, 4, 5]
+    assert [window.classify(i) for i in (1, 2, 4, 6)] == [STALE, DUPLICATE, DUPLICATE, NEW]
+    assert window.next_batch_id() == 6
+    assert BatchWindow.decode(window.watermark, window.encode()).recent == [3, 4, 5]
+
+
+def test_queue_file_from_before_batch_ids_is_upgraded(tmp_path):
+    path = tmp_path / "old_queue.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE ingest_queue (id INTEGER PRIMARY KEY AUTOINCREMENT, owner_id INTEGER NOT NULL, "
+        "received_at TEXT NOT NULL, payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+        "lease_until REAL, last_error TEXT)"
+    )
+    conn.execute("INSERT INTO ingest_queue (owner_id, received_at, payload) VALUES (1, '2026-01-01T00:00:00', '[]')")
+    conn.commit()
+    conn.close()
+
+    entry = IngestQueue(str(path)).claim(10)[0]
+
+    assert (entry.owner_id, entry.agent_id, entry.batch_id) == (1, None, None)
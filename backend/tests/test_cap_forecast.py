@@ -0,0 +1,94 @@
+"""Tests for decayed usage rates and cap-exhaustion forecasts."""
+import math
+from datetime import datetime, timedelta
+import pytest
+from backend.app.extensions import db
+from backend.app.models import Alert, AlertHistory, Device
+from backend.app.services.counter_service import decayed_rate, fold_sample
+from backend.app.services.ingest_service import ingest_stats_batch
+
+
+MAC = "AA:BB:CC:00:08:01"
+TAU = 24 * 3600 / math.log(2)
+
+
+def _device(app, sync_devices, data_cap):
+    sync_devices(MAC)
+    with app.app_context():
+        device = Device.query.filter_by(mac_address=MAC).one()
+        device.data_cap = data_cap
+        db.session.commit()
+        return device.id
+
+
+def _ingest_minutes(app, owner_id, start, minutes, bytes_per_minute):
+    with app.app_context():
+        for minute in range(minutes):
+            ingest_stats_batch(
+                owner_id,
+                [{"mac_address": MAC, "bytes_uploaded": bytes_per_minute, "bytes_downloaded": 0}],
+                now=start + timedelta(minutes=minute),
+            )
+
+
+def test_steady_rate_is_recovered_without_warm_up_bias():
+    start = datetime(2026, 1, 1)
+    state = None
+    for minute in range(121):
+        state = fold_sample(state, start + timedelta(minutes=minute), 6000, TAU)
+
+    assert decayed_rate(state, start + timedelta(minutes=120), TAU) == pytest.approx(100, rel=0.01)
+    # Out-of-order samples count without moving the clock back.
+    late = fold_sample(state, start, 6000, TAU)
+    assert late[1] == state[1] and late[0] > state[0]
+    # Idle devices decay towards zero.
+    assert decayed_rate(state, start + timedelta(days=10), TAU) < 1
+    assert decayed_rate(fold_sample(None, start, 500, TAU), start + timedelta(minutes=1), TAU) is None
+
+
+def test_forecast_endpoint_projects_exhaustion(app, agent, sync_devices, user_client):
+    device_id = _device(app, sync_devices, data_cap=10 ** 6)
+    start = datetime.utcnow() - timedelta(minutes=30)
+    _ingest_minutes(app, agent[0], start, 31, 6000)
+
+    forecast = user_client.get(f"/api/v1/devices/{device_id}/forecast").get_json()["data"]
+    assert forecast["used_bytes"] == 31 * 6000
+    assert forecast["remaining_bytes"] == 10 ** 6 - 31 * 6000
+    assert forecast["rate_bytes_per_second"] == pytest.approx(100, rel=0.01)
+    assert forecast["seconds_to_cap"] == pytest.approx((10 ** 6 - 31 * 6000) / 100, rel=0.01)
+    assert forecast["exhausts_at"] is not None
+
+    assert user_client.get("/api/v1/devices/999999/forecast").status_code == 404
+
+
+def test_ingest_updates_rates_without_reading_raw_stats(app, agent, sync_devices, capture_sql):
+    _device(app, sync_devices, data_cap=10 ** 9)
+    start = datetime.utcnow() - timedelta(minutes=5)
+    _ingest_minutes(app, agent[0], start, 2, 6000)
+
+    with app.app_context(), capture_sql() as statements:
+        ingest_stats_batch(agent[0], [{"mac_address": MAC, "bytes_uploaded": 6000}], now=start + timedelta(minutes=2))
+
+    reads = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert reads and not any("device_stats" in s for s in reads)
+
+
+def test_forecast_cap_alert_fires_once_within_lead_time(app, agent, sync_devices):
+    device_id = _device(app, sync_devices, data_cap=10 ** 7)
+    with app.app_context():
+        db.session.add(Alert(user_id=agent[0], device_id=None, alert_type="forecast_cap", threshold_value=1))
+        db.session.commit()
+
+    # 100 B/s with ~10 MB left is more than a day away: no alert.
+    start = datetime.utcnow() - timedelta(minutes=12)
+    _ingest_minutes(app, agent[0], start, 10, 6000)
+    with app.app_context():
+        assert AlertHistory.query.count() == 0
+
+    # 1 MB/min leaves minutes of headroom: one alert, not repeated.
+    _ingest_minutes(app, agent[0], start + timedelta(minutes=10), 3, 10 ** 6)
+    with app.app_context():
+        history = AlertHistory.query.all()
+        assert len(history) == 1
+        assert history[0].device_id == device_id
+        assert 0 < history[0].value_at_trigger <= 3600
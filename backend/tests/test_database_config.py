@@ -0,0 +1,32 @@
+"""Tests for Settings-driven engine configuration."""
+from backend.app.config.database import engine_options, engine_report
+from backend.app.config.settings import Settings
+from backend.app.extensions import db
+
+
+def test_sqlite_connections_get_pragmas(app):
+    with app.app_context():
+        report = engine_report(db.engine)
+
+    assert report["dialect"] == "sqlite"
+    assert report["pragmas"]["journal_mode"] == "wal"
+    assert report["pragmas"]["synchronous"] == 1
+    assert report["pragmas"]["busy_timeout"] == 5000
+    assert report["pragmas"]["cache_size"] == -65536
+
+
+def test_server_database_gets_pool_options(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "4")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "600")
+    settings = Settings()
+
+    options = engine_options(settings, "postgresql://user:secret@db/wifi")
+
+    assert options == {
+        "pool_size": 4,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_recycle": 600,
+        "pool_pre_ping": True,
+    }
+    assert "pool_size" not in engine_options(settings, "sqlite:///wifi.db")
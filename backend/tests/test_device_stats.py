@@ -0,0 +1,51 @@
+"""Tests for SQL bucketing and downsampling of device stats."""
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.app.models import DeviceStat, epoch_bucket
+from backend.app.services.usage_service import lttb
+
+
+def _points(values):
+    start = datetime(2026, 1, 1)
+    return [
+        {"timestamp": (start + timedelta(minutes=i)).isoformat(), "bytes_uploaded": v, "bytes_downloaded": 0}
+        for i, v in enumerate(values)
+    ]
+
+
+def test_epoch_bucket_compiles_per_dialect():
+    expr = epoch_bucket(DeviceStat.timestamp, 300)
+    assert "strftime('%s'" in str(expr.compile(dialect=sqlite.dialect()))
+    assert "EXTRACT(EPOCH FROM" in str(expr.compile(dialect=postgresql.dialect()))
+
+
+def test_lttb_keeps_ends_and_peaks():
+    values = [1] * 1000
+    values[437] = 500
+    points = _points(values)
+
+    sampled = lttb(points, 50)
+
+    assert len(sampled) == 50
+    assert sampled[0] is points[0] and sampled[-1] is points[-1]
+    assert points[437] in sampled
+    assert lttb(points[:10], 50) == points[:10]
+
+
+def test_max_points_bounds_response(app, agent, user_client, seed_stats):
+    now = datetime.utcnow()
+    device_id = seed_stats(agent[0], [(now - timedelta(seconds=30 * i), i, 0) for i in range(1, 2000)])
+
+    raw = user_client.get(f"/api/v1/devices/{device_id}/stats?hours=24").get_json()["data"]
+    capped = user_client.get(f"/api/v1/devices/{device_id}/stats?hours=24&max_points=100").get_json()["data"]
+    bucketed = user_client.get(
+        f"/api/v1/devices/{device_id}/stats?hours=24&bucket_minutes=5&max_points=20"
+    ).get_json()["data"]
+    invalid = user_client.get(f"/api/v1/devices/{device_id}/stats?max_points=1")
+
+    assert len(raw) == 1999
+    assert raw[0]["total_bytes"] == 1999
+    assert len(capped) == 100
+    assert all(point.keys() == raw[0].keys() for point in capped + bucketed)
+    assert len(bucketed) == 20
+    assert invalid.status_code == 400
@@ -0,0 +1,44 @@
+"""Tests for agent device sync bulk upsert."""
+import pytest
+from backend.app.extensions import db
+from backend.app.models import Device, upsert
+
+
+def _sync(client, devices):
+    resp = client.post("/api/v1/agents/devices", json={"devices": devices})
+    assert resp.status_code == 200
+    return resp.get_json()["data"]
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_sync_keeps_existing_fields_when_missing(app, agent_client, monkeypatch, native):
+    if not native:
+        monkeypatch.setattr(upsert, "_ON_CONFLICT_DIALECTS", {})
+    _sync(agent_client, [{"mac_address": "AA:00", "hostname": "laptop", "ip_address": "10.0.0.2"}])
+    with app.app_context():
+        device = Device.query.filter_by(mac_address="AA:00").one()
+        device.data_cap = 500
+        first_seen = device.first_seen
+        db.session.commit()
+
+    data = _sync(agent_client, [
+        {"mac_address": "AA:00", "hostname": "", "ip_address": "10.0.0.9"},
+        {"mac_address": "BB:00", "device_type": "phone"},
+        {"ip_address": "10.0.0.3"},
+    ])
+
+    assert data == {"synced_count": 2, "synced_macs": ["AA:00", "BB:00"]}
+    with app.app_context():
+        device = Device.query.filter_by(mac_address="AA:00").one()
+        assert (device.hostname, device.ip_address, device.data_cap) == ("laptop", "10.0.0.9", 500)
+        assert device.first_seen == first_seen
+        assert Device.query.filter_by(mac_address="BB:00").one().device_type == "phone"
+
+
+def test_sync_is_a_single_write_statement(app, agent_client, capture_sql):
+    with capture_sql() as statements:
+        _sync(agent_client, [{"mac_address": f"CC:{i:04d}"} for i in range(300)])
+
+    writes = [s for s in statements if s.startswith("INSERT INTO devices")]
+    assert len(writes) == 1
+    assert "ON CONFLICT" in writes[0]
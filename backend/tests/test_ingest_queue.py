@@ -0,0 +1,182 @@
+"""Tests for the durable write-behind ingest queue."""
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.exc import OperationalError
+from backend.app.models import DeviceStat, DeviceUsageCounter, aggregate_device_usage
+from backend.app.services import ingest_queue
+from backend.app.services.counter_service import reconcile_counters
+from backend.app.services.ingest_queue import drain_once, get_ingest_queue
+from backend.app.services.ingest_service import ingest_stats_batch
+from backend.app.services.rollup_service import compact_rollups
+
+
+@pytest.fixture
+def queued_app(app):
+    app.config["INGEST_QUEUE_ENABLED"] = True
+    return app
+
+
+def test_stats_are_accepted_then_written_in_bulk(queued_app, sync_devices, post_stats, user_client):
+    macs = sync_devices(count=3)
+    for _ in range(4):
+        resp = post_stats(*[(mac, 10, 1) for mac in macs])
+        assert resp.status_code == 202
+        assert resp.get_json()["data"]["accepted_count"] == 3
+
+    queue = get_ingest_queue(queued_app)
+    with queued_app.app_context():
+        assert DeviceStat.query.count() == 0
+    assert user_client.get("/api/v1/system/ingest-queue").status_code == 403
+    queued_app.config["ADMIN_EMAILS"] = frozenset({"owner@example.com"})
+    assert user_client.get("/api/v1/system/ingest-queue").get_json()["data"]["depth"] == 4
+
+    assert drain_once(queued_app, queue, batch_size=10) == 4
+    assert drain_once(queued_app, queue, batch_size=10) == 0
+
+    with queued_app.app_context():
+        assert DeviceStat.query.count() == 12
+        assert sum(c.bytes_uploaded for c in DeviceUsageCounter.query.all()) == 120
+    metrics = user_client.get("/api/v1/system/ingest-queue").get_json()["data"]
+    assert metrics["depth"] == 0
+    assert metrics["enqueued"] == 4
+    assert metrics["batches_written"] == 1
+    assert metrics["entries_written"] == 4
+
+
+def test_full_queue_returns_retry_after(queued_app, agent_client):
+    queued_app.config["INGEST_QUEUE_MAX_DEPTH"] = 2
+    queued_app.config["INGEST_QUEUE_RETRY_AFTER_SECONDS"] = 7
+    payload = {"stats": [{"mac_address": "AA:BB:CC:00:04:00", "bytes_uploaded": 1}]}
+
+    assert agent_client.post("/api/v1/agents/stats", json=payload).status_code == 202
+    assert agent_client.post("/api/v1/agents/stats", json=payload).status_code == 202
+    resp = agent_client.post("/api/v1/agents/stats", json=payload)
+
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "7"
+    assert get_ingest_queue(queued_app).stats()["rejected"] == 1
+    assert agent_client.post("/api/v1/agents/stats", json={"stats": "nope"}).status_code == 400
+
+
+def _entry_state(queue):
+    return queue._connect().execute("SELECT attempts, retries, lease_until - ? FROM ingest_queue", (time.time(),)).fetchone()
+
+
+def _end_backoff(queue):
+    queue._connect().execute("UPDATE ingest_queue SET lease_until = NULL")
+
+
+def test_failed_batch_is_retried_after_backoff(queued_app, sync_devices, post_stats, monkeypatch):
+    macs = sync_devices(count=1)
+    post_stats((macs[0], 5, 0))
+    queue = get_ingest_queue(queued_app)
+
+    def boom(payloads):
+        raise RuntimeError("cannot write")
+
+    monkeypatch.setattr(ingest_queue, "ingest_queued_payloads", boom)
+    assert drain_once(queued_app, queue, batch_size=10) == 0
+    assert queue.stats()["failures"] == 1
+    assert queue.depth() == 1
+    attempts, retries, delay = _entry_state(queue)
+    assert (attempts, retries) == (1, 1) and 1 < delay <= 2
+
+    monkeypatch.undo()
+    assert drain_once(queued_app, queue, batch_size=10) == 0
+    _end_backoff(queue)
+    assert drain_once(queued_app, queue, batch_size=10) == 1
+    with queued_app.app_context():
+        assert DeviceStat.query.one().bytes_uploaded == 5
+
+
+def test_bad_values_are_rejected_before_queueing(queued_app, agent_client):
+    for value in ("abc", -1, 1.5, True):
+        resp = agent_client.post("/api/v1/agents/stats", json={
+            "stats": [{"mac_address": "AA:BB:CC:00:04:00", "bytes_uploaded": value}]
+        })
+        assert resp.status_code == 400
+    assert get_ingest_queue(queued_app).depth() == 0
+
+
+def test_unwritable_entry_does_not_fail_its_batch(queued_app, agent, sync_devices):
+    macs = sync_devices(count=2)
+    queue = get_ingest_queue(queued_app)
+    queue.enqueue(agent[0], [{"mac_address": macs[0], "bytes_uploaded": 3}])
+    poison = queue.enqueue(agent[0], [{"mac_address": macs[1], "bytes_uploaded": "abc"}])
+    queue.enqueue(agent[0], [{"mac_address": macs[1], "bytes_uploaded": 4}])
+
+    assert drain_once(queued_app, queue, batch_size=10) == 2
+
+    with queued_app.app_context():
+        assert sorted(s.bytes_uploaded for s in DeviceStat.query.all()) == [3, 4]
+    assert queue.depth() == 1
+    _end_backoff(queue)
+    assert [entry.id for entry in queue.claim(10)] == [poison]
+
+
+def test_payload_drained_after_compaction_is_still_counted(queued_app, agent, sync_devices):
+    macs = sync_devices(count=1)
+    now = datetime.utcnow()
+    with queued_app.app_context():
+        ingest_stats_batch(agent[0], [{"mac_address": macs[0], "bytes_uploaded": 100}], now=now - timedelta(minutes=20))
+    queue = get_ingest_queue(queued_app)
+    queue.enqueue(agent[0], [{"mac_address": macs[0], "bytes_uploaded": 7}], received_at=now - timedelta(minutes=10))
+
+    with queued_app.app_context():
+        compact_rollups(now)
+    assert drain_once(queued_app, queue, batch_size=10) == 1
+
+    with queued_app.app_context():
+        device_id = DeviceStat.query.first().device_id
+        assert aggregate_device_usage(device_id)["total_bytes"] == 107
+        compact_rollups(datetime.utcnow() + timedelta(minutes=5))
+        assert aggregate_device_usage(device_id)["total_bytes"] == 107
+        assert DeviceUsageCounter.query.one().bytes_uploaded == 107
+        reconcile_counters()
+        assert DeviceUsageCounter.query.one().bytes_uploaded == 107
+
+
+def test_database_outage_backs_off_without_spending_attempts(queued_app, sync_devices, post_stats, monkeypatch):
+    macs = sync_devices(count=1)
+    for _ in range(2):
+        post_stats((macs[0], 5, 0))
+    queue = get_ingest_queue(queued_app)
+
+    def outage(payloads):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(ingest_queue, "ingest_queued_payloads", outage)
+    for _ in range(queue.max_attempts + 1):
+        assert drain_once(queued_app, queue, batch_size=10) == 0
+        _end_backoff(queue)
+    assert drain_once(queued_app, queue, batch_size=10) == 0
+    attempts, retries, delay = _entry_state(queue)
+    assert attempts == 0 and retries == queue.max_attempts + 2
+    assert delay > 60
+    assert queue.stats()["failures"] == queue.max_attempts + 2
+
+    monkeypatch.undo()
+    _end_backoff(queue)
+    assert drain_once(queued_app, queue, batch_size=10) == 2
+    assert queue.stats()["dead_letters"] == 0
+
+
+def test_admins_can_requeue_dead_letters(queued_app, agent, sync_devices, user_client):
+    macs = sync_devices(count=1)
+    queue = get_ingest_queue(queued_app)
+    entry_id = queue.enqueue(agent[0], [{"mac_address": macs[0], "bytes_uploaded": 5}])
+    for _ in range(queue.max_attempts):
+        queue.release([entry_id], "RuntimeError()")
+    assert queue.stats()["dead_letters"] == 1
+    assert queue.depth() == 0
+
+    url = "/api/v1/system/ingest-queue/dead-letters/requeue"
+    assert user_client.post(url).status_code == 403
+    queued_app.config["ADMIN_EMAILS"] = frozenset({"owner@example.com"})
+    assert user_client.post(url, json={"ids": ["x"]}).status_code == 400
+    assert user_client.post(url, json={"ids": [entry_id + 1]}).get_json()["data"]["requeued"] == 0
+    assert user_client.post(url, json={"ids": [entry_id]}).get_json()["data"]["requeued"] == 1
+
+    assert queue.stats()["dead_letters"] == 0
+    assert drain_once(queued_app, queue, batch_size=10) == 1
@@ -0,0 +1,145 @@
+"""Tests for the background job runner."""
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import Alert, AlertHistory, JobState, Notification
+from backend.app.services.voice_dispatcher import get_voice_dispatcher
+from backend.app.tasks import JOBS, get_job_runner, jobs
+
+
+def test_run_records_state_and_duration(app):
+    runner = get_job_runner(app)
+
+    result = runner.run("reconcile_counters")
+
+    assert result["status"] == "ok"
+    assert result["result"] == {"devices": 0}
+    status = runner.status()["reconcile_counters"]
+    assert status["runs"] == 1 and status["failures"] == 0
+    assert status["duration_seconds"]["count"] == 1
+    assert status["state"]["last_status"] == "ok"
+    assert status["state"]["locked_by"] is None
+    assert status["state"]["run_count"] == 1
+    assert set(runner.status()) == set(JOBS)
+
+
+def test_job_is_skipped_while_another_process_holds_the_lease(app):
+    with app.app_context():
+        db.session.add(JobState(
+            name="prune_retention",
+            locked_by="other-host:1:1",
+            locked_until=datetime.utcnow() + timedelta(minutes=5),
+            run_count=0,
+        ))
+        db.session.commit()
+    runner = get_job_runner(app)
+
+    assert runner.run("prune_retention")["status"] == "skipped"
+    assert runner.status()["prune_retention"]["skipped"] == 1
+
+    with app.app_context():
+        db.session.get(JobState, "prune_retention").locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+    assert runner.run("prune_retention")["status"] == "ok"
+
+
+def test_digest_writes_notifications_and_queues_delivery(app, agent, monkeypatch):
+    user_id, _ = agent
+    with app.app_context():
+        alert = Alert(user_id=user_id, alert_type="data_usage", threshold_value=10, is_enabled=True)
+        db.session.add(alert)
+        db.session.flush()
+        db.session.add_all([
+            AlertHistory(alert_id=alert.id, triggered_at=datetime.utcnow() - timedelta(hours=i), value_at_trigger=i)
+            for i in range(3)
+        ])
+        db.session.commit()
+    runner = get_job_runner(app)
+    queued = []
+    monkeypatch.setattr(runner, "enqueue", queued.append)
+
+    result = runner.run("digest_alerts")
+
+    assert result["result"] == {"notifications": 1}
+    assert queued == ["deliver_notifications"]
+    with app.app_context():
+        notification = Notification.query.one()
+        assert notification.notification_type == "alert_digest"
+        assert notification.message.startswith("3 alerts since")
+    # The next digest starts where this one ended, so nothing is counted twice.
+    assert runner.run("digest_alerts")["result"] == {"notifications": 0}
+
+
+def test_delivery_sends_opted_in_notifications_once(app, agent, monkeypatch):
+    user_id, _ = agent
+    app.config.update(VOICE_SERVICE_URL="http://voice.invalid", VOICE_SERVICE_ALERT_TYPES="ddos_detected,dos_detected")
+    spoken = []
+    monkeypatch.setattr(get_voice_dispatcher(app), "submit", lambda key, payload: spoken.append(payload) or True)
+    runner = get_job_runner(app)
+
+    def add_digest(age):
+        with app.app_context():
+            created_at = datetime.utcnow() - age
+            db.session.add(Notification(
+                user_id=user_id, message="2 alerts", notification_type="alert_digest", created_at=created_at
+            ))
+            db.session.commit()
+
+    add_digest(timedelta(minutes=1))
+    # Digests are not spoken unless listed like any other alert type.
+    assert runner.run("deliver_notifications")["result"] == {"submitted": 0}
+
+    app.config["VOICE_SERVICE_ALERT_TYPES"] = "ddos_detected,alert_digest"
+    assert runner.run("deliver_notifications")["result"] == {"submitted": 1}
+    assert runner.run("deliver_notifications")["result"] == {"submitted": 0}
+
+    # A digest stamped before the last delivery ran is still delivered.
+    add_digest(timedelta(hours=1))
+    assert runner.run("deliver_notifications")["result"] == {"submitted": 1}
+    add_digest(timedelta(days=2))
+    assert runner.run("deliver_notifications")["result"] == {"submitted": 0}
+    assert [payload["alert_type"] for payload in spoken] == ["alert_digest", "alert_digest"]
+
+
+def test_compaction_continues_when_rotation_fails(app, monkeypatch):
+    def fail(now):
+        raise RuntimeError("updated partition constraint for default partition would be violated")
+
+    monkeypatch.setattr(jobs, "rotate_partitions", fail)
+    result = get_job_runner(app).run("compact_rollups")
+
+    assert result["status"] == "ok"
+    assert "default partition" in result["result"]["rotation_error"]
+    assert "60" in result["result"]["written"]
+
+
+def test_jobs_api(app, user_client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(get_job_runner(app), "enqueue", queued.append)
+    assert user_client.get("/api/v1/system/jobs").status_code == 403
+    assert user_client.post("/api/v1/system/jobs/prune_retention/run").status_code == 403
+    assert queued == []
+
+    app.config["ADMIN_EMAILS"] = frozenset({"owner@example.com"})
+    listing = user_client.get("/api/v1/system/jobs")
+    assert listing.status_code == 200
+    assert "compact_rollups" in listing.get_json()["data"]
+
+    assert user_client.post("/api/v1/system/jobs/prune_retention/run").status_code == 202
+    assert queued == ["prune_retention"]
+    assert user_client.post("/api/v1/system/jobs/nope/run").status_code == 404
+
+
+def test_create_app_starts_no_background_threads(tmp_path):
+    import threading
+    from backend.app.app import create_app
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "INGEST_QUEUE_PATH": str(tmp_path / "queue.db"),
+        "JOB_SCHEDULER_ENABLED": True,
+        "INGEST_QUEUE_ENABLED": True,
+    })
+
+    assert not app.testing
+    assert not get_job_runner(app)._scheduler.running
+    assert not any(thread.name.startswith("ingest-writer") for thread in threading.enumerate())
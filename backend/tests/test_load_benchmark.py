@@ -0,0 +1,41 @@
+"""Smoke test for the load benchmark so it keeps working as the API changes."""
+from dataclasses import replace
+from backend.app.extensions import db
+from backend.app.models import AlertHistory
+from backend.app.services.ingest_queue import get_ingest_queue
+from backend.benchmarks.load import USAGE_THRESHOLD, Workload, build_app, compare, percentile, run
+
+
+def test_small_run_succeeds_and_regressions_are_flagged(tmp_path):
+    app = build_app(f"sqlite:///{tmp_path / 'bench.db'}")
+    workload = Workload(users=1, agents_per_user=2, devices_per_agent=3, days=1, interval_minutes=60,
+                        alert_history_per_user=20, clients=2, requests=8)
+    try:
+        results = run(app, workload)
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+
+    assert [r.scenario for r in results] == [
+        "ingest_stats", "ingest_stats_queued", "sync_devices", "get_device_stats", "recent_alert_history",
+    ]
+    assert all(r.requests == 8 and r.errors == 0 and r.queries_per_request > 0 for r in results)
+    assert results[1].drain_ms > 0
+    assert get_ingest_queue(app).stats()["entries_written"] == 8
+    with app.app_context():
+        assert AlertHistory.query.filter(AlertHistory.value_at_trigger >= USAGE_THRESHOLD).count() > 0
+    assert compare(results, {}, tolerance=0.5) == []
+
+    baseline = {"scenarios": {r.scenario: {"p95_ms": r.p95_ms, "queries_per_request": r.queries_per_request} for r in results}}
+    assert compare(results, baseline, tolerance=0.0) == []
+    slower = replace(results[0], p95_ms=results[0].p95_ms * 3 + 1, queries_per_request=results[0].queries_per_request + 1)
+    failures = compare([slower], baseline, tolerance=0.5)
+    assert len(failures) == 2 and all(f.startswith("ingest_stats:") for f in failures)
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
@@ -0,0 +1,88 @@
+"""Tests for per-request query counting and the Prometheus metrics endpoint."""
+from backend.app.metrics import Histogram, histogram_samples, sample
+from backend.app.tasks import get_job_runner
+
+
+def test_query_header_counts_statements(app, agent_client, user_client):
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": "AA:BB:CC:00:05:01"}]})
+
+    resp = user_client.get("/api/v1/devices")
+
+    assert resp.status_code == 200
+    assert int(resp.headers["X-DB-Queries"]) > 0
+    assert app.test_client().get("/api/v1/system/health").headers["X-DB-Queries"] == "0"
+
+
+def test_metrics_endpoint_renders_route_histograms(app, user_client):
+    user_client.get("/api/v1/devices")
+    user_client.get("/api/v1/devices/999999")
+    app.test_client().get("/no/such/path")
+    get_job_runner(app).run("reconcile_counters")
+    app.config["ADMIN_EMAILS"] = frozenset({"owner@example.com"})
+
+    resp = user_client.get("/api/v1/system/metrics")
+    body = resp.get_data(as_text=True)
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    labels = 'method="GET",endpoint="/api/v1/devices",status="200"'
+    assert f'http_request_duration_seconds_count{{{labels}}} 1' in body
+    assert f'http_request_db_queries_bucket{{{labels},le="+Inf"}} 1' in body
+    assert f'http_request_db_duration_seconds_sum{{{labels}}}' in body
+    assert 'endpoint="/api/v1/devices/<int:device_id>",status="404"' in body
+    assert 'endpoint="unmatched",status="404"' in body
+    assert 'job_runs_total{job="reconcile_counters"} 1' in body
+    assert "# TYPE http_request_duration_seconds histogram" in body
+
+
+def test_metrics_are_closed_by_default(app, user_client):
+    assert app.test_client().get("/api/v1/system/metrics").status_code == 401
+    assert user_client.get("/api/v1/system/metrics").status_code == 403
+
+    app.config["METRICS_PUBLIC"] = True
+    assert app.test_client().get("/api/v1/system/metrics").status_code == 200
+
+
+def test_metrics_token_and_disabled_instrumentation(tmp_path):
+    from backend.app.app import create_app
+
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'metrics.db'}",
+        "INGEST_QUEUE_ENABLED": False,
+        "METRICS_ENABLED": False,
+        "METRICS_TOKEN": "scrape-secret",
+    })
+    client = app.test_client()
+
+    assert client.get("/api/v1/system/metrics").status_code == 401
+    resp = client.get("/api/v1/system/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert resp.status_code == 200
+    assert "http_request_duration_seconds" not in resp.get_data(as_text=True)
+    assert "X-DB-Queries" not in resp.headers
+
+
+def test_query_header_is_opt_in(tmp_path):
+    from backend.app.app import create_app
+
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'metrics.db'}",
+        "INGEST_QUEUE_ENABLED": False,
+    })
+    assert "X-DB-Queries" not in app.test_client().get("/api/v1/system/health").headers
+
+
+def test_histogram_samples_escape_labels():
+    histogram = Histogram(buckets=(1, 2))
+    histogram.observe(1.5)
+    lines = histogram_samples("latency", {"endpoint": 'a"b'}, histogram.snapshot())
+
+    assert lines == [
+        'latency_bucket{endpoint="a\\"b",le="1.0"} 0',
+        'latency_bucket{endpoint="a\\"b",le="2.0"} 1',
+        'latency_bucket{endpoint="a\\"b",le="+Inf"} 1',
+        'latency_sum{endpoint="a\\"b"} 1.5',
+        'latency_count{endpoint="a\\"b"} 1',
+    ]
+    assert sample("up", {}, 1) == "up 1"
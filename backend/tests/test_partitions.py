@@ -0,0 +1,99 @@
+"""Tests for monthly device_stats partitioning and partition pruning."""
+import math
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from backend.app.extensions import db
+from backend.app.models import (
+    DeviceStat,
+    aggregate_device_usage,
+    delete_device_stats,
+    device_usage_series,
+    drop_partitions_before,
+    rotate_partitions,
+    stats_source,
+)
+from backend.app.models.partitions import _create_initial_partitions, existing_partitions, month_start, partition_name
+
+
+NOW = datetime(2024, 4, 15, 12, 0)
+
+
+def _seed(seed_stats, user_id):
+    """150 B every 7 hours from January 20 until ``NOW``; returns the device id and sample count."""
+    start, step = datetime(2024, 1, 20), timedelta(hours=7)
+    samples = [(start + i * step, 100, 50) for i in range(math.ceil((NOW - start) / step))]
+    return seed_stats(user_id, samples, mac_address="AA:BB:CC:00:00:09"), len(samples)
+
+
+def test_rotation_keeps_reads_unchanged(app, agent, seed_stats):
+    device_id, count = _seed(seed_stats, agent[0])
+    with app.app_context():
+        start, end = datetime(2024, 2, 10), datetime(2024, 4, 2)
+        before = aggregate_device_usage(device_id, start, end)
+        series = device_usage_series(device_id, datetime(2024, 1, 1), None, 86400)
+
+        moved = rotate_partitions(NOW)
+        db.session.commit()
+
+        assert set(moved) == {"device_stats_p202401", "device_stats_p202402", "device_stats_p202403"}
+        assert DeviceStat.query.filter(DeviceStat.timestamp < datetime(2024, 4, 1)).count() == 0
+        assert aggregate_device_usage(device_id, start, end) == before
+        assert aggregate_device_usage(device_id)["total_bytes"] == count * 150
+        assert device_usage_series(device_id, datetime(2024, 1, 1), None, 86400) == series
+        assert rotate_partitions(NOW) == {}
+
+
+def test_stats_source_prunes_to_overlapping_months(app, agent, seed_stats):
+    _seed(seed_stats, agent[0])
+    with app.app_context():
+        rotate_partitions(NOW)
+        db.session.commit()
+
+        sql = str(stats_source(datetime(2024, 2, 5), datetime(2024, 2, 20)))
+        assert "device_stats_p202402" in sql
+        assert "device_stats_p202401" not in sql
+        assert "device_stats_p202403" not in sql
+        assert stats_source(datetime(2024, 4, 2)) is DeviceStat.__table__
+
+
+def test_drop_and_delete_cover_partitions(app, agent, seed_stats):
+    device_id, _ = _seed(seed_stats, agent[0])
+    with app.app_context():
+        rotate_partitions(NOW)
+        dropped = drop_partitions_before(datetime(2024, 3, 1))
+        db.session.commit()
+
+        assert dropped == ["device_stats_p202401", "device_stats_p202402"]
+        assert existing_partitions() == ["device_stats_p202403"]
+        assert aggregate_device_usage(device_id)["total_bytes"] == (
+            db.session.query(db.func.count()).select_from(stats_source()).scalar() * 150
+        )
+
+        assert delete_device_stats(device_id) > 0
+        db.session.commit()
+        assert db.session.query(db.func.count()).select_from(stats_source()).scalar() == 0
+
+
+def test_postgresql_ddl_is_range_partitioned():
+    ddl = str(CreateTable(DeviceStat.__table__).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (timestamp)" in ddl
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+
+
+def test_postgresql_creates_this_and_next_month_with_the_table():
+    class Connection:
+        dialect = postgresql.dialect()
+        statements = []
+
+        def execute(self, statement):
+            self.statements.append(str(statement))
+
+    connection = Connection()
+    _create_initial_partitions(DeviceStat.__table__, connection)
+
+    current = month_start(datetime.utcnow())
+    following = month_start(current + timedelta(days=32))
+    assert "device_stats_default PARTITION OF device_stats DEFAULT" in connection.statements[0]
+    assert f"{partition_name(current)} PARTITION OF device_stats" in connection.statements[1]
+    assert f"{partition_name(following)} PARTITION OF device_stats" in connection.statements[2]
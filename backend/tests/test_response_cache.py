@@ -0,0 +1,51 @@
+"""Tests for the per-owner response cache and conditional GETs."""
+
+
+def test_unchanged_poll_is_one_lookup_and_304(app, agent_client, user_client, capture_sql):
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": "AA:BB:CC:00:05:01"}]})
+    first = user_client.get("/api/v1/devices")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+
+    with capture_sql() as statements:
+        conditional = user_client.get("/api/v1/devices", headers={"If-None-Match": etag})
+        replayed = user_client.get("/api/v1/devices")
+
+    assert conditional.status_code == 304
+    assert conditional.data == b""
+    assert replayed.status_code == 200
+    assert replayed.get_json() == first.get_json()
+    # One generation lookup per request; no device queries.
+    assert len(statements) == 2
+    assert all("owner_generations" in s for s in statements)
+
+
+def test_writes_bump_the_owner_generation(app, agent_client, user_client):
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": "AA:BB:CC:00:05:02"}]})
+    device_id = user_client.get("/api/v1/devices").get_json()["data"][0]["id"]
+    stats_url = f"/api/v1/devices/{device_id}/stats"
+    etags = {url: user_client.get(url).headers["ETag"] for url in ("/api/v1/devices", stats_url, "/api/v1/alerts/history")}
+
+    resp = agent_client.post("/api/v1/agents/stats", json={
+        "stats": [{"mac_address": "AA:BB:CC:00:05:02", "bytes_uploaded": 10, "bytes_downloaded": 5}]
+    })
+    assert resp.status_code == 201
+
+    for url, etag in etags.items():
+        fresh = user_client.get(url, headers={"If-None-Match": etag})
+        assert fresh.status_code == 200, url
+        assert fresh.headers["ETag"] != etag
+    assert user_client.get(stats_url).get_json()["data"]
+
+    etag = user_client.get("/api/v1/devices").headers["ETag"]
+    user_client.put(f"/api/v1/devices/{device_id}/cap", json={"data_cap": 1000})
+    updated = user_client.get("/api/v1/devices", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.get_json()["data"][0]["data_cap"] == 1000
+
+
+def test_errors_are_not_cached(user_client):
+    assert user_client.get("/api/v1/devices/999/stats").status_code == 404
+    resp = user_client.get("/api/v1/devices/999/stats")
+    assert resp.status_code == 404
+    assert "ETag" not in resp.headers
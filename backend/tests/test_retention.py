@@ -0,0 +1,115 @@
+"""Tests for chunked retention pruning and chunked per-device deletes."""
+import math
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import (
+    DeviceStatMinute,
+    aggregate_device_usage,
+    rotate_partitions,
+    stats_source,
+)
+from backend.app.models.partitions import existing_partitions
+from backend.app.services.retention_service import prune_retention
+from backend.app.services.rollup_service import compact_rollups
+
+
+NOW = datetime(2024, 4, 15, 12, 0)
+
+
+def _samples(start, step):
+    """100 B up and 50 B down every ``step`` from ``start`` until ``NOW``."""
+    return [(start + i * step, 100, 50) for i in range(math.ceil((NOW - start) / step))]
+
+
+def _deletes(statements, table="device_stats"):
+    return [s for s in statements if s.startswith(f"DELETE FROM {table} ")]
+
+
+def _raw_count(before=None):
+    source = stats_source()
+    query = db.session.query(db.func.count()).select_from(source)
+    if before is not None:
+        query = query.filter(source.c.timestamp < before)
+    return query.scalar()
+
+
+def test_prune_downsamples_in_chunks(app, agent, seed_stats, capture_sql):
+    device_id = seed_stats(agent[0], _samples(NOW - timedelta(days=40), timedelta(minutes=20)))
+    app.config.update(
+        RETENTION_RAW_DAYS=7,
+        RETENTION_MINUTE_DAYS=20,
+        RETENTION_HOUR_DAYS=30,
+        RETENTION_DAY_DAYS=0,
+        RETENTION_CHUNK_ROWS=100,
+        RETENTION_CHUNK_PAUSE_SECONDS=0,
+    )
+    with app.app_context():
+        rotate_partitions(NOW)
+        db.session.commit()
+        compact_rollups(NOW)
+        total = aggregate_device_usage(device_id)["total_bytes"]
+        raw_before = _raw_count()
+
+        with capture_sql() as statements:
+            report = prune_retention(NOW)
+
+        raw = report["device_stats"]
+        assert raw["partitions"] == 1 and "device_stats_p202403" not in existing_partitions()
+        assert raw["rows"] == raw_before - _raw_count()
+        assert _raw_count(NOW - timedelta(days=7)) == 0
+        # The hot table's 540 rows from April 1 to the cutoff go 100 per committed statement.
+        assert len(_deletes(statements)) == 6
+        assert DeviceStatMinute.query.filter(DeviceStatMinute.bucket_start < NOW - timedelta(days=20)).count() == 0
+        assert report["device_stats_1m"]["rows"] > 0
+        assert report["total"]["rows"] == sum(r["rows"] for n, r in report.items() if n != "total")
+        assert report["total"]["bytes"] > 0
+        # Coarser levels still answer for what finer ones dropped.
+        assert aggregate_device_usage(device_id)["total_bytes"] == total
+
+
+def test_prune_waits_for_coarser_level(app, agent, seed_stats):
+    seed_stats(agent[0], _samples(NOW - timedelta(days=10), timedelta(hours=1)))
+    app.config.update(RETENTION_RAW_DAYS=1, RETENTION_MINUTE_DAYS=1)
+    with app.app_context():
+        raw_before = _raw_count()
+        report = prune_retention(NOW)
+
+        assert report == {"total": {"rows": 0, "bytes": 0}}
+        assert _raw_count() == raw_before
+
+
+def test_clear_device_stats_deletes_in_chunks(app, agent, user_client, seed_stats, capture_sql):
+    device_id = seed_stats(agent[0], _samples(NOW - timedelta(hours=50), timedelta(hours=1)))
+    app.config["RETENTION_CHUNK_ROWS"] = 10
+
+    with capture_sql() as statements:
+        resp = user_client.delete(f"/api/v1/devices/{device_id}/stats")
+
+    assert resp.status_code == 200
+    assert resp.get_json()["data"]["deleted"] == 50
+    assert len(_deletes(statements)) == 6
+    with app.app_context():
+        assert _raw_count() == 0
+
+
+def test_reads_past_raw_retention_say_so_or_use_rollups(app, agent, user_client, seed_stats):
+    device_id = seed_stats(agent[0], _samples(NOW - timedelta(days=10), timedelta(hours=1)))
+    app.config.update(RETENTION_RAW_DAYS=7, RETENTION_MINUTE_DAYS=90)
+    with app.app_context():
+        compact_rollups(NOW)
+        prune_retention(NOW)
+        assert _raw_count(NOW - timedelta(days=7)) == 0
+    cutoff = (NOW - timedelta(days=7)).isoformat()
+
+    resp = user_client.get("/api/v1/usage/export?format=ndjson")
+    assert resp.headers["X-Data-Truncated-Before"] == cutoff
+    assert len(resp.get_data().splitlines()) == 7 * 24
+    recent = (NOW - timedelta(days=1)).isoformat()
+    resp = user_client.get(f"/api/v1/usage/export?format=ndjson&start={recent}")
+    assert "X-Data-Truncated-Before" not in resp.headers
+
+    hours = int((datetime.utcnow() - NOW).total_seconds() // 3600) + 24 * 11
+    resp = user_client.get(f"/api/v1/devices/{device_id}/stats?hours={hours}")
+    points = resp.get_json()["data"]
+    assert len(points) == 10 * 24
+    assert sum(p["bytes_uploaded"] + p["bytes_downloaded"] for p in points) == 10 * 24 * 150
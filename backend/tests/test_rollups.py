@@ -0,0 +1,74 @@
+"""Tests for multi-resolution rollups and rollup-aware reads."""
+import random
+from datetime import datetime, timedelta
+from backend.app.models import (
+    DeviceStat,
+    DeviceStatDay,
+    DeviceStatHour,
+    DeviceStatMinute,
+    aggregate_device_usage,
+    device_usage_series,
+    plan_usage_segments,
+)
+from backend.app.services.rollup_service import compact_rollups
+
+
+def _seed(seed_stats, user_id, days=3):
+    """Random usage at irregular intervals over the last ``days``; returns the device id and now."""
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    ts, samples = now - timedelta(days=days), []
+    while ts < now:
+        samples.append((ts, rng.randint(0, 1000), rng.randint(0, 1000)))
+        ts += timedelta(seconds=rng.randint(20, 400))
+    return seed_stats(user_id, samples), now
+
+
+def _raw_total(device_id, start, end):
+    stats = DeviceStat.query.filter(
+        DeviceStat.device_id == device_id, DeviceStat.timestamp >= start, DeviceStat.timestamp <= end
+    ).all()
+    return sum(s.bytes_uploaded + s.bytes_downloaded for s in stats)
+
+
+def test_compaction_preserves_totals(app, agent, seed_stats):
+    device_id, now = _seed(seed_stats, agent[0])
+    with app.app_context():
+        start, end = now - timedelta(days=2, minutes=37, seconds=11), now - timedelta(hours=5, seconds=3)
+        expected = _raw_total(device_id, start, end)
+        raw_series = device_usage_series(device_id, now - timedelta(days=3), None, 3600)
+
+        written = compact_rollups(now)
+
+        assert written[60] == DeviceStatMinute.query.count() > 0
+        assert DeviceStatHour.query.count() > 0
+        assert DeviceStatDay.query.count() > 0
+        assert aggregate_device_usage(device_id, start, end)["total_bytes"] == expected
+        assert aggregate_device_usage(device_id)["total_bytes"] == _raw_total(device_id, now - timedelta(days=4), now)
+        assert device_usage_series(device_id, now - timedelta(days=3), None, 3600) == raw_series
+        assert compact_rollups(now) == {60: 0, 3600: 0, 86400: 0}
+
+
+def test_planner_picks_coarsest_level(app, agent, seed_stats):
+    _, now = _seed(seed_stats, agent[0], days=40)
+    with app.app_context():
+        compact_rollups(now)
+        segments = plan_usage_segments(now - timedelta(days=30), None, bucket_seconds=3600)
+
+    models = [model for model, _, _ in segments]
+    assert DeviceStatHour in models
+    assert DeviceStatDay not in models
+    hours = next(seg for seg in segments if seg[0] is DeviceStatHour)
+    assert hours[2] - hours[1] >= timedelta(days=29)
+
+
+def test_bucketed_stats_endpoint_reads_rollups(app, agent, user_client, seed_stats):
+    device_id, now = _seed(seed_stats, agent[0])
+    with app.app_context():
+        compact_rollups(now)
+        expected = _raw_total(device_id, now - timedelta(hours=24), now)
+
+    data = user_client.get(f"/api/v1/devices/{device_id}/stats?hours=24&bucket_minutes=60").get_json()["data"]
+
+    assert 24 <= len(data) <= 25
+    assert sum(b["bytes_uploaded"] + b["bytes_downloaded"] for b in data) == expected
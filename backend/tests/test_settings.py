@@ -0,0 +1,50 @@
+"""Tests for persisted runtime settings and their per-process cache."""
+from flask_jwt_extended import create_access_token
+from backend.app.models import Device
+from backend.app.services.settings_store import get_settings_store
+
+
+def test_update_is_persisted_and_used_for_new_devices(app, agent, agent_client, user_client, worker_app):
+    assert user_client.get("/api/v1/system/settings").get_json()["data"] == {"default_device_cap": None}
+
+    resp = user_client.put("/api/v1/system/settings", json={"default_device_cap": 5000})
+    assert resp.status_code == 200
+    assert resp.get_json()["data"]["default_device_cap"] == 5000
+    assert user_client.put("/api/v1/system/settings", json={"default_device_cap": -1}).status_code == 400
+
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": "AA:BB:CC:00:06:01"}]})
+    with app.app_context():
+        assert Device.query.filter_by(mac_address="AA:BB:CC:00:06:01").one().data_cap == 5000
+
+    restarted = worker_app()
+    with restarted.app_context():
+        assert get_settings_store(restarted).get("default_device_cap") == 5000
+
+
+def test_other_workers_refresh_from_the_version_counter(app, agent, user_client, worker_app):
+    other = worker_app(SETTINGS_REFRESH_SECONDS=3600)
+    with other.app_context():
+        store = get_settings_store(other)
+        assert store.get("default_device_cap") is None
+
+    user_client.put("/api/v1/system/settings", json={"default_device_cap": 750})
+
+    with other.app_context():
+        # Still within the refresh interval: served from memory.
+        assert store.get("default_device_cap") is None
+        store.refresh_seconds = 0
+        assert store.get("default_device_cap") == 750
+        token = create_access_token(identity=str(agent[0]))
+    resp = other.test_client().get("/api/v1/system/settings", headers={"Authorization": f"Bearer {token}"})
+    assert resp.get_json()["data"]["default_device_cap"] == 750
+
+
+def test_cached_reads_run_no_queries(app, capture_sql):
+    with app.app_context():
+        store = get_settings_store(app)
+        store.get("default_device_cap")
+        with capture_sql() as statements:
+            for _ in range(100):
+                store.get("default_device_cap")
+
+    assert statements == []
@@ -0,0 +1,97 @@
+"""Tests for the live event stream."""
+from flask_jwt_extended import create_access_token
+from backend.app.services.event_bus import Subscription
+
+
+MAC = "AA:BB:CC:00:06:01"
+
+
+def _next_events(chunks):
+    chunk = next(chunks)
+    chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+    while chunk == ": keepalive\n\n":
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+    events = []
+    for block in chunk.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], lines["data"]))
+    return events
+
+
+def _open_stream(app, user_client):
+    app.config["STREAM_HEARTBEAT_SECONDS"] = 0.05
+    app.config["STREAM_POLL_SECONDS"] = 0.01
+    user_client.post("/api/v1/alerts", json={"alert_type": "usage_threshold", "threshold_value": 50, "is_enabled": True})
+    token = user_client.post("/api/v1/stream/token").get_json()["data"]["token"]
+
+    # EventSource cannot send headers, so a stream-only token travels in the query string.
+    resp = app.test_client().get(f"/api/v1/stream?token={token}")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    chunks = iter(resp.response)
+    assert next(chunks) == b"retry: 5000\n\n"
+    return resp, chunks
+
+
+def test_stream_pushes_usage_and_alerts(app, sync_devices, post_stats, user_client):
+    sync_devices(MAC)
+    resp, chunks = _open_stream(app, user_client)
+
+    for uploaded in (60, 70):
+        post_stats((MAC, uploaded, 0))
+    events = _next_events(chunks)
+    resp.close()
+
+    kinds = [kind for kind, _ in events]
+    assert kinds.count("alert") == 2
+    # Both uploads were pending at once, so they arrive as one merged delta.
+    usage = [data for kind, data in events if kind == "usage"]
+    assert len(usage) == 1
+    assert '"bytes_uploaded":130' in usage[0] and '"samples":2' in usage[0]
+    assert app.extensions["event_bus"].stats()["subscriptions"] == 0
+
+
+def test_slow_subscriber_drops_oldest_alerts():
+    subscription = Subscription(owner_id=1, max_pending=2)
+    for i in range(5):
+        subscription.offer("alert", {"alert_id": i})
+
+    batch = subscription.next_batch(timeout=0)
+
+    assert batch[0] == ("overflow", {"dropped": 3})
+    assert [data["alert_id"] for _, data in batch[1:]] == [3, 4]
+    assert subscription.next_batch(timeout=0) == []
+
+
+def test_stream_sees_writes_committed_by_another_process(app, agent, sync_devices, user_client, worker_app):
+    sync_devices(MAC)
+    resp, chunks = _open_stream(app, user_client)
+
+    other_client = worker_app().test_client()
+    other_client.environ_base["HTTP_X_AGENT_API_KEY"] = agent[1]
+    other_client.post("/api/v1/agents/stats", json={"stats": [{"mac_address": MAC, "bytes_uploaded": 9}]})
+
+    events = _next_events(chunks)
+    resp.close()
+
+    assert [kind for kind, _ in events] == ["usage"]
+    assert '"bytes_uploaded":9' in events[0][1]
+
+
+def test_stream_requires_auth(app, agent, user_client):
+    assert app.test_client().get("/api/v1/stream").status_code == 401
+    assert app.test_client().post("/api/v1/stream/token").status_code == 401
+    with app.app_context():
+        access_token = create_access_token(identity=str(agent[0]))
+    # Access tokens are not accepted in URLs, where they would end up in access logs.
+    assert app.test_client().get(f"/api/v1/stream?jwt={access_token}").status_code == 401
+    assert app.test_client().get(f"/api/v1/stream?token={access_token}").status_code == 401
+
+    # Stream tokens only open the stream, and only briefly.
+    stream_token = user_client.post("/api/v1/stream/token").get_json()["data"]["token"]
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {stream_token}"
+    assert client.get("/api/v1/devices").status_code in (401, 422)
+    app.config["STREAM_TOKEN_TTL_SECONDS"] = -1
+    assert app.test_client().get(f"/api/v1/stream?token={stream_token}").status_code == 401
@@ -0,0 +1,117 @@
+"""Tests for incrementally maintained usage counters."""
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from backend.app.extensions import db
+from backend.app.models import Device, DeviceStat, DeviceUsageCounter
+from backend.app.services import counter_service
+from backend.app.services.counter_service import billing_period_start, reconcile_counters
+from backend.app.services.ingest_service import ingest_stats_batch
+
+
+MAC = "AA:BB:CC:DD:EE:01"
+
+
+def test_billing_period_start():
+    assert billing_period_start(date(2026, 3, 15), 1) == date(2026, 3, 1)
+    assert billing_period_start(date(2026, 3, 4), 10) == date(2026, 2, 10)
+    assert billing_period_start(date(2026, 1, 4), 10) == date(2025, 12, 10)
+    assert billing_period_start(date(2026, 1, 31), 31) == date(2026, 1, 28)
+
+
+def test_counters_track_ingest_and_seed_from_history(app, sync_devices, post_stats, user_client):
+    sync_devices(MAC)
+    with app.app_context():
+        device_id = Device.query.filter_by(mac_address=MAC).one().id
+        db.session.add(DeviceStat(
+            device_id=device_id,
+            timestamp=datetime.utcnow() - timedelta(days=400),
+            bytes_uploaded=1000,
+            bytes_downloaded=0,
+        ))
+        db.session.commit()
+
+    assert post_stats((MAC, 10, 20)).status_code == 201
+    assert post_stats((MAC, 1, 2)).status_code == 201
+
+    usage = user_client.get(f"/api/v1/usage/device/{device_id}").get_json()["data"]
+    assert usage["total_bytes"] == 1033
+    assert usage["today"]["total_bytes"] == 33
+    assert usage["billing_period"]["bytes_uploaded"] == 11
+
+
+def test_reconcile_rebuilds_from_raw_stats(app, sync_devices, post_stats):
+    sync_devices(MAC)
+    assert post_stats((MAC, 5, 5)).status_code == 201
+    with app.app_context():
+        counter = DeviceUsageCounter.query.one()
+        counter.bytes_uploaded = 999
+        db.session.commit()
+
+        assert reconcile_counters() == 1
+        counter = DeviceUsageCounter.query.one()
+        assert (counter.bytes_uploaded, counter.bytes_downloaded) == (5, 5)
+
+
+def test_reconcile_rewrites_counters_in_place(app, sync_devices, post_stats, capture_sql):
+    sync_devices(MAC, "AA:BB:CC:DD:EE:02")
+    assert post_stats((MAC, 5, 5)).status_code == 201
+    with app.app_context():
+        DeviceUsageCounter.query.filter(DeviceUsageCounter.bytes_uploaded == 0).delete()
+        db.session.commit()
+        assert DeviceUsageCounter.query.count() == 1
+
+        with capture_sql() as statements:
+            assert reconcile_counters() == 2
+
+        assert not any(s.lstrip().upper().startswith("DELETE") for s in statements)
+        counters = {c.device_id: c.bytes_uploaded for c in DeviceUsageCounter.query.all()}
+        assert sorted(counters.values()) == [0, 5]
+
+
+def test_batch_spanning_a_concurrent_seed_is_counted_once(app, agent, sync_devices, monkeypatch):
+    sync_devices(MAC)
+    with app.app_context():
+        device_id = Device.query.filter_by(mac_address=MAC).one().id
+        db.session.add(DeviceStat(device_id=device_id, timestamp=datetime.utcnow(), bytes_uploaded=1000))
+        db.session.commit()
+
+    seed_rows = counter_service._seed_rows
+
+    def seeded_concurrently(device_ids, now):
+        # Another writer ingests 3 bytes and seeds the counter after this
+        # batch found it missing, but before this batch inserts its seed.
+        rows = seed_rows(device_ids, now)
+        with db.engine.begin() as other:
+            other.execute(insert(DeviceStat), [{"device_id": device_id, "timestamp": now, "bytes_uploaded": 3}])
+            other.execute(insert(DeviceUsageCounter), [{**rows[0], "bytes_uploaded": 1003, "day_uploaded": 1003}])
+        return rows
+
+    monkeypatch.setattr(counter_service, "_seed_rows", seeded_concurrently)
+    with app.app_context():
+        ingest_stats_batch(agent[0], [
+            {"mac_address": MAC, "bytes_uploaded": 5, "bytes_downloaded": 0},
+            {"mac_address": MAC, "bytes_uploaded": 7, "bytes_downloaded": 0},
+        ])
+    monkeypatch.undo()
+
+    with app.app_context():
+        assert DeviceUsageCounter.query.one().bytes_uploaded == 1015
+        reconcile_counters()
+        assert DeviceUsageCounter.query.one().bytes_uploaded == 1015
+
+
+def test_day_window_rolls_over_on_ingest(app, sync_devices, post_stats):
+    sync_devices(MAC)
+    assert post_stats((MAC, 100, 0)).status_code == 201
+    with app.app_context():
+        counter = DeviceUsageCounter.query.one()
+        counter.day_start = counter.day_start - timedelta(days=1)
+        db.session.commit()
+
+    assert post_stats((MAC, 7, 0)).status_code == 201
+
+    with app.app_context():
+        counter = DeviceUsageCounter.query.one()
+        assert counter.day_start == datetime.utcnow().date()
+        assert counter.day_uploaded == 7
+        assert counter.bytes_uploaded == 107
@@ -0,0 +1,99 @@
+"""Tests for the streaming usage export endpoint."""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import rotate_partitions
+from backend.app.services import export_service
+
+
+START = datetime(2024, 3, 30)
+
+
+def _seed(app, seed_stats, user_id, per_device=300):
+    samples = [(START + timedelta(minutes=30 * i), i, 2 * i) for i in range(per_device)]
+    device_ids = [seed_stats(user_id, samples, mac_address=f"AA:BB:CC:00:01:0{i}") for i in range(2)]
+    with app.app_context():
+        # Spread the history across the hot table and a month partition.
+        rotate_partitions(datetime(2024, 4, 10))
+        db.session.commit()
+    return device_ids
+
+
+def test_ndjson_export_streams_gzipped_rows(app, agent, user_client, seed_stats, monkeypatch):
+    device_ids = _seed(app, seed_stats, agent[0])
+    monkeypatch.setattr(export_service, "EXPORT_CHUNK_BYTES", 1024)
+
+    resp = user_client.get(
+        "/api/v1/usage/export?format=ndjson",
+        headers={"Accept-Encoding": "gzip"},
+        buffered=False,
+    )
+
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in resp.headers
+    lines = gzip.decompress(resp.get_data()).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 600
+    assert [r["device_id"] for r in records] == sorted(r["device_id"] for r in records)
+    assert {r["device_id"] for r in records} == set(device_ids)
+    assert records[0]["timestamp"] == START.isoformat()
+
+
+def test_csv_export_for_one_device_and_range(app, agent, user_client, seed_stats):
+    device_ids = _seed(app, seed_stats, agent[0])
+    start, end = START + timedelta(days=1), START + timedelta(days=4)
+
+    resp = user_client.get(
+        f"/api/v1/usage/export?format=csv&device_id={device_ids[1]}"
+        f"&start={start.isoformat()}&end={end.isoformat()}"
+    )
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert len(rows) == 3 * 48
+    assert {row["device_id"] for row in rows} == {str(device_ids[1])}
+    assert rows[0]["timestamp"] == start.isoformat()
+    assert all(start.isoformat() <= row["timestamp"] < end.isoformat() for row in rows)
+
+
+def test_export_rejects_bad_requests(app, agent, user_client, seed_stats):
+    _seed(app, seed_stats, agent[0], per_device=1)
+    assert user_client.get("/api/v1/usage/export?format=xml").status_code == 400
+    assert user_client.get("/api/v1/usage/export?device_id=999").status_code == 404
+    assert user_client.get("/api/v1/usage/export?start=yesterday").status_code == 400
+
+
+def test_parquet_export(app, agent, user_client, seed_stats):
+    import pyarrow.parquet as pq
+
+    device_ids = _seed(app, seed_stats, agent[0])
+
+    resp = user_client.get("/api/v1/usage/export?format=parquet", buffered=False)
+
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    table = pq.read_table(io.BytesIO(resp.get_data()))
+    assert table.num_rows == 600
+    assert table.column_names == list(export_service.EXPORT_COLUMNS)
+    records = table.to_pylist()
+    assert {r["device_id"] for r in records} == set(device_ids)
+    first = records[0]
+    assert (first["timestamp"], first["bytes_uploaded"], first["bytes_downloaded"]) == (START, 0, 0)
+    assert sum(r["bytes_downloaded"] for r in records) == 2 * 2 * sum(range(300))
+
+
+def test_parquet_chunks_write_one_row_group_per_batch():
+    import pyarrow.parquet as pq
+
+    rows = [(1, "AA:BB:CC:00:01:00", START + timedelta(minutes=i), i, 2 * i) for i in range(600)]
+    body = b"".join(export_service.parquet_chunks(iter(rows), batch_size=250))
+
+    parquet = pq.ParquetFile(io.BytesIO(body))
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().column("bytes_uploaded").to_pylist() == list(range(600))
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""Tests for the fleet-wide usage summary endpoint."""
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import Device, DeviceStat
+
+
+def _setup(app, sync_devices, post_stats, count=6):
+    macs = sync_devices(*[f"AA:BB:CC:00:02:{i:02X}" for i in range(count)])
+    resp = post_stats(*[(mac, 100 * (i + 1), 10 * (i + 1)) for i, mac in enumerate(macs)])
+    assert resp.status_code == 201
+    with app.app_context():
+        devices = {d.mac_address: d for d in Device.query.all()}
+        devices[macs[0]].data_cap = 1000
+        devices[macs[1]].data_cap = 200
+        # History from before counters existed for an extra, counter-less device.
+        extra = Device(owner_id=devices[macs[0]].owner_id, mac_address="AA:BB:CC:00:02:FF")
+        db.session.add(extra)
+        db.session.flush()
+        db.session.add(DeviceStat(
+            device_id=extra.id,
+            timestamp=datetime.utcnow() - timedelta(days=90),
+            bytes_uploaded=5000,
+            bytes_downloaded=0,
+        ))
+        db.session.commit()
+        return {mac: devices[mac].id for mac in macs}, extra.id
+
+
+def test_summary_uses_one_query_and_sorts(app, sync_devices, post_stats, user_client, capture_sql):
+    ids, extra_id = _setup(app, sync_devices, post_stats)
+    with capture_sql() as statements:
+        resp = user_client.get("/api/v1/usage/summary?limit=3")
+
+    data = resp.get_json()["data"]
+    assert resp.status_code == 200
+    assert [d["device_id"] for d in data["devices"]] == [extra_id, ids["AA:BB:CC:00:02:05"], ids["AA:BB:CC:00:02:04"]]
+    assert data["totals"]["device_count"] == 7
+    assert data["totals"]["total_bytes"] == 5000 + sum(110 * (i + 1) for i in range(6))
+    # One joined counters query plus raw-stat fallbacks for the counter-less device only.
+    counter_queries = [s for s in statements if "device_usage_counters" in s]
+    assert len(counter_queries) == 1
+
+    today = user_client.get("/api/v1/usage/summary?window=today&sort=cap_percent").get_json()["data"]
+    by_id = {d["device_id"]: d for d in today["devices"]}
+    assert by_id[extra_id]["total_bytes"] == 0
+    assert [d["device_id"] for d in today["devices"][:2]] == [ids["AA:BB:CC:00:02:01"], ids["AA:BB:CC:00:02:00"]]
+    assert today["devices"][0]["cap_percent"] == 110.0
+    assert today["devices"][1]["cap_percent"] == 11.0
+    assert all(d["cap_percent"] is None for d in today["devices"][2:])
+
+
+def test_summary_over_time_range(app, sync_devices, post_stats, user_client):
+    ids, extra_id = _setup(app, sync_devices, post_stats)
+    start = (datetime.utcnow() - timedelta(days=100)).isoformat()
+    end = (datetime.utcnow() - timedelta(days=1)).isoformat()
+
+    data = user_client.get(f"/api/v1/usage/summary?start={start}&end={end}&order=asc").get_json()["data"]
+
+    assert data["window"]["name"] == "range"
+    assert data["totals"]["total_bytes"] == 5000
+    assert data["devices"][-1]["device_id"] == extra_id
+
+
+def test_summary_rejects_bad_parameters(user_client):
+    assert user_client.get("/api/v1/usage/summary?window=week").status_code == 400
+    assert user_client.get("/api/v1/usage/summary?sort=hostname").status_code == 400
+    assert user_client.get("/api/v1/usage/summary?limit=0").status_code == 400
+    assert user_client.get("/api/v1/usage/summary?limit=abc").status_code == 400
@@ -0,0 +1,82 @@
+"""Tests for the top-devices ranking endpoint."""
+from datetime import datetime, timedelta
+from backend.app.extensions import db
+from backend.app.models import User
+from backend.app.services.rollup_service import compact_rollups
+
+
+def _seed(app, seed_stats, user_id):
+    """Three of the user's devices and one of another owner's, with usage at several ages."""
+    now = datetime.utcnow()
+    with app.app_context():
+        other = User(email="other@example.com")
+        other.set_password("secret123")
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    # Per device: (age, uploaded, downloaded)
+    samples = [
+        [(timedelta(minutes=10), 100, 1000), (timedelta(days=3), 0, 90000)],
+        [(timedelta(minutes=20), 5000, 10), (timedelta(days=10), 10 ** 9, 10 ** 9)],
+        [(timedelta(hours=5), 50, 20000)],
+    ]
+    ids = [
+        seed_stats(
+            user_id,
+            [(now - age, up, down) for age, up, down in usage],
+            mac_address=f"AA:BB:CC:00:07:0{i}",
+            hostname=f"top-{i}",
+        )
+        for i, usage in enumerate(samples)
+    ]
+    other_usage = [(now - timedelta(minutes=5), 10 ** 6, 10 ** 6)]
+    ids.append(seed_stats(other_id, other_usage, mac_address="AA:BB:CC:00:07:09", hostname="elsewhere"))
+    with app.app_context():
+        compact_rollups(now)
+    return ids
+
+
+def test_top_devices_per_window_and_metric(app, agent, user_client, seed_stats):
+    ids = _seed(app, seed_stats, agent[0])
+
+    hour = user_client.get("/api/v1/usage/top?window=hour&metric=upload").get_json()["data"]
+    assert [d["device_id"] for d in hour["devices"]] == [ids[1], ids[0]]
+    assert hour["devices"][0]["bytes_uploaded"] == 5000
+    assert hour["scope"] == "owner"
+
+    day = user_client.get("/api/v1/usage/top?window=day&metric=download&limit=2").get_json()["data"]
+    assert [d["device_id"] for d in day["devices"]] == [ids[2], ids[0]]
+
+    week = user_client.get("/api/v1/usage/top?window=week").get_json()["data"]
+    assert [(d["device_id"], d["total_bytes"]) for d in week["devices"]] == [
+        (ids[0], 91100), (ids[2], 20050), (ids[1], 5010),
+    ]
+
+
+def test_top_devices_are_cached_briefly(app, agent, user_client, seed_stats):
+    _seed(app, seed_stats, agent[0])
+    first = user_client.get("/api/v1/usage/top?window=week")
+    assert int(first.headers["X-DB-Queries"]) > 0
+
+    again = user_client.get("/api/v1/usage/top?window=week")
+    assert again.headers["X-DB-Queries"] == "0"
+    assert again.get_json() == first.get_json()
+
+
+def test_all_owners_scope_requires_admin(app, agent, user_client, seed_stats):
+    ids = _seed(app, seed_stats, agent[0])
+    assert user_client.get("/api/v1/usage/top?scope=all").status_code == 403
+
+    app.config["ADMIN_EMAILS"] = frozenset({"owner@example.com"})
+    data = user_client.get("/api/v1/usage/top?scope=all&window=hour").get_json()["data"]
+    assert data["scope"] == "all"
+    assert data["devices"][0]["device_id"] == ids[3]
+    assert data["devices"][0]["hostname"] == "elsewhere"
+
+
+def test_top_devices_rejects_bad_parameters(user_client):
+    assert user_client.get("/api/v1/usage/top?window=month").status_code == 400
+    assert user_client.get("/api/v1/usage/top?metric=packets").status_code == 400
+    assert user_client.get("/api/v1/usage/top?limit=0").status_code == 400
+    assert user_client.get("/api/v1/usage/top?limit=abc").status_code == 400
+    assert user_client.get("/api/v1/usage/top?scope=everyone").status_code == 400
@@ -0,0 +1,110 @@
+"""Tests for the background voice notification dispatcher."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from backend.app.services.voice_dispatcher import VoiceDispatcher
+
+
+class _SpeakStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(server.delay)
+        with server.lock:
+            server.calls += 1
+            failing = server.calls <= server.failures
+            if not failing:
+                server.received.append(body)
+        self.send_response(500 if failing else 200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def speak_server():
+    server = HTTPServer(("127.0.0.1", 0), _SpeakStub)
+    server.delay = 0
+    server.failures = 0
+    server.calls = 0
+    server.received = []
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_submit_does_not_wait_for_slow_service(speak_server):
+    speak_server.delay = 0.5
+    dispatcher = VoiceDispatcher(_url(speak_server), workers=1)
+
+    started = time.perf_counter()
+    assert dispatcher.submit((1, "ddos_detected"), {"message": "a"})
+    assert time.perf_counter() - started < 0.1
+
+    assert _wait_for(lambda: dispatcher.stats()["sent"] == 1)
+    dispatcher.stop()
+
+
+def test_coalesces_and_drops_when_full(speak_server):
+    speak_server.delay = 0.3
+    dispatcher = VoiceDispatcher(_url(speak_server), workers=1, queue_size=1)
+    dispatcher.submit((1, "ddos_detected"), {"message": "busy"})
+    assert _wait_for(lambda: dispatcher.stats()["queue_depth"] == 0)
+
+    assert dispatcher.submit((2, "ddos_detected"), {"message": "first"})
+    assert dispatcher.submit((2, "ddos_detected"), {"message": "latest"})
+    assert not dispatcher.submit((3, "dos_detected"), {"message": "overflow"})
+
+    assert _wait_for(lambda: dispatcher.stats()["sent"] == 2)
+    stats = dispatcher.stats()
+    assert (stats["coalesced"], stats["dropped_full"]) == (1, 1)
+    assert [p["message"] for p in speak_server.received] == ["busy", "latest"]
+    dispatcher.stop()
+
+
+def test_retries_with_backoff_then_gives_up(speak_server):
+    speak_server.failures = 2
+    dispatcher = VoiceDispatcher(_url(speak_server), workers=1, max_retries=2, backoff_seconds=0.01)
+    dispatcher.submit("ok", {"message": "eventually"})
+    assert _wait_for(lambda: dispatcher.stats()["sent"] == 1)
+    assert dispatcher.stats()["retried"] == 2
+
+    speak_server.failures = 100
+    dispatcher.submit("lost", {"message": "never"})
+    assert _wait_for(lambda: dispatcher.stats()["dropped_failed"] == 1)
+    dispatcher.stop()
+
+
+def test_ingest_dispatches_after_commit(app, agent_client, speak_server):
+    app.config.update(VOICE_SERVICE_URL=_url(speak_server), VOICE_SERVICE_ALERT_TYPES="ddos_detected")
+    speak_server.delay = 0.5
+    agent_client.post("/api/v1/agents/devices", json={"devices": [{"mac_address": "AA:01", "hostname": "tv"}]})
+
+    started = time.perf_counter()
+    resp = agent_client.post("/api/v1/agents/alerts", json={
+        "alerts": [{"mac_address": "AA:01", "alert_type": "ddos", "total_bytes": 10}]
+    })
+
+    assert resp.status_code == 201
+    assert time.perf_counter() - started < 0.4
+    assert _wait_for(lambda: len(speak_server.received) == 1)
+    assert speak_server.received[0]["message"] == "DDoS detected on tv."
+    app.extensions["voice_dispatcher"].stop()
@@ -53,6 +53,7 @@ export default function AlertsScreen() {
   const [loadingMore, setLoadingMore] = useState(false);
   const [clearing, setClearing] = useState(false);
   const [hasMore, setHasMore] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [hours, setHours] = useState<number | undefined>(24);
 
   const loadHistory = async () => {
@@ -60,7 +61,8 @@ export default function AlertsScreen() {
       const resp = await alertsAPI.history({ hours, limit: pageSize, offset: 0 });
       const items = resp.data.data || [];
       setHistory(items);
-      setHasMore(items.length === pageSize);
+      setHasMore(Boolean(resp.data.meta?.next_cursor));
+      setNextCursor(resp.data.meta?.next_cursor ?? null);
     } catch (error) {
       console.error('Failed to load alert history:', error);
     } finally {
@@ -105,17 +107,18 @@ export default function AlertsScreen() {
   };
 
   const loadMore = async () => {
-    if (loadingMore || !hasMore) return;
+    if (loadingMore || !hasMore || !nextCursor) return;
     setLoadingMore(true);
     try {
       const resp = await alertsAPI.history({
         hours,
         limit: pageSize,
-        offset: history.length,
+        cursor: nextCursor,
       });
       const items = resp.data.data || [];
       setHistory((prev) => [...prev, ...items]);
-      setHasMore(items.length === pageSize);
+      setHasMore(Boolean(resp.data.meta?.next_cursor));
+      setNextCursor(resp.data.meta?.next_cursor ?? null);
     } catch (error) {
       console.error('Failed to load more alerts:', error);
     } finally {
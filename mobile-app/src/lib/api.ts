@@ -66,11 +66,12 @@ export const agentsAPI = {
 
 export const alertsAPI = {
   list: () => apiClient.get('/alerts'),
-  history: (params?: { hours?: number; limit?: number; offset?: number }) => {
+  history: (params?: { hours?: number; limit?: number; offset?: number; cursor?: string }) => {
     const query = new URLSearchParams();
     if (params?.hours != null) query.set('hours', String(params.hours));
     if (params?.limit != null) query.set('limit', String(params.limit));
     if (params?.offset != null) query.set('offset', String(params.offset));
+    if (params?.cursor) query.set('cursor', params.cursor);
     const suffix = query.toString();
     return apiClient.get(`/alerts/history${suffix ? `?${suffix}` : ''}`);
   },
@@ -27,7 +27,10 @@ class Agent:
         
         # Initialize components
         self.client = BackendClient(
-            base_url=self.config.api_base_url
+            base_url=self.config.api_base_url,
+            compression=self.config.upload_compression,
+            columnar=self.config.upload_columnar,
+            use_msgpack=self.config.upload_msgpack,
         )
         self.scanner = NetworkScanner(
             simulation_mode=self.config.simulation_mode,
@@ -49,6 +52,7 @@ class Agent:
         self.ddos_min_confidence = self.config.ddos_min_confidence
         self.ddos_alert_cooldown = self.config.ddos_alert_cooldown_seconds
         self._last_ddos_alert = {}
+        self._last_batch_id = 0
 
         # Audio alert system
         self.audio_alerts = AudioAlertSystem(
@@ -247,7 +251,13 @@ class Agent:
         # Send to backend with retry
         result = self._ingest_with_retry(stats)
         if result:
-            self.logger.info(f"✓ Ingested {result['data']['ingested_count']} stats")
+            data = result.get('data', {})
+            if data.get('duplicate'):
+                self.logger.info(f"✓ Batch {data.get('batch_id')} was already received")
+            elif 'ingested_count' in data:
+                self.logger.info(f"✓ Ingested {data['ingested_count']} stats")
+            else:
+                self.logger.info(f"✓ Queued {data.get('accepted_count', len(stats))} stats")
         else:
             self.logger.error("Failed to ingest stats after retries")
 
@@ -303,16 +313,34 @@ class Agent:
         else:
             self.logger.error("Failed to send DDoS alerts")
     
+    def _next_batch_id(self) -> int:
+        """Increasing batch id; wall-clock based so it keeps increasing across restarts."""
+        self._last_batch_id = max(self._last_batch_id + 1, time.time_ns() // 1_000_000)
+        return self._last_batch_id
+
     def _ingest_with_retry(self, stats):
-        """Ingest stats with retry logic."""
+        """Ingest stats with retry logic.
+
+        Every attempt resends the same batch id, so a batch the backend
+        committed before a timeout is not counted twice.
+        """
+        batch_id = self._next_batch_id()
         for attempt in range(1, self.config.retry_attempts + 1):
-            result = self.client.ingest_stats(stats)
+            result = self.client.ingest_stats(stats, batch_id=batch_id)
             if result:
                 return result
-            
+
+            if self.client.next_batch_id:
+                # Our ids fell behind the backend's (e.g. the clock stepped back); renumber.
+                self._last_batch_id = self.client.next_batch_id - 1
+                batch_id = self._next_batch_id()
+                continue
+
             if attempt < self.config.retry_attempts:
-                self.logger.warning(f"Ingestion failed, retrying in {self.config.retry_delay}s...")
-                time.sleep(self.config.retry_delay)
+                # Honour the backend's Retry-After when it is shedding load.
+                delay = max(self.config.retry_delay, self.client.retry_after or 0)
+                self.logger.warning(f"Ingestion failed, retrying in {delay}s...")
+                time.sleep(delay)
         
         return None
     
@@ -2,11 +2,37 @@
 import requests
 from typing import List, Dict, Any, Optional
 
+from .payloads import COMPRESSIONS, encode_payload, msgpack, zstandard
+
+
+# Statuses a backend without the compact upload formats answers them with.
+LEGACY_REJECTIONS = (400, 415, 500)
+
 
 class BackendClient:
-    def __init__(self, base_url: str, api_key: str = ""):
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = "",
+        compression: str = "none",
+        columnar: bool = False,
+        use_msgpack: bool = False,
+    ):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
+        self.retry_after: Optional[float] = None
+        self.next_batch_id: Optional[int] = None
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {COMPRESSIONS}")
+        if compression == "zstd" and zstandard is None:
+            print("zstandard is not installed, falling back to gzip uploads")
+            compression = "gzip"
+        if use_msgpack and msgpack is None:
+            print("msgpack is not installed, falling back to JSON uploads")
+            use_msgpack = False
+        self.compression = compression
+        self.columnar = columnar
+        self.use_msgpack = use_msgpack
         self.session = requests.Session()
         self.session.headers.update({
             "Content-Type": "application/json"
@@ -76,13 +102,32 @@ class BackendClient:
             print(f"Agent ping failed: {e}")
             return False
     
+    @property
+    def legacy_encoding(self) -> bool:
+        return self.compression == "none" and not self.columnar and not self.use_msgpack
+
+    def _post_records(
+        self, path: str, field: str, records: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None
+    ) -> requests.Response:
+        """POST records in the configured encoding.
+
+        If the backend rejects an encoded body, it predates compact uploads:
+        switch to plain JSON for the rest of this run and resend once.
+        Stats carry a ``batch_id``, so a resend is never counted twice.
+        """
+        body, headers = encode_payload(field, records, self.compression, self.columnar, self.use_msgpack, extra)
+        response = self.session.post(f"{self.base_url}{path}", data=body, headers=headers)
+        if response.status_code in LEGACY_REJECTIONS and not self.legacy_encoding:
+            print(f"Backend rejected encoded upload ({response.status_code}), falling back to plain JSON")
+            self.compression, self.columnar, self.use_msgpack = "none", False, False
+            body, headers = encode_payload(field, records, self.compression, self.columnar, self.use_msgpack, extra)
+            response = self.session.post(f"{self.base_url}{path}", data=body, headers=headers)
+        return response
+
     def sync_devices(self, devices: List[Dict[str, Any]]) -> Optional[Dict]:
         """Sync device list with backend."""
         try:
-            response = self.session.post(
-                f"{self.base_url}/agents/devices",
-                json={"devices": devices}
-            )
+            response = self._post_records("/agents/devices", "devices", devices)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -92,15 +137,33 @@ class BackendClient:
             print(f"Device sync error: {e}")
             return None
     
-    def ingest_stats(self, stats: List[Dict[str, Any]]) -> Optional[Dict]:
-        """Send usage stats to backend."""
+    def ingest_stats(self, stats: List[Dict[str, Any]], batch_id: Optional[int] = None) -> Optional[Dict]:
+        """Send usage stats to backend.
+
+        Returns the response body when written (201), queued (202) or already
+        received under the same ``batch_id`` (200), so resending a batch is
+        safe. On 429 the server's Retry-After is kept in ``retry_after``; on
+        409 (batch id behind the server's window) the id to continue from is
+        kept in ``next_batch_id``.
+        """
+        self.retry_after = None
+        self.next_batch_id = None
         try:
-            response = self.session.post(
-                f"{self.base_url}/agents/stats",
-                json={"stats": stats}
-            )
-            if response.status_code == 201:
+            extra = {"batch_id": batch_id} if batch_id is not None else None
+            response = self._post_records("/agents/stats", "stats", stats, extra)
+            if response.status_code in (200, 201, 202):
                 return response.json()
+            if response.status_code == 409:
+                self.next_batch_id = response.json().get("data", {}).get("next_batch_id")
+                print(f"Stats batch {batch_id} is stale, continuing from {self.next_batch_id}")
+                return None
+            if response.status_code == 429:
+                try:
+                    self.retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    self.retry_after = None
+                print(f"Stats ingestion throttled, retry after {self.retry_after}s")
+                return None
             else:
                 print(f"Stats ingestion failed: {response.status_code} - {response.text}")
                 return None
@@ -89,6 +89,18 @@ class Config:
     def retry_delay(self) -> int:
         return self.get("retry_delay", 5)
     
+    @property
+    def upload_compression(self) -> str:
+        return self.get("upload.compression", "none")
+
+    @property
+    def upload_columnar(self) -> bool:
+        return self.get("upload.columnar", False)
+
+    @property
+    def upload_msgpack(self) -> bool:
+        return self.get("upload.msgpack", False)
+    
     @property
     def hotspot_mode(self) -> bool:
         return self.get("hotspot_mode", False)
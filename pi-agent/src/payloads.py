@@ -0,0 +1,50 @@
+"""Encoding of device-sync and stats uploads."""
+import gzip
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack bodies
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd compression
+    zstandard = None
+
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+
+def to_columns(records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Turn a list of dicts into parallel arrays so each field name is sent once."""
+    names: Dict[str, None] = {}
+    for record in records:
+        names.update(dict.fromkeys(record))
+    return {name: [record.get(name) for record in records] for name in names}
+
+
+def encode_payload(
+    field: str,
+    records: List[Dict[str, Any]],
+    compression: str = "gzip",
+    columnar: bool = True,
+    use_msgpack: bool = False,
+    extra: Optional[Dict[str, Any]] = None,
+) -> Tuple[bytes, Dict[str, str]]:
+    """Encode ``{field: records, **extra}`` for an agent upload; returns body and headers."""
+    payload = {field: to_columns(records) if columnar else records, **(extra or {})}
+    if use_msgpack:
+        body = msgpack.packb(payload, use_bin_type=True)
+        headers = {"Content-Type": "application/msgpack"}
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+    if compression == "gzip":
+        body = gzip.compress(body, compresslevel=6, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    elif compression == "zstd":
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    return body, headers